@@ -0,0 +1,111 @@
+#!usr/bin/python
+
+# Compares the Bulk API batch formats. Without a token this only measures the
+# size of the batches and how fast they're encoded. With -token, -instanceurl,
+# -object and -query it also times the same bulk query with JSON and CSV results.
+# The query is read only, so it's safe to run against any org.
+
+import sys
+import time
+
+import pysalesforceutils
+
+
+def build_records(record_count, field_count):
+    records = []
+
+    for i in range(0, record_count):
+        record = {'attributes': {'type': 'Account'}, 'Name': 'Benchmark Account {}'.format(i)}
+
+        for field_number in range(0, field_count):
+            record['Benchmark_Field_{}__c'.format(field_number)] = 'value {} {}'.format(i, field_number)
+
+        record['Is_Active__c'] = i % 2 == 0
+        record['Description'] = None
+        records.append(record)
+
+    return records
+
+
+def time_encoding(records, batch_size, content_type):
+    start_time = time.perf_counter()
+    total_bytes = 0
+
+    for record_chunk in pysalesforceutils.Util.chunk(records, batch_size):
+        batch_body = pysalesforceutils.Util.get_bulk_batch_body(record_chunk, content_type)
+
+        if isinstance(batch_body, str):
+            batch_body = batch_body.encode('utf-8')
+
+        total_bytes += len(batch_body)
+
+    return time.perf_counter() - start_time, total_bytes
+
+
+def time_query(object_name, query, content_type, access_token, instance_url):
+    start_time = time.perf_counter()
+    rows = pysalesforceutils.Bulk.query_sobject_rows(object_name, query, False, access_token, instance_url, False,
+                                                     content_type)
+
+    return time.perf_counter() - start_time, len(rows)
+
+
+def main():
+    record_count = 50000
+    field_count = 10
+    batch_size = pysalesforceutils.BULK_BATCH_MAX_RECORDS
+    access_token = ''
+    instance_url = ''
+    object_name = ''
+    query = ''
+
+    i = 0
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+
+        if arg == '-records':
+            i += 1
+            record_count = int(sys.argv[i])
+        elif arg == '-fields':
+            i += 1
+            field_count = int(sys.argv[i])
+        elif arg == '-batchsize':
+            i += 1
+            batch_size = int(sys.argv[i])
+        elif arg == '-token':
+            i += 1
+            access_token = sys.argv[i]
+        elif arg == '-instanceurl':
+            i += 1
+            instance_url = sys.argv[i]
+        elif arg == '-object':
+            i += 1
+            object_name = sys.argv[i]
+        elif arg == '-query':
+            i += 1
+            query = sys.argv[i]
+
+        i += 1
+
+    records = build_records(record_count, field_count)
+    json_seconds, json_bytes = time_encoding(records, batch_size, 'JSON')
+
+    print("Encoding {} records with {} fields in batches of {}".format(record_count, field_count + 3, batch_size))
+    print("{:<10}{:>14}{:>12}{:>16}{:>12}".format('format', 'bytes', 'seconds', 'records/sec', 'vs JSON'))
+
+    for content_type in ['JSON', 'CSV', 'ZIP_JSON', 'ZIP_CSV']:
+        seconds, total_bytes = time_encoding(records, batch_size, content_type)
+        print("{:<10}{:>14}{:>12.3f}{:>16.0f}{:>11.0f}%".format(content_type, total_bytes, seconds,
+                                                                record_count / seconds,
+                                                                100.0 * total_bytes / json_bytes))
+
+    if access_token != '' and instance_url != '' and object_name != '' and query != '':
+        print("\nBulk query: {}".format(query))
+
+        for content_type in ['JSON', 'CSV']:
+            seconds, row_count = time_query(object_name, query, content_type, access_token, instance_url)
+            print("{:<10}{:>10} rows{:>12.3f} seconds".format(content_type, row_count, seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,27 @@
 This package creates methods to easily call the various Salseforce APIs.
 """
 
+import copy
+import csv
+import io
+import itertools
 import json
 import webservice
 import urllib
+import math
+import threading
 import time
 import sys
 import os
+import tempfile
+import queue
+import shutil
+import heapq
+import requests
+import zipfile
+import zlib
+from xml.etree import ElementTree
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from mimetypes import MimeTypes
 
 try:
@@ -25,6 +40,40 @@ METADATA_SERVICE_BINDING = '{http://soap.sforce.com/2006/04/metadata}MetadataBin
 PARTNER_WSDL_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'WSDL', 'partner.wsdl')
 PARTNER_SANDBOX_WSDL_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'WSDL', 'partner_sandbox.wsdl')
 
+COLLECTION_MAX_RECORDS = 200
+RETRIEVE_MAX_IDS = 2000
+COMPOSITE_BATCH_MAX_REQUESTS = 25
+GRAPH_MAX_NODES = 500
+GRAPH_MAX_DEPTH = 15
+GRAPH_REQUEST_MAX_GRAPHS = 75
+TREE_MAX_RECORDS = 200
+TREE_MAX_DEPTH = 5
+BULK_BATCH_MAX_RECORDS = 10000
+BULK_BATCH_MAX_BYTES = 10000000
+BULK_ZIP_MAX_FILES = 1000
+# the 150 MB upload limit applies after Salesforce base64 encodes the data, which grows it by a third, so the raw
+# CSV is capped at 3/4 of it
+BULK2_UPLOAD_MAX_BYTES = 100000000
+BULK2_UPLOAD_MAX_RECORDS = 100000000
+MAX_URL_LENGTH = 16000
+DEFAULT_MAX_WORKERS = 4
+BULK_CONTENT_TYPES = {'JSON': 'application/json', 'CSV': 'text/csv', 'ZIP_CSV': 'zip/csv', 'ZIP_JSON': 'zip/json'}
+SOBJECT_BLOB_FIELDS = {
+    "Attachment": {"BlobField": "Body",
+                   "FileNameField": "Name",
+                   "ParentField": "ParentId"
+                   },
+    "ContentVersion": {"BlobField": "VersionData",
+                       "FileNameField": "PathOnClient",
+                       "ParentField": "FirstPublishLocationId"
+                       },
+    "Document": {"BlobField": "Body",
+                 "FileNameField": "Name",
+                 "ParentField": "ParentId"
+                 },
+}
+TRANSIENT_ERROR_CODES = ['UNABLE_TO_LOCK_ROW', 'REQUEST_RUNNING_TOO_LONG', 'ALL_OR_NONE_OPERATION_ROLLED_BACK']
+
 
 class Util:
     """
@@ -75,7 +124,7 @@ class Util:
 
     @staticmethod
     def get_bulk_job_body(object_api_name, operation_type, assignment_rule_id=None, concurrency_mode=None,
-                          external_id_field_name=None, number_retries=None, job_state=None):
+                          external_id_field_name=None, number_retries=None, job_state=None, content_type='JSON'):
         """
         This method will be used to generate the bulk job body that is then used
         to send operation batches to Salesforce for processing.
@@ -135,11 +184,18 @@ class Util:
                                  numberRecordsFailed field contains the
                                  number of records that were not processed
                                  successfully.
+            content_type (str): The format of the batches: JSON, CSV, ZIP_CSV or
+                                ZIP_JSON. Defaults to JSON. CSV batches are
+                                usually much smaller because the field names
+                                are only sent once in the header.
 
         Returns:
             object: This returns the body formatted for a bulk job
         """
-        bulk_job_body = {'operation': operation_type, 'object': object_api_name, 'contentType': 'JSON'}
+        if content_type not in BULK_CONTENT_TYPES:
+            raise ValueError('content_type must be one of: {}'.format(', '.join(BULK_CONTENT_TYPES)))
+
+        bulk_job_body = {'operation': operation_type, 'object': object_api_name, 'contentType': content_type}
 
         if assignment_rule_id != None:
             bulk_job_body['assignmentRuleId'] = assignment_rule_id
@@ -176,944 +232,1948 @@ class Util:
             yield list[i:i + n]
 
     @staticmethod
-    def get_soap_client(wsdl_file):
+    def get_record_size(record):
         """
-        Pass the wsdl and generate the soap client for the given WSDL
+        This method returns the number of bytes a record adds to a JSON batch,
+        including the comma that separates it from the next record. It isn't a
+        bound on the size of a CSV row: every row has a column for each field of
+        the whole batch, so sparse records can be bigger as CSV than as JSON.
+        Use Util.pack_csv_by_size to pack CSV batches.
 
         Args:
-            wsdl_file (str): The file location for the WSDL used to generate
-                             the client
+            record (dict): The record to measure
 
         Returns:
-            Client: Returns the SOAP client.
+            int: Returns the size of the serialized record in bytes
         """
-        if Client is None:
-            raise ImportError(
-                "The 'zeep' library is required to use the Metadata or SOAP APIs. "
-                "Install it using `pip install zeep` or `pip install pysalesforce[metadata]`."
-            )
-
-        soap_client = Client(wsdl_file)
-        return soap_client
+        return len(json.dumps(record, separators=(',', ':')).encode('utf-8')) + 1
 
     @staticmethod
-    def get_soap_client_service(wsdl_file, service_binding, endpoint_url):
+    def pack_by_size(records, max_records=None, max_bytes=None, measure=None, batch_overhead=2):
         """
-        This method takes the given arguments and creates the soap client service.
+        This generator packs records into batches that are as full as they can
+        be without going over max_records or max_bytes, e.g. 10,000 records and
+        10 MB for a Bulk API batch or 100 MB of CSV for a Bulk API 2.0 upload.
+        The records stay in order, each record is only measured once, and only
+        the current batch is held, so records can be a generator.
 
         Args:
-            wsdl_file (str): The file location for the WSDL used to generate
-                             the client.
-            service_binding (str): The name of the service binding to create
-            endpoint_url (str): The endpoint url to call for the service binding
+            records (iterable): The records to pack
+            max_records (int): The maximum number of records in a batch. None
+                               doesn't limit the number of records.
+            max_bytes (int): The maximum size of a batch in bytes. None doesn't
+                             limit the size.
+            measure (function): Returns the number of bytes a record adds to a
+                                batch. Defaults to Util.get_record_size
+            batch_overhead (int): The number of bytes each batch adds to its
+                                  records, like the brackets of a JSON array
 
         Returns:
-            client_service: Returns the SOAP client service.
+            array: Yields each batch as a list of records. A ValueError is
+                   raised for a record that is bigger than max_bytes by itself.
         """
-        soap_client = Util.get_soap_client(wsdl_file)
-        soap_client_service = soap_client.create_service(service_binding, endpoint_url)
+        if measure is None:
+            measure = Util.get_record_size
 
-        return soap_client_service
+        batch = []
+        batch_bytes = batch_overhead
 
+        for record in records:
+            record_bytes = 0
 
-class Authentication:
-    """
-    The Authentication class is used to log in and out of Salesforce
-    """
+            if max_bytes != None:
+                record_bytes = measure(record)
+
+                if batch_overhead + record_bytes > max_bytes:
+                    raise ValueError('A record is {} bytes, which is more than the {} bytes allowed in a batch'.format(
+                        record_bytes, max_bytes))
+
+            if len(batch) > 0 and ((max_records != None and len(batch) >= max_records) or
+                                   (max_bytes != None and batch_bytes + record_bytes > max_bytes)):
+                yield batch
+                batch = []
+                batch_bytes = batch_overhead
+
+            batch.append(record)
+            batch_bytes += record_bytes
+
+        if len(batch) > 0:
+            yield batch
 
     @staticmethod
-    def get_oauth_login(login_username, login_password, login_client_id, login_client_secret, is_production):
+    def pack_csv_by_size(records, max_records=None, max_bytes=None):
         """
-        this function logs into Salesforce using the oAuth 2.0 password grant type,
-        and returns the response that can be used for other salesforce api requests.
-        There are two parts of the response that will be needed, the token, and
-        the instance url. The token can be retrieved with json_response['access_token'],
-        and the instance url with json_response['instance_url']. In order for this
-        function to work, a connected app must be set up in Salesforce, which is
-        where the client id and client secret come from the Client Id is the
-        connected app Consumer Key, and the client secret is the consumer secret.
+        This generator packs records into CSV batches like Util.pack_by_size,
+        but measures each batch as the CSV Util.get_csv_body writes for it.
+        The header has every field found in the batch and every row has a
+        column for each of them, so a record with a new field also grows the
+        rows that are already in the batch.
 
         Args:
-            login_username (str): this is the salesforce login
-            login_password (str): this is the salesforce password AND security
-                                  token
-            login_client_id (str): this is the client Id from the oAuth settings
-                                   in the Salesforce app setup
-            login_client_secret (str): this is the secret from the oAuth settings
-                                       in the Salesforce app setup
-            is_production (bool): this is a boolean value to set whether or not
-                                  the base oAuth connection will be in production
-                                  or a sandbox environment
+            records (iterable): The records to pack
+            max_records (int): The maximum number of records in a batch. None
+                               doesn't limit the number of records.
+            max_bytes (int): The maximum size of a batch's CSV in bytes. None
+                             doesn't limit the size.
+
         Returns:
-            object: returns the json from the login response body the important
-                    aspects of the response are the access_token, which will be
-                    used to authenticate the other calls, and instance_url,
-                    which is the base endpoint used for the other calls
+            array: Yields each batch as a list of records. A ValueError is
+                   raised for a record that is bigger than max_bytes by itself.
         """
-        if is_production:
-            base_oauth_url = 'https://login.salesforce.com/services/oauth2/token'
-        else:
-            base_oauth_url = 'https://test.salesforce.com/services/oauth2/token'
+        cell = io.StringIO()
+        # the same line ending as Util.iter_csv_rows, since it decides whether a value with line breaks is quoted
+        writer = csv.writer(cell, lineterminator='\n')
 
-        login_body_data = {'grant_type': 'password', 'client_id': login_client_id, 'client_secret': login_client_secret,
-                           'username': login_username, 'password': login_password}
+        def get_cell_size(value):
+            # the writer only quotes an empty value when it's the whole row
+            if value == '':
+                return 0
 
-        response = webservice.Tools.post_http_response(base_oauth_url, login_body_data, '')
+            cell.seek(0)
+            cell.truncate()
+            writer.writerow([value])
 
-        try:
-            json_response = json.loads(response.text)
-        except:
-            json_response = response.text
+            return len(cell.getvalue().encode('utf-8')) - 1
 
-        return json_response
+        batch = []
+        fields = set()
+        field_bytes = 0
+        value_bytes = 0
+        empty_row_count = 0
+
+        for record in records:
+            record_fields = {}
+            record_value_bytes = 0
+
+            if max_bytes != None:
+                for field_name, value in Util.flatten_record(record).items():
+                    if value is None:
+                        value = '#N/A'
+                    elif value is True or value is False:
+                        value = str(value).lower()
+
+                    record_fields[field_name] = get_cell_size(field_name)
+                    record_value_bytes += get_cell_size(value)
+
+                # each row and the header have a comma or line ending for every column
+                if sum(record_fields.values()) + record_value_bytes + 2 * len(record_fields) > max_bytes:
+                    raise ValueError('A record is more than the {} bytes allowed in a batch as CSV'.format(max_bytes))
+
+                new_fields = [field_name for field_name in record_fields if field_name not in fields]
+                batch_bytes = field_bytes + sum(record_fields[field_name] for field_name in new_fields) + \
+                    value_bytes + record_value_bytes + (len(batch) + 2) * (len(fields) + len(new_fields))
+
+                # an empty row of a single column is written as ""
+                if len(fields) + len(new_fields) == 1:
+                    batch_bytes += 2 * (empty_row_count + (record_value_bytes == 0))
+
+            if len(batch) > 0 and ((max_records != None and len(batch) >= max_records) or
+                                   (max_bytes != None and batch_bytes > max_bytes)):
+                yield batch
+                batch = []
+                fields = set()
+                field_bytes = 0
+                value_bytes = 0
+                empty_row_count = 0
+
+            batch.append(record)
+
+            if max_bytes != None:
+                for field_name, size in record_fields.items():
+                    if field_name not in fields:
+                        fields.add(field_name)
+                        field_bytes += size
+
+                value_bytes += record_value_bytes
+
+                if record_value_bytes == 0:
+                    empty_row_count += 1
+
+        if len(batch) > 0:
+            yield batch
 
     @staticmethod
-    def get_oauth_logout(auth_token, is_production):
+    def chunk_joined(list, n, max_length, separator=','):
         """
-        this function calls the correct endpoint for the oauth logout by providing
-        the token and whether or not the login is production or test.
+        This generator breaks up a list of strings into lists of at most n
+        items, starting a new list early whenever joining the items with the
+        separator would be longer than max_length. This is used for Id lists
+        that are sent in a URL.
 
         Args:
-            auth_token (str): this is the token received in the access_token
-                              response from the get_oauth_login function.
-            is_production (bool): this is a boolean value to set whether or not
-                                  the base oAuth connection will be in production
-                                  or a sandbox environment.
+            list (array): The list of strings to be chunked
+            n (int): The maximum number of items in each chunk
+            max_length (int): The maximum length of each joined chunk
+            separator (str): The separator the items will be joined with
+
         Returns:
-            object: returns a json response with success (True or False), and
-                    the status_code returned by the call to revoke the token
+            Array of Arrays: This returns a list of lists which is the original
+            list chunked into pieces that fit both limits
         """
-        if is_production:
-            logout_url = 'https://login.salesforce.com/services/oauth2/revoke'
-        else:
-            logout_url = 'https://test.salesforce.com/services/oauth2/revoke'
-
-        logout_body_data = {'host': logout_url, 'Content-Type': 'application/x-www-form-urlencoded',
-                            'token': auth_token}
+        this_chunk = []
+        this_length = 0
 
-        response = webservice.Tools.post_http_response(logout_url, logout_body_data, '')
+        for item in list:
+            item_length = len(item) + (len(separator) if this_chunk else 0)
 
-        success = False
-        if response.status_code == 200:
-            success = True
+            if this_chunk and (len(this_chunk) == n or this_length + item_length > max_length):
+                yield this_chunk
+                this_chunk = []
+                this_length = 0
+                item_length = len(item)
 
-        json_response = {'success': success, 'status_code': response.status_code}
+            this_chunk.append(item)
+            this_length += item_length
 
-        return json_response
+        if this_chunk:
+            yield this_chunk
 
     @staticmethod
-    def get_login_scope_header(org_id, portal_id):
+    def group_by_lock_key(records, lock_key_field):
         """
-        Only use this for authenticating as a self-service user
+        Groups the indexes of the records by the value of the lock key field,
+        which is usually the parent lookup, e.g. AccountId on Contacts.
+        Records without a value each get their own group.
 
         Args:
-            org_id (str): The ID of the organization against which you will
-                          authenticate Self-Service users.
-            portal_id (str): Specify only if user is a Customer Portal user. The
-                             ID of the portal for this organization.
+            records (array): The list of record dicts
+            lock_key_field (str): The field the records lock on
 
         Returns:
-            object: Returns the ScopeHeader for SOAP login requests.
+            Array of Arrays: The record indexes for each lock key in the order
+            the keys first appear
         """
-        login_scope_header = {}
-        login_scope_header['organizationId'] = org_id
+        groups = {}
 
-        if portal_id != None:
-            login_scope_header['portalId'] = portal_id
+        for index, record in enumerate(records):
+            lock_key = record.get(lock_key_field)
 
-        return login_scope_header
+            if lock_key is None:
+                lock_key = ('record', index)
+
+            groups.setdefault(lock_key, []).append(index)
+
+        return list(groups.values())
 
     @staticmethod
-    def get_login_call_options(client_name, default_ns):
+    def get_lock_key_batches(records, lock_key_field, n):
         """
-        This creates the call options for the SOAP login.
+        Packs the records into batches of at most n records so that all the
+        records for a lock key are in the same batch, and no two batches lock
+        the same parent. A lock key with more than n records is split into
+        several batches, which are put in later rounds so they are as far
+        apart in the batch order as possible.
 
         Args:
-            client_name (str): A string that identifies a client.
-            default_ns (str): A string that identifies a developer namespace
-                              prefix. Use this field to resolve field names in
-                              managed packages without having to fully specify
-                              the fieldName everywhere.
+            records (array): The list of record dicts
+            lock_key_field (str): The field the records lock on
+            n (int): The maximum number of records in each batch
 
         Returns:
-            object: Returns the CallOptions for SOAP login requests.
-
+            Array of Arrays: The record indexes for each batch, in the order
+            the batches should be sent
         """
-        call_options = {}
+        rounds = []
 
-        if client_name != None:
-            call_options['client'] = client_name
+        for group in Util.group_by_lock_key(records, lock_key_field):
+            for round_number, part in enumerate(Util.chunk(group, n)):
+                if round_number == len(rounds):
+                    rounds.append([])
 
-        if default_ns != None:
-            call_options['defaultNamespace'] = default_ns
+                rounds[round_number].append(part)
 
-        return call_options
+        batches = []
+
+        for parts in rounds:
+            # first fit decreasing within each round
+            round_batches = []
+
+            for part in sorted(parts, key=lambda part: -len(part)):
+                for batch in round_batches:
+                    if len(batch) + len(part) <= n:
+                        batch.extend(part)
+                        break
+                else:
+                    round_batches.append(list(part))
+
+            batches.extend(round_batches)
+
+        return batches
 
     @staticmethod
-    def get_soap_headers(org_id, portal_id, client_name, default_ns):
+    def get_lock_key_lanes(records, lock_key_field, lane_count):
         """
-        This method builds the headers for soap calls. Leave org_id and
-        portal_id as None if you are using a normal authentication. These
-        values are only used for self-service authentication
+        Splits the records into lane_count lanes so that all the records for a
+        lock key are in the same lane. Lanes can run at the same time without
+        locking the same parent as long as each lane runs its records in
+        order. The largest groups are assigned first, each to the lane with
+        the fewest records.
 
         Args:
-        org_id (str): The ID of the organization against which you will
-                      authenticate Self-Service users.
-        portal_id (str): Specify only if user is a Customer Portal user. The ID
-                        of the portal for this organization.
-        client_name (str): A string that identifies a client.
-        default_ns (str): A string that identifies a developer namespace prefix.
-                          Use this field to resolve field names in managed
-                          packages without having to fully specify the fieldName
-                          everywhere.
+            records (array): The list of record dicts
+            lock_key_field (str): The field the records lock on
+            lane_count (int): The number of lanes
+
         Returns:
-            object: Returns the SOAP headers needed to log in
+            Array of Arrays: The record indexes for each lane. Empty lanes are
+            left out.
         """
-        client = Util.get_soap_client(PARTNER_WSDL_FILE)
-        soap_headers = {}
-
-        if org_id != None or portal_id != None:
-            login_scope = Authentication.get_login_scope_header(org_id, portal_id)
-            soap_headers['LoginScopeHeader'] = login_scope
+        lanes = [[] for lane in range(max(1, lane_count))]
 
-        if client_name != None or default_ns != None:
-            call_options = Authentication.get_login_call_options(client_name, default_ns)
-            soap_headers['CallOptions'] = call_options
+        for group in sorted(Util.group_by_lock_key(records, lock_key_field), key=lambda group: -len(group)):
+            min(lanes, key=len).extend(group)
 
-        return soap_headers
+        return [lane for lane in lanes if lane]
 
     @staticmethod
-    def get_soap_login(login_username, login_password, org_id, portal_id, client_name, default_ns, is_production):
+    def get_error_codes(result):
         """
-        This method logs into Salesforce with SOAP given the provided details.
-        Only use org_id and portal_id for self-service user authentication. For
-        most purposes, these should be set to None. The client_name is actually a
-        clientId used for partner applications and the default_ns is the default
-        namespace used for an application. So these values can also be set to
-        None for most requests. For most requests, you will only need the
-        username and password.
+        Gets the set of error status codes from a per-record result returned by
+        the sObject Collections or Bulk API.
 
         Args:
-            login_username (str): this is the salesforce login
-            login_password (str): this is the salesforce password AND security
-                                  token
-            org_id (str): The ID of the organization against which you will
-                          authenticate Self-Service users.
-            portal_id (str): Specify only if user is a Customer Portal user. The
-                             ID of the portal for this organization.
-            client_name (str): A string that identifies a client. Used for
-                               partner applications.
-            default_ns (str): A string that identifies a developer namespace
-                              prefix. Use this field to resolve field names in
-                              managed packages without having to fully specify
-                              the fieldName everywhere.
-            is_production (bool): this is a boolean value to set whether or not
-                                  the base oAuth connection will be in
-                                  production or a sandbox environment.
+            result (dict): The result for one record
+
         Returns:
-            object: returns a long response object that contains the session id
-                    login_result['sessionId'], metadata server url
-                    login_result['metadataServerUrl'] and server url
-                    login_result['serverUrl']
+            set: The statusCode of each error
         """
-        wsdl_file = PARTNER_WSDL_FILE
+        return set(error.get('statusCode') for error in (result or {}).get('errors') or [])
 
-        if not (is_production):
-            wsdl_file = PARTNER_SANDBOX_WSDL_FILE
+    @staticmethod
+    def is_transient_failure(result, transient_error_codes=TRANSIENT_ERROR_CODES):
+        """
+        Checks whether a failed per-record result is safe to resend. A failure
+        is transient when every one of its errors is a transient error code,
+        e.g. a lock timeout or a record that was only rolled back because
+        another record in an all or none request failed.
 
-        client = Util.get_soap_client(wsdl_file)
-        soap_headers = Authentication.get_soap_headers(org_id, portal_id, client_name, default_ns)
-        login_result = client.service.login(login_username, login_password, _soapheaders=soap_headers)
+        Args:
+            result (dict): The result for one record
+            transient_error_codes (array): The error status codes that are
+                                           treated as transient
 
-        return login_result
+        Returns:
+            bool: True if the record failed and can be resent
+        """
+        if result is None or result.get('success'):
+            return False
 
+        error_codes = Util.get_error_codes(result)
 
-class Tooling:
-    """
-    The purpose of this class is to expose the Salesforce Tooling API methods
-    """
-    base_tooling_uri = '/services/data/v' + API_VERSION + '/tooling'
+        return bool(error_codes) and error_codes <= set(transient_error_codes)
 
     @staticmethod
-    def completions(completions_type, access_token, instance_url):
+    def resubmit_failures(records, results, send_records, batch_size, max_retries=3, retry_wait=1,
+                          min_batch_size=1, transient_error_codes=TRANSIENT_ERROR_CODES):
         """
-        Retrieves available code completions of the referenced type for Apex
-        system method symbols (type=apex).
+        Resends only the records with transient failures (see
+        Util.is_transient_failure) and merges the new results back into the
+        original order. Permanent failures are left as they are. Each retry
+        waits twice as long as the one before and uses half the batch size of
+        the one before, down to min_batch_size, so contended records end up in
+        smaller batches.
 
         Args:
-        completions_type (str): The type of metadata to get completions for.
-                                e.g. 'apex'
-        access_token (str): This is the access_token value received from the
-                            login response
-        instance_url (str): This is the instance_url value received from the
-                            login response
+            records (array): The records that were sent
+            results (array): The results for the records in the same order
+            send_records (function): Called as send_records(records, batch_size)
+                                     with the records to resend and returns
+                                     their results in the same order
+            batch_size (int): The batch size the records were first sent with
+            max_retries (int): The maximum number of times to resend a record
+            retry_wait (float): The number of seconds to wait before the first
+                                retry
+            min_batch_size (int): The smallest batch size to retry with
+            transient_error_codes (array): The error status codes that are
+                                           treated as transient
 
         Returns:
-            object: Returns the completion values for the specified type
+            array: The final result for each record in the same order
         """
-        completions_uri = '/completions?type='
-        header_details = Util.get_standard_header(access_token)
-        url_encoded_type = urllib.parse.quote(completions_type)
+        results = list(results)
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Tooling.base_tooling_uri + completions_uri + url_encoded_type, header_details)
-        json_response = json.loads(response.text)
+        for attempt in range(max_retries):
+            retry_indexes = [index for index, result in enumerate(results)
+                             if Util.is_transient_failure(result, transient_error_codes)]
 
-        return json_response
+            if not retry_indexes:
+                break
+
+            time.sleep(retry_wait * 2 ** attempt)
+            batch_size = max(min_batch_size, batch_size // 2)
+
+            retry_results = send_records([records[index] for index in retry_indexes], batch_size)
+
+            for index, result in zip(retry_indexes, retry_results):
+                results[index] = result
+
+        return results
 
     @staticmethod
-    def execute_anonymous(code_string, access_token, instance_url):
+    def map_concurrent(function, items, max_workers=DEFAULT_MAX_WORKERS):
         """
-        This function executes anonymous apex, and returns a json response
-        object. The response should contain a success value (True or False),
-        column and line numbers, which return -1 if there are no issues,
-        exceptionStackTrace which should be None if there are no problems,
-        compiled (True or False), compileProblem which should be None if there
-        are no problems, and exceptionMessage if an exception was thrown.
+        Calls the function for each of the items on a pool of at most
+        max_workers threads and returns the results in the same order as the
+        items. If any call raises an exception, it is raised here.
 
         Args:
-            code_string (str): this is the non url encoded code string that you
-                               would like to execute
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            function (function): The function to call with each item
+            items (array): The items to pass to the function
+            max_workers (int): The maximum number of concurrent calls
 
         Returns:
-            object: returns the response result from executing the SFDC script
+            array: The return value of each function call in the order of the
+                   items.
         """
-        execute_anonymous_uri = '/executeAnonymous/?anonymousBody='
-        header_details = Util.get_standard_header(access_token)
-        url_encoded_code = urllib.parse.quote(code_string)
+        items = list(items)
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Tooling.base_tooling_uri + execute_anonymous_uri + url_encoded_code, header_details)
-        json_response = json.loads(response.text)
+        if max_workers is None or max_workers <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
 
-        return json_response
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+            return list(executor.map(function, items))
 
     @staticmethod
-    def query(query_string, access_token, instance_url):
+    def iter_concurrent(function, items, max_workers=DEFAULT_MAX_WORKERS):
         """
-        Executes a query against an object and returns data that matches the
-        specified criteria. Tooling API exposes objects like EntityDefinition and
-        FieldDefinition that use the external object framework--that is, they don’t
-        exist in the database but are constructed dynamically. Special query rules
-        apply to virtual entities. If the query result is too large, it’s broken up
-        into batches. The response contains the first batch of results and a query
-        identifier. The identifier can be used in a request to retrieve the next
-        batch. A list of the tooling api objects can be found here:
-        https://developer.salesforce.com/docs/atlas.en-us.api_tooling.meta/api_tooling/reference_objects_list.htm
+        This generator calls the function for each of the items on a pool of
+        at most max_workers threads and yields each item with its result as
+        soon as that call completes, so the results are not in the order of
+        the items. The items are read on their own thread, so items can be a
+        slow generator, like one that polls for batches to finish, without
+        holding back the results that are ready. Only max_workers items are
+        read ahead of the results that have been yielded. If reading the items
+        or any call raises an exception, it is raised here.
 
         Args:
-            query_string (str): the query to be executed
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            function (function): The function to call with each item
+            items (iterable): The items to pass to the function
+            max_workers (int): The maximum number of concurrent calls
 
         Returns:
-            object: returns a JSON object with the results of the query.
+            tuple: Yields (item, result) for each item as its call completes
+        """
+        max_workers = max(1, max_workers or 1)
+        events = queue.Queue()
+        slots = threading.Semaphore(max_workers)
+        stopped = threading.Event()
+
+        # the reader takes a slot before each item and a slot is given back as each result is yielded, so the
+        # reader never gets more than max_workers items ahead
+        def read_items():
+            try:
+                for item in items:
+                    events.put(('item', item))
+                    slots.acquire()
+
+                    if stopped.is_set():
+                        return
+            except Exception as e:
+                events.put(('error', e))
+            finally:
+                events.put(('end', None))
+
+        slots.acquire()
+        reader = threading.Thread(target=read_items, daemon=True)
+        running_count = 0
+        is_read = False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            reader.start()
+
+            try:
+                while not is_read or running_count > 0:
+                    event_type, value = events.get()
+
+                    if event_type == 'item':
+                        future = executor.submit(function, value)
+                        future.add_done_callback(lambda future, item=value: events.put(('done', (item, future))))
+                        running_count += 1
+                    elif event_type == 'done':
+                        item, future = value
+                        running_count -= 1
+                        slots.release()
+                        yield item, future.result()
+                    elif event_type == 'error':
+                        raise value
+                    else:
+                        is_read = True
+            finally:
+                stopped.set()
+                slots.release()
+
+    @staticmethod
+    def flatten_record(record):
         """
-        query_uri = '/query/?q='
-        header_details = Util.get_standard_header(access_token)
-        url_encoded_query = urllib.parse.quote(query_string)
+        This method flattens the nested dicts of a record into relationship
+        columns, so {'Account': {'External_Id__c': 'A1'}} becomes
+        {'Account.External_Id__c': 'A1'}. The attributes key is skipped.
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Tooling.base_tooling_uri + query_uri + url_encoded_query, header_details)
-        json_response = json.loads(response.text)
+        Args:
+            record (dict): The record to flatten
 
-        return json_response
+        Returns:
+            dict: Returns the record with a single level of keys
+        """
+        flat_record = {}
+
+        for field_name, value in record.items():
+            if field_name == 'attributes':
+                continue
+
+            if isinstance(value, dict):
+                for child_field_name, child_value in Util.flatten_record(value).items():
+                    flat_record[field_name + '.' + child_field_name] = child_value
+            else:
+                flat_record[field_name] = value
+
+        return flat_record
 
     @staticmethod
-    def run_tests_asynchronous_list(class_ids, suite_ids, max_failed_tests, test_level, access_token, instance_url):
+    def iter_csv_rows(records, fields=None):
         """
-        This method runs the tests provided with the class Ids or suite Ids, then
-        returns the direct results from the Salesforce tooling API.
+        This method streams a list of record dicts as the CSV used by the bulk
+        APIs, one row at a time, so a large load never has to be held as a
+        single string. Nested dicts are written to relationship columns with
+        Util.flatten_record, None values are written as #N/A so the field is set
+        to null, and booleans are written as true/false. Every row has the same
+        columns as the header, and a record missing one of them gets an empty
+        value, which leaves the field unchanged.
 
         Args:
-            class_ids (array): List of comma separated class Ids to run the tests
-            suite_ids (array): List of suite ids to run
-            max_failed_tests (int): To stop the test run from executing new tests
-                                    after a given number of tests fail, set to
-                                    an integer value from 0 to 1,000,000. To
-                                    allow all tests in your run to execute,
-                                    regardless of how many tests fail, omit
-                                    max_failed_tests or set it to -1
-            test_level (str): The testLevel parameter is optional. If you don’t
-                              provide a testLevel value, we use RunSpecifiedTests.
-                              values:
-                              RunSpecifiedTests - Only the tests that you
-                                                  specify are run.
-                              RunLocalTests - All tests in your org are run,
-                                              except the ones that originate
-                                              from installed managed packages.
-                                              Omit identifiers for specific tests
-                                              when you use this value.
-                              RunAllTestsInOrg - All tests are run. The tests
-                                                 include all tests in your org,
-                                                 including tests of managed
-                                                 packages. Omit identifiers for
-                                                 specific tests when you use
-                                                 this value.
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            records (iterable): The record dicts to convert
+            fields (array): The column names for the CSV. If None, the records
+                            are read into a list to find every key, in the
+                            order they first appear. Pass the fields to encode a
+                            generator without holding all the records.
 
         Returns:
-            object: returns the Id of the test run
+            generator: Yields the header row, then one CSV row for each record
         """
-        test_async_uri = '/runTestsAsynchronous/'
-        header_details = Util.get_standard_header(access_token)
+        is_flattened = False
 
-        data_body = {}
+        if fields is None:
+            records = [Util.flatten_record(record) for record in records]
+            is_flattened = True
+            fields = []
+            found_fields = set()
 
-        if class_ids != None:
-            data_body['classids'] = class_ids
+            for record in records:
+                for field_name in record:
+                    if field_name not in found_fields:
+                        found_fields.add(field_name)
+                        fields.append(field_name)
 
-        if suite_ids != None:
-            data_body['suiteids'] = suite_ids
+        csv_row = io.StringIO()
+        writer = csv.writer(csv_row, lineterminator='\n')
 
-        if max_failed_tests != None:
-            data_body['maxFailedTests'] = max_failed_tests
+        def take_row():
+            row_text = csv_row.getvalue()
+            csv_row.seek(0)
+            csv_row.truncate()
+            return row_text
 
-        if test_level != None:
-            data_body['testLevel'] = test_level
+        writer.writerow(fields)
+        yield take_row()
 
-        json_data_body = json.dumps(data_body, indent=4, separators=(',', ': '))
+        for record in records:
+            if not is_flattened:
+                record = Util.flatten_record(record)
 
-        response = webservice.Tools.post_http_response(instance_url + Tooling.base_tooling_uri + test_async_uri,
-                                                       json_data_body, header_details)
-        json_response = json.loads(response.text)
+            row = []
 
-        return json_response
+            for field_name in fields:
+                value = record.get(field_name, '')
+
+                if value is None:
+                    value = '#N/A'
+                elif value is True or value is False:
+                    value = str(value).lower()
+
+                row.append(value)
+
+            writer.writerow(row)
+            yield take_row()
 
     @staticmethod
-    def run_tests_asynchronous_json(test_array, access_token, instance_url):
+    def get_csv_body(records, fields=None):
         """
-        This method runs specified tests in the test_array with more control than
-        the run_tests_asynchronous_list method by allowing you to specify which methods
-        you'd like to run with each test class.
+        This method converts a list of record dicts into the CSV body used by
+        the bulk APIs. See Util.iter_csv_rows for how the values are written.
 
         Args:
-        test_array (array): This is an array of tests that you'd like to run with
-                            the specified methods if you wish. Like the
-                            run_tests_asynchronous_list method, you can also specify
-                            the maxFailedTests and testLevel values
-                            e.g.
-                                [
-                                {"classId": "01pD0000000Fhy9IAC",
-                                    "testMethods": ["testMethod1","testMethod2", "testMethod3"]},
-                                {"classId": "01pD0000000FhyEIAS",
-                                    "testMethods": ["testMethod1","testMethod2", "testMethod3"]},
-                                {"maxFailedTests": "2"},
-                                {"testLevel": "RunSpecifiedTests"}
-                                ]
-        access_token (str): This is the access_token value received from the
-                            login response
-        instance_url (str): This is the instance_url value received from the
-                            login response
+            records (array): The list of record dicts to convert
+            fields (array): The column names for the CSV. If None, this will be
+                            every key found in the records, in the order they
+                            first appear.
 
         Returns:
-            object: returns the Id of the test run
+            str: Returns the CSV text including the header row
         """
-        test_async_uri = '/runTestsAsynchronous/'
-        header_details = Util.get_standard_header(access_token)
-        data_body = {'tests': test_array}
-        json_data_body = json.dumps(data_body, indent=4, separators=(',', ': '))
+        return ''.join(Util.iter_csv_rows(records, fields))
 
-        response = webservice.Tools.post_http_response(instance_url + Tooling.base_tooling_uri + test_async_uri,
-                                                       json_data_body, header_details)
-        json_response = json.loads(response.text)
+    @staticmethod
+    def get_bulk_batch_body(records, content_type='JSON'):
+        """
+        This method serializes a batch of records for a Bulk API job. The zip
+        content types put the batch in the request.txt (ZIP_CSV) or
+        request.json (ZIP_JSON) file of the zip.
 
-        return json_response
+        Args:
+            records (array): The records in the batch
+            content_type (str): The contentType of the job: JSON, CSV, ZIP_CSV
+                                or ZIP_JSON
 
+        Returns:
+            str: Returns the batch body. This is bytes for the zip content types
+        """
+        if content_type in ('CSV', 'ZIP_CSV'):
+            batch_body = Util.get_csv_body(records)
+        elif content_type in ('JSON', 'ZIP_JSON'):
+            # compact, so the batch is the size Util.get_record_size measured
+            batch_body = json.dumps(records, separators=(',', ':'))
+        else:
+            raise ValueError('content_type must be one of: {}'.format(', '.join(BULK_CONTENT_TYPES)))
 
-class Standard:
-    """
-    This class provides a front end for the Salesforce standard REST API. More
-    details about this can be found here:
-    https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/intro_what_is_rest_api.htm
-    You can get more details about each of the methods by looking in the reference
-    section of the documentation.
-    """
-    base_standard_uri = '/services/data/'
+        if content_type.startswith('ZIP_'):
+            zip_body = io.BytesIO()
+
+            with zipfile.ZipFile(zip_body, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                zip_file.writestr('request.txt' if content_type == 'ZIP_CSV' else 'request.json', batch_body)
+
+            batch_body = zip_body.getvalue()
+
+        return batch_body
 
     @staticmethod
-    def versions(access_token, instance_url):
+    def get_bulk_zip_body(attachments, content_type='ZIP_JSON', blob_field='Body'):
         """
-        Lists summary information about each Salesforce version currently available,
-        including the version, label, and a link to each version's root.
+        This method builds a zip batch with binary attachments for a Bulk API
+        job. Each file is streamed from disk into the zip, and the blob field
+        of its record is set to the #name of the file in the zip, which is how
+        the request.json (ZIP_JSON) or request.txt (ZIP_CSV) of the batch
+        refers to it.
 
         Args:
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            attachments (array): The (record, file_path) tuples in the batch
+            content_type (str): The contentType of the job: ZIP_CSV or ZIP_JSON
+            blob_field (str): The field of the records that holds the file, like
+                              Body for Attachment or VersionData for
+                              ContentVersion
 
         Returns:
-            object: Returns an object with the list of Salesforce versions
+            bytes: Returns the zip
         """
-        header_details = Util.get_standard_header(access_token)
+        if content_type not in ('ZIP_CSV', 'ZIP_JSON'):
+            raise ValueError('content_type must be ZIP_CSV or ZIP_JSON')
 
-        response = webservice.Tools.get_http_response(instance_url + Standard.base_standard_uri, header_details)
-        json_response = json.loads(response.text)
+        batch_records = []
+        file_names = []
 
-        return json_response
+        for i, (record, file_path) in enumerate(attachments):
+            # the index keeps files with the same name apart
+            file_name = '{}_{}'.format(i, os.path.basename(file_path))
+            batch_record = dict(record)
+            batch_record[blob_field] = '#' + file_name
+            batch_records.append(batch_record)
+            file_names.append(file_name)
+
+        zip_body = io.BytesIO()
+
+        with zipfile.ZipFile(zip_body, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            if content_type == 'ZIP_CSV':
+                zip_file.writestr('request.txt', Util.get_csv_body(batch_records))
+            else:
+                zip_file.writestr('request.json', json.dumps(batch_records, separators=(',', ':')))
+
+            for (record, file_path), file_name in zip(attachments, file_names):
+                zip_file.write(file_path, file_name)
+
+        return zip_body.getvalue()
 
     @staticmethod
-    def resources_by_version(version_num_string, access_token, instance_url):
+    def get_attachment_size(attachment):
         """
-        This method returns the available resources (API services) available for
-        the supplied version number.
+        This method measures a (record, file_path) tuple for
+        Util.pack_by_size, so a zip batch stays under the Bulk API limits.
 
         Args:
-            version_num_string (str): This is the version number as a string,
-                                      e.g. 37.0
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            attachment (tuple): The record and the path of its file
 
         Returns:
-            object: Returns an object containing the list of available resources
-                    for this version number.
+            int: Returns the size of the file and its record in bytes
         """
-        header_details = Util.get_standard_header(access_token)
-
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + version_num_string + '/', header_details)
-        json_response = json.loads(response.text)
+        record, file_path = attachment
 
-        return json_response
+        # the file name is in the zip twice, in the local header and the central directory
+        return os.path.getsize(file_path) + Util.get_record_size(record) + 2 * len(os.path.basename(file_path)) + 100
 
     @staticmethod
-    def get_sobject_row(object_name, record_id, field_list_string, access_token, instance_url):
+    def parse_bulk_error(error_text):
         """
-        Provides the details requested for the specified record. In practice, if you
-        provide an explicit list of fields, it will be just like a query for that
-        record, but if you leave the fields blank, this will return a lot if not
-        all fields. I'm not sure about that because the description of what is
-        returned if you leave the fields empty isn't explained in the API documentation
+        This method converts an error from a CSV bulk result, which looks like
+        REQUIRED_FIELD_MISSING:Required fields are missing: [Name]:Name --, into
+        the error format of the JSON results.
 
         Args:
-            object_name (str): The API name of the object.
-            record_id (str): The record Id you're trying to retrieve
-            field_list_string (str): List of comma separated values for fields
-                                     to retrieve
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            error_text (str): The Error column of the result row
 
         Returns:
-            dict: returns the record with the explicit field list, or all (or
-                a lot) of the fields if the field_list_string is None.
+            dict: Returns the error with the statusCode, message and fields keys
         """
-        get_row_uri = '/sobjects/' + object_name + '/' + record_id
-        header_details = Util.get_standard_header(access_token)
+        error_text = error_text.strip()
 
-        if field_list_string != None:
-            get_row_uri = get_row_uri + '?fields=' + field_list_string
+        if error_text.endswith('--'):
+            error_text = error_text[:-2].rstrip()
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_row_uri, header_details)
-        json_response = json.loads(response.text)
+        status_code, separator, message = error_text.partition(':')
+        fields = []
 
-        return json_response
+        if separator == '':
+            message = status_code
+            status_code = None
+        elif ':' in message:
+            message, _, field_text = message.rpartition(':')
+            fields = [field_name.strip() for field_name in field_text.split(',') if field_name.strip() != '']
+
+        return {'statusCode': status_code, 'message': message, 'fields': fields}
 
     @staticmethod
-    def get_sobject_blob(object_name, record_id, access_token, instance_url):
+    def get_bulk_csv_result(row):
         """
-        Provides the details requested for the specified record blob field. This will retrieve the
-        BLOB field for Attachments/ContentVersion/Document.  Example call:
-            response = Standard.get_sobject_blob('Attachment', 'attachmentId', access_token, instance_url)
-            with open('test.jpg', 'wb') as new_file:
-                for chunk in response.iter_content(chunk_size=1024):
-                    new_file.write(chunk)
+        This method converts a row of a CSV bulk batch result into the format of
+        the JSON results, so the results look the same for every content type.
 
         Args:
-            object_name (str): The API name of the object.
-            record_id (str): The record Id of the Attachment you're trying to retrieve
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            row (dict): The result row with the Id, Success, Created and Error
+                        columns
 
         Returns:
-            object: returns the record with the explicit field list, or all (or
-                    a lot) of the fields if the field_list_string is None.
+            dict: Returns the result with the id, success, created and errors
+                  keys
         """
-        object_to_blob_map = {
-            "Attachment": "Body",
-            "ContentVersion": "VersionData",
-            "Document": "Body",
-            "ContentNote": "Content"
-        }
-
-        get_row_uri = '/sobjects/' + object_name + '/' + record_id + '/' + object_to_blob_map[object_name]
-        header_details = Util.get_standard_header(access_token)
+        result = {'id': row.get('Id') or None,
+                  'success': (row.get('Success') or '').lower() == 'true',
+                  'created': (row.get('Created') or '').lower() == 'true',
+                  'errors': []}
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_row_uri, header_details)
+        if row.get('Error'):
+            result['errors'].append(Util.parse_bulk_error(row['Error']))
 
-        return response
+        return result
 
     @staticmethod
-    def create_sobject_blob_record(object_name, record_json, file, access_token, instance_url):
+    def get_bulk2_result(row, result_type):
         """
-        Creates the provided record in the recordJson param and binary multipart message
+        This method converts a row of a Bulk API 2.0 result CSV into the format
+        of the Bulk API results, with the sf__Id, sf__Created and sf__Error
+        columns as typed values and the other columns in record.
 
         Args:
-            object_name (str): The API name of the object.
-            record_json (object): The JSON describing the fields you want to
-                                  update on the given object. You should pass in
-                                  a python object and it will be converted to a
-                                  json string to send the request. This object
-                                  is just the key value paris for the record
-                                  update. e.g.:
-                                      {
-                                          'BillingCity': 'Bellevue',
-                                          'BillingState': 'WA'
-                                      }
-            file (str): file object
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            row (dict): The result row
+            result_type (str): The result CSV the row is from:
+                               successfulResults, failedResults or
+                               unprocessedrecords
+
         Returns:
-            object: returns the text from the creation response
+            dict: Returns the result with the id, success, created, processed,
+                  errors and record keys
         """
-        post_row_uri = '/sobjects/'+ object_name + '/'
-        header_details = {"Authorization": "Bearer " + access_token}
-        mimetype = MimeTypes().guess_type(os.path.basename(file.name))[0] or 'application/octet-stream'
+        result = {'id': row.get('sf__Id') or None,
+                  'success': result_type == 'successfulResults',
+                  'created': (row.get('sf__Created') or '').lower() == 'true',
+                  'processed': result_type != 'unprocessedrecords',
+                  'errors': [],
+                  'record': {key: value for key, value in row.items() if not key.startswith('sf__')}}
 
-        object_to_blob_map = {
-            "Attachment": {"BlobField": "Body",
-                           "FileNameField": "Name",
-                           "ParentField": "ParentId"
-                           },
-            "ContentVersion": {"BlobField": "VersionData",
-                               "FileNameField": "PathOnClient",
-                               "ParentField": "FirstPublishLocationId"
-                               },
-            "Document": {"BlobField": "Body",
-                         "FileNameField": "Name",
-                         "ParentField": "ParentId"
-                         },
-        }
+        if row.get('sf__Error'):
+            result['errors'].append(Util.parse_bulk_error(row['sf__Error']))
 
-        object_fields = object_to_blob_map[object_name]
+        return result
 
-        multipart_files = {
-            'entity_'+object_name: (None, json.dumps(record_json), 'application/json'),
-            object_fields['BlobField']: (record_json[object_fields['FileNameField']], file, mimetype)
-        }
+    @staticmethod
+    def iter_bulk2_results(file_object, result_type):
+        """
+        This generator parses a Bulk API 2.0 result CSV from a file one row at a
+        time, so a result file of any size can be read without loading it.
 
-        response = webservice.Tools.post_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + post_row_uri, None,
-            header_details, multipart_files)
-        response_text = ""
+        Args:
+            file_object (file): The binary file with the result CSV
+            result_type (str): successfulResults, failedResults or
+                               unprocessedrecords
 
-        if response.status_code == 204:
-            response_text = "Update Successful"
-        else:
-            response_text = response.text
+        Returns:
+            dict: Yields each row converted with Util.get_bulk2_result
+        """
+        text_file = io.TextIOWrapper(file_object, encoding='utf-8', newline='')
 
-        return response_text
+        for row in csv.DictReader(text_file):
+            yield Util.get_bulk2_result(row, result_type)
+
+        text_file.detach()
 
     @staticmethod
-    def create_sobject_row(object_name, record_json, run_assignment_rules, access_token, instance_url):
+    def join_bulk2_results(records, results, key_field=None, fields=None):
         """
-        Creates the provided record in the recordJson param
+        This method matches Bulk API 2.0 results back to the records that were
+        loaded, since the result CSVs aren't in the order of the records. With
+        a key_field, like an external Id, records are matched on that column.
+        Otherwise they're matched by position on all the columns that were
+        sent, which the results repeat, and identical records get their results
+        in order.
 
         Args:
-            object_name (str): The API name of the object.
-            record_json (dict): The JSON describing the fields you want to
-                                update on the given object. You should pass in
-                                a python object and it will be converted to a
-                                json string to send the request. This object
-                                is just the key value paris for the record
-                                update. e.g.:
-                                    {
-                                        'BillingCity': 'Bellevue',
-                                        'BillingState': 'WA'
-                                    }
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            records (iterable): The record dicts that were loaded
+            results (iterable): The results from Util.get_bulk2_result, from
+                                any of the result CSVs
+            key_field (str): The column to match on, or None to match on all
+                             the columns
+            fields (array): The columns the records were sent with, if they
+                            were passed to the load
+
         Returns:
-            dict: returns the text from the creation response
+            array: Returns the result of each record in the order of the
+                   records, or None for a record without a result
         """
-        post_row_uri = '/sobjects/' + object_name + '/'
-        header_details = Util.get_standard_header(access_token)
+        csv_rows = Util.iter_csv_rows(records, fields)
+        fields = next(csv.reader(io.StringIO(next(csv_rows))))
+        positions = {}
+        record_count = 0
 
-        if run_assignment_rules:
-            header_details["Sforce-Auto-Assign"] = "true"
-        else:
-            header_details["Sforce-Auto-Assign"] = "false"
+        if key_field != None and key_field not in fields:
+            raise ValueError('{} isn\'t one of the columns of the records'.format(key_field))
 
-        data_body_json = json.dumps(record_json, indent=4, separators=(',', ': '))
+        # the key is the cells as they were written to the CSV, which is how they come back in the results
+        for position, csv_row in enumerate(csv_rows):
+            cells = next(csv.reader(io.StringIO(csv_row)))
 
-        response = webservice.Tools.post_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + post_row_uri, data_body_json,
-            header_details)
-        response_text = ""
+            if key_field != None:
+                key = cells[fields.index(key_field)]
+            else:
+                key = tuple(cells)
 
-        if response.status_code == 204:
-            response_text = "Update Successful"
-        else:
-            response_text = response.text
+            positions.setdefault(key, []).append(position)
+            record_count += 1
 
-        return response_text
+        joined_results = [None] * record_count
+
+        for result in results:
+            if key_field != None:
+                key = result['record'].get(key_field, '')
+            else:
+                key = tuple(result['record'].get(field_name, '') for field_name in fields)
+
+            if positions.get(key):
+                joined_results[positions[key].pop(0)] = result
+
+        return joined_results
 
     @staticmethod
-    def get_sobject_rows(object_name, record_id_list_string, field_list_string, access_token, instance_url):
+    def get_pk_chunking_header(chunk_size=None, parent=None, start_row=None):
         """
-        Provides the details requested for the specified record id list. In practice, if you
-        provide an explicit list of fields, it will be just like a query for that
-        record, but if you leave the fields blank, this will return a lot if not
-        all fields. I'm not sure about that because the description of what is
-        returned if you leave the fields empty isn't explained in the API documentation
+        This method builds the value of the Sforce-Enable-PKChunking header,
+        which has Salesforce split a bulk query into a batch for each range of
+        record Ids.
 
         Args:
-            object_name (str): The API name of the object.
-            record_id_list_string (str): The record id list you're trying to retrieve
-            field_list_string (str): List of comma separated values for fields
-                                     to retrieve
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            chunk_size (int): The number of records in each chunk. Salesforce
+                              defaults this to 100,000 and allows at most
+                              250,000
+            parent (str): The parent object to chunk on when querying a sharing
+                          object, e.g. Account for AccountShare
+            start_row (str): The 15 or 18 character Id to start the first chunk
+                             at
 
         Returns:
-            dict: returns the record with the explicit field list, or all (or
-                a lot) of the fields if the field_list_string is None.
+            str: Returns the header value, e.g. chunkSize=50000; parent=Account
         """
+        options = []
 
-        get_row_uri = '/composite/sobjects/' + object_name
-        header_details = Util.get_standard_header(access_token)
+        if chunk_size != None:
+            options.append('chunkSize={}'.format(chunk_size))
 
-        get_rows_uri = get_row_uri + '?ids=' + record_id_list_string + '&fields=' + field_list_string
+        if parent != None:
+            options.append('parent={}'.format(parent))
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_rows_uri, header_details)
-        json_response = json.loads(response.text)
+        if start_row != None:
+            options.append('startRow={}'.format(start_row))
 
-        return json_response
+        if len(options) == 0:
+            return 'true'
+
+        return '; '.join(options)
 
     @staticmethod
-    def create_sobject_rows(records, all_or_none, run_assignment_rules, access_token, instance_url):
+    def get_xml_values(element):
         """
-        Creates a list of up to 200 records.
-        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections.htm
+        This method converts a Bulk API XML element, such as a jobInfo or
+        batchInfo, into the dict the JSON responses have. The number fields are
+        converted to ints, and repeated batchInfo elements are put in a list.
 
         Args:
-            records_json (object): The JSON describing the records you want to
-                                   insert on the given object. Each object needs
-                                   to contain an attributes field that contains
-                                   the "type" which is the object name.
-                                   example:
-                                       [{
-                                          "attributes" : {"type" : "Account"},
-                                          "Name" : "example.com",
-                                          "BillingCity" : "San Francisco"
-                                       }, {
-                                          "attributes" : {"type" : "Contact"},
-                                          "LastName" : "Johnson",
-                                          "FirstName" : "Erica"
-                                       }]
-            all_or_none (bool): Indicates whether to roll back the entire request
-                                when the update of any object fails (true) or to
-                                continue with the independent update of other
-                                objects in the request. The default is false.
-            run_assignment_rules (bool): If true this will add the assginment
-                                         rule header to the request.
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            element (object): The ElementTree element to convert
 
         Returns:
-            dict: Returns a response object that should have a success or failure
-                 for each item in the request in the same order.
-                 example:
-                [
-                   {
-                      "success" : false,
-                      "errors" : [
-                         {
-                            "statusCode" : "DUPLICATES_DETECTED",
-                            "message" : "Use one of these records?",
-                            "fields" : [ ]
-                         }
-                      ]
-                   },
-                   {
-                      "success" : false,
-                      "errors" : [
-                         {
-                            "statusCode" : "ALL_OR_NONE_OPERATION_ROLLED_BACK",
-                            "message" : "Record rolled back because not all records were valid and the request was using AllOrNone header",
-                            "fields" : [ ]
-                         }
-                      ]
-                   }
-                ]
+            dict: Returns the values of the element, or its text if it doesn't
+                  have any child elements
         """
-        post_rows_uri = '/composite/sobjects'
-        header_details = Util.get_standard_header(access_token)
+        children = list(element)
 
-        if run_assignment_rules:
-            header_details["Sforce-Auto-Assign"] = "true"
-        else:
-            header_details["Sforce-Auto-Assign"] = "false"
+        if len(children) == 0:
+            return element.text
 
-        request_body = {}
-        request_body["allOrNone"] = all_or_none
-        request_body["records"] = records
+        values = {}
 
-        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+        for child in children:
+            tag = child.tag.rpartition('}')[2]
+            value = Util.get_xml_values(child)
 
-        response = webservice.Tools.post_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + post_rows_uri, data_body_json,
-            header_details)
+            if tag.startswith('number') and value != None:
+                value = int(value)
 
-        return json.loads(response.text)
+            if tag == 'batchInfo':
+                values.setdefault(tag, []).append(value)
+            else:
+                values[tag] = value
+
+        return values
 
     @staticmethod
-    def update_sobject_row(object_name, record_id, record_json, run_assignment_rules, access_token, instance_url):
+    def parse_bulk_info(response):
         """
-        Updates a specific record with the data in the record_json param
+        This method parses a Bulk API job or batch info response. Jobs that
+        don't use JSON get their batch info back as XML, so the XML is converted
+        with Util.get_xml_values to match the JSON responses.
 
         Args:
-            object_name (str): The API name of the object.
-            record_id (str): The record Id you're trying to update
+            response (object): The response of the job or batch request
 
-            record_json (dict): The JSON describing the fields you want to
-                                  update on the given object. You should pass in
-                                  a python object and it will be converted to a
-                                  json string to send the request. This object
-                                  is just the key value paris for the record
-                                  update. e.g.:
-                                      {
-                                          'BillingCity': 'Bellevue',
-                                          'BillingState': 'WA'
-                                      }
-            run_assignment_rules (bool): If true this will add the assginment
-                                         rule header to the request.
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+        Returns:
+            dict: Returns the job or batch info
+        """
+        if 'xml' in response.headers.get('Content-Type', ''):
+            return Util.get_xml_values(ElementTree.fromstring(response.content))
+
+        return json.loads(response.text)
+
+    @staticmethod
+    def iter_json_array(text_file, chunk_size=65536):
+        """
+        This generator parses a JSON array from a file one value at a time with
+        JSONDecoder.raw_decode, so only the current chunk of the file is held in
+        memory instead of the whole array.
+
+        Args:
+            text_file (file): The text file containing the JSON array
+            chunk_size (int): The number of characters read at a time
 
         Returns:
-            str: This only returns 'Update Successful' if the update worked, or
-                 returns an error message if the update wasn't successful. The
-                 response isn't more detailed because Salesforce returns no
-                 text, only a response code of 204
+            object: Yields each value of the array
         """
-        patch_row_uri = '/sobjects/' + object_name + '/' + record_id
-        header_details = Util.get_standard_header(access_token)
-        header_details["Sforce-Auto-Assign"] = "true" if run_assignment_rules else "false"
+        decoder = json.JSONDecoder()
+        buffer = ''
+        position = 0
+        is_started = False
+        is_end_of_file = False
 
-        data_body_json = json.dumps(record_json, indent=4, separators=(',', ': '))
+        while True:
+            # skip the whitespace, the opening bracket and the commas between the values
+            while position < len(buffer) and (buffer[position] in ' \t\r\n,' or
+                                              (buffer[position] == '[' and not is_started)):
+                if buffer[position] == '[':
+                    is_started = True
 
-        response = webservice.Tools.patch_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + patch_row_uri, data_body_json,
-            header_details)
-        response_text = ""
+                position += 1
 
-        if response.status_code == 204:
-            response_text = "Update Successful"
-        else:
-            response_text = response.text
+            if position < len(buffer):
+                if buffer[position] == ']':
+                    return
 
-        return response_text
+                try:
+                    value, end_position = decoder.raw_decode(buffer, position)
+                    next_position = end_position
+
+                    while next_position < len(buffer) and buffer[next_position] in ' \t\r\n':
+                        next_position += 1
+
+                    # a number cut off by the end of the chunk, like -0 of -0.5, may continue in the next one, so a
+                    # value is only complete once the comma or bracket after it has been read
+                    if (next_position < len(buffer) and buffer[next_position] in ',]') or is_end_of_file:
+                        position = end_position
+                        yield value
+                        continue
+                except ValueError:
+                    if is_end_of_file:
+                        raise
+            elif is_end_of_file:
+                return
+
+            chunk = text_file.read(chunk_size)
+
+            if chunk == '':
+                is_end_of_file = True
+
+            buffer = buffer[position:] + chunk
+            position = 0
 
     @staticmethod
-    def update_sobject_rows(records, all_or_none, run_assignment_rules, access_token, instance_url):
+    def parse_bulk_response(response, csv_row_parser=None):
         """
-        Updates a list of up to 200 records.
-        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections.htm
+        This method parses a Bulk API result using the Content-Type of the
+        response. A JSON body is loaded as is, an XML result list (returned with
+        the query result ids of a CSV job) becomes a list of the ids, and a CSV
+        body becomes a list of row dicts.
 
         Args:
-            records_json (object): The JSON describing the records you want to
-                                   insert on the given object. Each object needs
-                                   to contain an attributes field that contains
-                                   the "type" which is the object name, and an
-                                   "id" field which is the record id for
-                                   each record being updated. This key is used
-                                   in the response to show a result for each
-                                   record being updated.
-                                   example:
-                                       [{
-                                          "attributes" : {"type" : "Account", "id" : "001xx000003DGb2AAG"},
-                                          "Name" : "example.com",
-                                          "BillingCity" : "San Francisco"
-                                       }, {
-                                          "attributes" : {"type" : "Contact", "id": "003xx000004TmiQAAS"},
-                                          "LastName" : "Johnson",
-                                          "FirstName" : "Erica"
-                                       }]
-            all_or_none (bool): Indicates whether to roll back the entire request
-                                when the update of any object fails (true) or to
-                                continue with the independent update of other
-                                objects in the request. The default is false.
-            run_assignment_rules (bool): If true this will add the assginment
-                                         rule header to the request.
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            response (object): The response of the result request
+            csv_row_parser (function): Optional function that converts each
+                                       CSV row dict
 
         Returns:
-            dict: Returns a response object that should have a success or failure
-                  for each item in the request in the same order.
-                example:
-                [
-                   {
-                      "id" : "001xx000003DGb2AAG",
-                      "success" : true,
-                      "errors" : [ ]
-                   },
-                   {
-                      "id" : "003xx000004TmiQAAS",
-                      "success" : true,
-                      "errors" : [ ]
-                   }
-                ]
+            array: Returns the parsed results
         """
-        patch_rows_uri = '/composite/sobjects'
-        header_details = Util.get_standard_header(access_token)
+        response_content_type = response.headers.get('Content-Type', '')
 
-        if run_assignment_rules:
-            header_details["Sforce-Auto-Assign"] = "true"
-        else:
-            header_details["Sforce-Auto-Assign"] = "false"
+        if 'xml' in response_content_type:
+            root = ElementTree.fromstring(response.content)
 
-        request_body = {}
-        request_body["allOrNone"] = all_or_none
-        request_body["records"] = records
+            return [element.text for element in root.iter()
+                    if element.tag == 'result' or element.tag.endswith('}result')]
 
-        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+        if 'csv' in response_content_type:
+            rows = csv.DictReader(io.StringIO(response.text))
 
-        response = webservice.Tools.patch_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + patch_rows_uri, data_body_json,
-            header_details)
+            if csv_row_parser is not None:
+                return [csv_row_parser(row) for row in rows]
+
+            return list(rows)
 
         return json.loads(response.text)
 
     @staticmethod
-    def upsert_sobject_rows(object_api_name, records, access_token, instance_url, all_or_none=False, run_assignment_rules=False, external_id_field_name='Id'):
+    def get_soap_client(wsdl_file):
         """
-        Upserts a list of up to 200 records.
-        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections_upsert.htm
+        Pass the wsdl and generate the soap client for the given WSDL
 
         Args:
-            object_api_name (str): The API Name of the object being updated
-            records (object): The JSON describing the records you want to
-                              insert on the given object. Each object needs
+            wsdl_file (str): The file location for the WSDL used to generate
+                             the client
+
+        Returns:
+            Client: Returns the SOAP client.
+        """
+        if Client is None:
+            raise ImportError(
+                "The 'zeep' library is required to use the Metadata or SOAP APIs. "
+                "Install it using `pip install zeep` or `pip install pysalesforce[metadata]`."
+            )
+
+        soap_client = Client(wsdl_file)
+        return soap_client
+
+    @staticmethod
+    def get_soap_client_service(wsdl_file, service_binding, endpoint_url):
+        """
+        This method takes the given arguments and creates the soap client service.
+
+        Args:
+            wsdl_file (str): The file location for the WSDL used to generate
+                             the client.
+            service_binding (str): The name of the service binding to create
+            endpoint_url (str): The endpoint url to call for the service binding
+
+        Returns:
+            client_service: Returns the SOAP client service.
+        """
+        soap_client = Util.get_soap_client(wsdl_file)
+        soap_client_service = soap_client.create_service(service_binding, endpoint_url)
+
+        return soap_client_service
+
+
+class Authentication:
+    """
+    The Authentication class is used to log in and out of Salesforce
+    """
+
+    @staticmethod
+    def get_oauth_login(login_username, login_password, login_client_id, login_client_secret, is_production):
+        """
+        this function logs into Salesforce using the oAuth 2.0 password grant type,
+        and returns the response that can be used for other salesforce api requests.
+        There are two parts of the response that will be needed, the token, and
+        the instance url. The token can be retrieved with json_response['access_token'],
+        and the instance url with json_response['instance_url']. In order for this
+        function to work, a connected app must be set up in Salesforce, which is
+        where the client id and client secret come from the Client Id is the
+        connected app Consumer Key, and the client secret is the consumer secret.
+
+        Args:
+            login_username (str): this is the salesforce login
+            login_password (str): this is the salesforce password AND security
+                                  token
+            login_client_id (str): this is the client Id from the oAuth settings
+                                   in the Salesforce app setup
+            login_client_secret (str): this is the secret from the oAuth settings
+                                       in the Salesforce app setup
+            is_production (bool): this is a boolean value to set whether or not
+                                  the base oAuth connection will be in production
+                                  or a sandbox environment
+        Returns:
+            object: returns the json from the login response body the important
+                    aspects of the response are the access_token, which will be
+                    used to authenticate the other calls, and instance_url,
+                    which is the base endpoint used for the other calls
+        """
+        if is_production:
+            base_oauth_url = 'https://login.salesforce.com/services/oauth2/token'
+        else:
+            base_oauth_url = 'https://test.salesforce.com/services/oauth2/token'
+
+        login_body_data = {'grant_type': 'password', 'client_id': login_client_id, 'client_secret': login_client_secret,
+                           'username': login_username, 'password': login_password}
+
+        response = webservice.Tools.post_http_response(base_oauth_url, login_body_data, '')
+
+        try:
+            json_response = json.loads(response.text)
+        except:
+            json_response = response.text
+
+        return json_response
+
+    @staticmethod
+    def get_oauth_logout(auth_token, is_production):
+        """
+        this function calls the correct endpoint for the oauth logout by providing
+        the token and whether or not the login is production or test.
+
+        Args:
+            auth_token (str): this is the token received in the access_token
+                              response from the get_oauth_login function.
+            is_production (bool): this is a boolean value to set whether or not
+                                  the base oAuth connection will be in production
+                                  or a sandbox environment.
+        Returns:
+            object: returns a json response with success (True or False), and
+                    the status_code returned by the call to revoke the token
+        """
+        if is_production:
+            logout_url = 'https://login.salesforce.com/services/oauth2/revoke'
+        else:
+            logout_url = 'https://test.salesforce.com/services/oauth2/revoke'
+
+        logout_body_data = {'host': logout_url, 'Content-Type': 'application/x-www-form-urlencoded',
+                            'token': auth_token}
+
+        response = webservice.Tools.post_http_response(logout_url, logout_body_data, '')
+
+        success = False
+        if response.status_code == 200:
+            success = True
+
+        json_response = {'success': success, 'status_code': response.status_code}
+
+        return json_response
+
+    @staticmethod
+    def get_login_scope_header(org_id, portal_id):
+        """
+        Only use this for authenticating as a self-service user
+
+        Args:
+            org_id (str): The ID of the organization against which you will
+                          authenticate Self-Service users.
+            portal_id (str): Specify only if user is a Customer Portal user. The
+                             ID of the portal for this organization.
+
+        Returns:
+            object: Returns the ScopeHeader for SOAP login requests.
+        """
+        login_scope_header = {}
+        login_scope_header['organizationId'] = org_id
+
+        if portal_id != None:
+            login_scope_header['portalId'] = portal_id
+
+        return login_scope_header
+
+    @staticmethod
+    def get_login_call_options(client_name, default_ns):
+        """
+        This creates the call options for the SOAP login.
+
+        Args:
+            client_name (str): A string that identifies a client.
+            default_ns (str): A string that identifies a developer namespace
+                              prefix. Use this field to resolve field names in
+                              managed packages without having to fully specify
+                              the fieldName everywhere.
+
+        Returns:
+            object: Returns the CallOptions for SOAP login requests.
+
+        """
+        call_options = {}
+
+        if client_name != None:
+            call_options['client'] = client_name
+
+        if default_ns != None:
+            call_options['defaultNamespace'] = default_ns
+
+        return call_options
+
+    @staticmethod
+    def get_soap_headers(org_id, portal_id, client_name, default_ns):
+        """
+        This method builds the headers for soap calls. Leave org_id and
+        portal_id as None if you are using a normal authentication. These
+        values are only used for self-service authentication
+
+        Args:
+        org_id (str): The ID of the organization against which you will
+                      authenticate Self-Service users.
+        portal_id (str): Specify only if user is a Customer Portal user. The ID
+                        of the portal for this organization.
+        client_name (str): A string that identifies a client.
+        default_ns (str): A string that identifies a developer namespace prefix.
+                          Use this field to resolve field names in managed
+                          packages without having to fully specify the fieldName
+                          everywhere.
+        Returns:
+            object: Returns the SOAP headers needed to log in
+        """
+        client = Util.get_soap_client(PARTNER_WSDL_FILE)
+        soap_headers = {}
+
+        if org_id != None or portal_id != None:
+            login_scope = Authentication.get_login_scope_header(org_id, portal_id)
+            soap_headers['LoginScopeHeader'] = login_scope
+
+        if client_name != None or default_ns != None:
+            call_options = Authentication.get_login_call_options(client_name, default_ns)
+            soap_headers['CallOptions'] = call_options
+
+        return soap_headers
+
+    @staticmethod
+    def get_soap_login(login_username, login_password, org_id, portal_id, client_name, default_ns, is_production):
+        """
+        This method logs into Salesforce with SOAP given the provided details.
+        Only use org_id and portal_id for self-service user authentication. For
+        most purposes, these should be set to None. The client_name is actually a
+        clientId used for partner applications and the default_ns is the default
+        namespace used for an application. So these values can also be set to
+        None for most requests. For most requests, you will only need the
+        username and password.
+
+        Args:
+            login_username (str): this is the salesforce login
+            login_password (str): this is the salesforce password AND security
+                                  token
+            org_id (str): The ID of the organization against which you will
+                          authenticate Self-Service users.
+            portal_id (str): Specify only if user is a Customer Portal user. The
+                             ID of the portal for this organization.
+            client_name (str): A string that identifies a client. Used for
+                               partner applications.
+            default_ns (str): A string that identifies a developer namespace
+                              prefix. Use this field to resolve field names in
+                              managed packages without having to fully specify
+                              the fieldName everywhere.
+            is_production (bool): this is a boolean value to set whether or not
+                                  the base oAuth connection will be in
+                                  production or a sandbox environment.
+        Returns:
+            object: returns a long response object that contains the session id
+                    login_result['sessionId'], metadata server url
+                    login_result['metadataServerUrl'] and server url
+                    login_result['serverUrl']
+        """
+        wsdl_file = PARTNER_WSDL_FILE
+
+        if not (is_production):
+            wsdl_file = PARTNER_SANDBOX_WSDL_FILE
+
+        client = Util.get_soap_client(wsdl_file)
+        soap_headers = Authentication.get_soap_headers(org_id, portal_id, client_name, default_ns)
+        login_result = client.service.login(login_username, login_password, _soapheaders=soap_headers)
+
+        return login_result
+
+
+class Tooling:
+    """
+    The purpose of this class is to expose the Salesforce Tooling API methods
+    """
+    base_tooling_uri = '/services/data/v' + API_VERSION + '/tooling'
+
+    @staticmethod
+    def completions(completions_type, access_token, instance_url):
+        """
+        Retrieves available code completions of the referenced type for Apex
+        system method symbols (type=apex).
+
+        Args:
+        completions_type (str): The type of metadata to get completions for.
+                                e.g. 'apex'
+        access_token (str): This is the access_token value received from the
+                            login response
+        instance_url (str): This is the instance_url value received from the
+                            login response
+
+        Returns:
+            object: Returns the completion values for the specified type
+        """
+        completions_uri = '/completions?type='
+        header_details = Util.get_standard_header(access_token)
+        url_encoded_type = urllib.parse.quote(completions_type)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Tooling.base_tooling_uri + completions_uri + url_encoded_type, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def execute_anonymous(code_string, access_token, instance_url):
+        """
+        This function executes anonymous apex, and returns a json response
+        object. The response should contain a success value (True or False),
+        column and line numbers, which return -1 if there are no issues,
+        exceptionStackTrace which should be None if there are no problems,
+        compiled (True or False), compileProblem which should be None if there
+        are no problems, and exceptionMessage if an exception was thrown.
+
+        Args:
+            code_string (str): this is the non url encoded code string that you
+                               would like to execute
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns the response result from executing the SFDC script
+        """
+        execute_anonymous_uri = '/executeAnonymous/?anonymousBody='
+        header_details = Util.get_standard_header(access_token)
+        url_encoded_code = urllib.parse.quote(code_string)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Tooling.base_tooling_uri + execute_anonymous_uri + url_encoded_code, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def query(query_string, access_token, instance_url):
+        """
+        Executes a query against an object and returns data that matches the
+        specified criteria. Tooling API exposes objects like EntityDefinition and
+        FieldDefinition that use the external object framework--that is, they don’t
+        exist in the database but are constructed dynamically. Special query rules
+        apply to virtual entities. If the query result is too large, it’s broken up
+        into batches. The response contains the first batch of results and a query
+        identifier. The identifier can be used in a request to retrieve the next
+        batch. A list of the tooling api objects can be found here:
+        https://developer.salesforce.com/docs/atlas.en-us.api_tooling.meta/api_tooling/reference_objects_list.htm
+
+        Args:
+            query_string (str): the query to be executed
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns a JSON object with the results of the query.
+        """
+        query_uri = '/query/?q='
+        header_details = Util.get_standard_header(access_token)
+        url_encoded_query = urllib.parse.quote(query_string)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Tooling.base_tooling_uri + query_uri + url_encoded_query, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def run_tests_asynchronous_list(class_ids, suite_ids, max_failed_tests, test_level, access_token, instance_url):
+        """
+        This method runs the tests provided with the class Ids or suite Ids, then
+        returns the direct results from the Salesforce tooling API.
+
+        Args:
+            class_ids (array): List of comma separated class Ids to run the tests
+            suite_ids (array): List of suite ids to run
+            max_failed_tests (int): To stop the test run from executing new tests
+                                    after a given number of tests fail, set to
+                                    an integer value from 0 to 1,000,000. To
+                                    allow all tests in your run to execute,
+                                    regardless of how many tests fail, omit
+                                    max_failed_tests or set it to -1
+            test_level (str): The testLevel parameter is optional. If you don’t
+                              provide a testLevel value, we use RunSpecifiedTests.
+                              values:
+                              RunSpecifiedTests - Only the tests that you
+                                                  specify are run.
+                              RunLocalTests - All tests in your org are run,
+                                              except the ones that originate
+                                              from installed managed packages.
+                                              Omit identifiers for specific tests
+                                              when you use this value.
+                              RunAllTestsInOrg - All tests are run. The tests
+                                                 include all tests in your org,
+                                                 including tests of managed
+                                                 packages. Omit identifiers for
+                                                 specific tests when you use
+                                                 this value.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns the Id of the test run
+        """
+        test_async_uri = '/runTestsAsynchronous/'
+        header_details = Util.get_standard_header(access_token)
+
+        data_body = {}
+
+        if class_ids != None:
+            data_body['classids'] = class_ids
+
+        if suite_ids != None:
+            data_body['suiteids'] = suite_ids
+
+        if max_failed_tests != None:
+            data_body['maxFailedTests'] = max_failed_tests
+
+        if test_level != None:
+            data_body['testLevel'] = test_level
+
+        json_data_body = json.dumps(data_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(instance_url + Tooling.base_tooling_uri + test_async_uri,
+                                                       json_data_body, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def run_tests_asynchronous_json(test_array, access_token, instance_url):
+        """
+        This method runs specified tests in the test_array with more control than
+        the run_tests_asynchronous_list method by allowing you to specify which methods
+        you'd like to run with each test class.
+
+        Args:
+        test_array (array): This is an array of tests that you'd like to run with
+                            the specified methods if you wish. Like the
+                            run_tests_asynchronous_list method, you can also specify
+                            the maxFailedTests and testLevel values
+                            e.g.
+                                [
+                                {"classId": "01pD0000000Fhy9IAC",
+                                    "testMethods": ["testMethod1","testMethod2", "testMethod3"]},
+                                {"classId": "01pD0000000FhyEIAS",
+                                    "testMethods": ["testMethod1","testMethod2", "testMethod3"]},
+                                {"maxFailedTests": "2"},
+                                {"testLevel": "RunSpecifiedTests"}
+                                ]
+        access_token (str): This is the access_token value received from the
+                            login response
+        instance_url (str): This is the instance_url value received from the
+                            login response
+
+        Returns:
+            object: returns the Id of the test run
+        """
+        test_async_uri = '/runTestsAsynchronous/'
+        header_details = Util.get_standard_header(access_token)
+        data_body = {'tests': test_array}
+        json_data_body = json.dumps(data_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(instance_url + Tooling.base_tooling_uri + test_async_uri,
+                                                       json_data_body, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+
+class Standard:
+    """
+    This class provides a front end for the Salesforce standard REST API. More
+    details about this can be found here:
+    https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/intro_what_is_rest_api.htm
+    You can get more details about each of the methods by looking in the reference
+    section of the documentation.
+    """
+    base_standard_uri = '/services/data/'
+
+    @staticmethod
+    def versions(access_token, instance_url):
+        """
+        Lists summary information about each Salesforce version currently available,
+        including the version, label, and a link to each version's root.
+
+        Args:
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: Returns an object with the list of Salesforce versions
+        """
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(instance_url + Standard.base_standard_uri, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def resources_by_version(version_num_string, access_token, instance_url):
+        """
+        This method returns the available resources (API services) available for
+        the supplied version number.
+
+        Args:
+            version_num_string (str): This is the version number as a string,
+                                      e.g. 37.0
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: Returns an object containing the list of available resources
+                    for this version number.
+        """
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + version_num_string + '/', header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def get_sobject_row(object_name, record_id, field_list_string, access_token, instance_url):
+        """
+        Provides the details requested for the specified record. In practice, if you
+        provide an explicit list of fields, it will be just like a query for that
+        record, but if you leave the fields blank, this will return a lot if not
+        all fields. I'm not sure about that because the description of what is
+        returned if you leave the fields empty isn't explained in the API documentation
+
+        Args:
+            object_name (str): The API name of the object.
+            record_id (str): The record Id you're trying to retrieve
+            field_list_string (str): List of comma separated values for fields
+                                     to retrieve
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: returns the record with the explicit field list, or all (or
+                a lot) of the fields if the field_list_string is None.
+        """
+        get_row_uri = '/sobjects/' + object_name + '/' + record_id
+        header_details = Util.get_standard_header(access_token)
+
+        if field_list_string != None:
+            get_row_uri = get_row_uri + '?fields=' + field_list_string
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_row_uri, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def get_sobject_blob(object_name, record_id, access_token, instance_url):
+        """
+        Provides the details requested for the specified record blob field. This will retrieve the
+        BLOB field for Attachments/ContentVersion/Document.  Example call:
+            response = Standard.get_sobject_blob('Attachment', 'attachmentId', access_token, instance_url)
+            with open('test.jpg', 'wb') as new_file:
+                for chunk in response.iter_content(chunk_size=1024):
+                    new_file.write(chunk)
+
+        Args:
+            object_name (str): The API name of the object.
+            record_id (str): The record Id of the Attachment you're trying to retrieve
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns the record with the explicit field list, or all (or
+                    a lot) of the fields if the field_list_string is None.
+        """
+        object_to_blob_map = {
+            "Attachment": "Body",
+            "ContentVersion": "VersionData",
+            "Document": "Body",
+            "ContentNote": "Content"
+        }
+
+        get_row_uri = '/sobjects/' + object_name + '/' + record_id + '/' + object_to_blob_map[object_name]
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_row_uri, header_details)
+
+        return response
+
+    @staticmethod
+    def create_sobject_blob_record(object_name, record_json, file, access_token, instance_url):
+        """
+        Creates the provided record in the recordJson param and binary multipart message
+
+        Args:
+            object_name (str): The API name of the object.
+            record_json (object): The JSON describing the fields you want to
+                                  update on the given object. You should pass in
+                                  a python object and it will be converted to a
+                                  json string to send the request. This object
+                                  is just the key value paris for the record
+                                  update. e.g.:
+                                      {
+                                          'BillingCity': 'Bellevue',
+                                          'BillingState': 'WA'
+                                      }
+            file (str): file object
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+        Returns:
+            object: returns the text from the creation response
+        """
+        post_row_uri = '/sobjects/'+ object_name + '/'
+        header_details = {"Authorization": "Bearer " + access_token}
+        mimetype = MimeTypes().guess_type(os.path.basename(file.name))[0] or 'application/octet-stream'
+
+        object_fields = SOBJECT_BLOB_FIELDS[object_name]
+
+        multipart_files = {
+            'entity_'+object_name: (None, json.dumps(record_json), 'application/json'),
+            object_fields['BlobField']: (record_json[object_fields['FileNameField']], file, mimetype)
+        }
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + post_row_uri, None,
+            header_details, multipart_files)
+        response_text = ""
+
+        if response.status_code == 204:
+            response_text = "Update Successful"
+        else:
+            response_text = response.text
+
+        return response_text
+
+    @staticmethod
+    def create_sobject_row(object_name, record_json, run_assignment_rules, access_token, instance_url):
+        """
+        Creates the provided record in the recordJson param
+
+        Args:
+            object_name (str): The API name of the object.
+            record_json (dict): The JSON describing the fields you want to
+                                update on the given object. You should pass in
+                                a python object and it will be converted to a
+                                json string to send the request. This object
+                                is just the key value paris for the record
+                                update. e.g.:
+                                    {
+                                        'BillingCity': 'Bellevue',
+                                        'BillingState': 'WA'
+                                    }
+            instance_url (str): This is the instance_url value received from the
+                                login response
+        Returns:
+            dict: returns the text from the creation response
+        """
+        post_row_uri = '/sobjects/' + object_name + '/'
+        header_details = Util.get_standard_header(access_token)
+
+        if run_assignment_rules:
+            header_details["Sforce-Auto-Assign"] = "true"
+        else:
+            header_details["Sforce-Auto-Assign"] = "false"
+
+        data_body_json = json.dumps(record_json, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + post_row_uri, data_body_json,
+            header_details)
+        response_text = ""
+
+        if response.status_code == 204:
+            response_text = "Update Successful"
+        else:
+            response_text = response.text
+
+        return response_text
+
+    @staticmethod
+    def get_sobject_rows(object_name, record_id_list_string, field_list_string, access_token, instance_url):
+        """
+        Provides the details requested for the specified record id list. In practice, if you
+        provide an explicit list of fields, it will be just like a query for that
+        record, but if you leave the fields blank, this will return a lot if not
+        all fields. I'm not sure about that because the description of what is
+        returned if you leave the fields empty isn't explained in the API documentation
+
+        Args:
+            object_name (str): The API name of the object.
+            record_id_list_string (str): The record id list you're trying to retrieve
+            field_list_string (str): List of comma separated values for fields
+                                     to retrieve
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: returns the record with the explicit field list, or all (or
+                a lot) of the fields if the field_list_string is None.
+        """
+
+        get_row_uri = '/composite/sobjects/' + object_name
+        header_details = Util.get_standard_header(access_token)
+
+        get_rows_uri = get_row_uri + '?ids=' + record_id_list_string + '&fields=' + field_list_string
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_rows_uri, header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def create_sobject_rows(records, all_or_none, run_assignment_rules, access_token, instance_url):
+        """
+        Creates a list of up to 200 records.
+        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections.htm
+
+        Args:
+            records_json (object): The JSON describing the records you want to
+                                   insert on the given object. Each object needs
+                                   to contain an attributes field that contains
+                                   the "type" which is the object name.
+                                   example:
+                                       [{
+                                          "attributes" : {"type" : "Account"},
+                                          "Name" : "example.com",
+                                          "BillingCity" : "San Francisco"
+                                       }, {
+                                          "attributes" : {"type" : "Contact"},
+                                          "LastName" : "Johnson",
+                                          "FirstName" : "Erica"
+                                       }]
+            all_or_none (bool): Indicates whether to roll back the entire request
+                                when the update of any object fails (true) or to
+                                continue with the independent update of other
+                                objects in the request. The default is false.
+            run_assignment_rules (bool): If true this will add the assginment
+                                         rule header to the request.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: Returns a response object that should have a success or failure
+                 for each item in the request in the same order.
+                 example:
+                [
+                   {
+                      "success" : false,
+                      "errors" : [
+                         {
+                            "statusCode" : "DUPLICATES_DETECTED",
+                            "message" : "Use one of these records?",
+                            "fields" : [ ]
+                         }
+                      ]
+                   },
+                   {
+                      "success" : false,
+                      "errors" : [
+                         {
+                            "statusCode" : "ALL_OR_NONE_OPERATION_ROLLED_BACK",
+                            "message" : "Record rolled back because not all records were valid and the request was using AllOrNone header",
+                            "fields" : [ ]
+                         }
+                      ]
+                   }
+                ]
+        """
+        post_rows_uri = '/composite/sobjects'
+        header_details = Util.get_standard_header(access_token)
+
+        if run_assignment_rules:
+            header_details["Sforce-Auto-Assign"] = "true"
+        else:
+            header_details["Sforce-Auto-Assign"] = "false"
+
+        request_body = {}
+        request_body["allOrNone"] = all_or_none
+        request_body["records"] = records
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + post_rows_uri, data_body_json,
+            header_details)
+
+        return json.loads(response.text)
+
+    @staticmethod
+    def update_sobject_row(object_name, record_id, record_json, run_assignment_rules, access_token, instance_url):
+        """
+        Updates a specific record with the data in the record_json param
+
+        Args:
+            object_name (str): The API name of the object.
+            record_id (str): The record Id you're trying to update
+
+            record_json (dict): The JSON describing the fields you want to
+                                  update on the given object. You should pass in
+                                  a python object and it will be converted to a
+                                  json string to send the request. This object
+                                  is just the key value paris for the record
+                                  update. e.g.:
+                                      {
+                                          'BillingCity': 'Bellevue',
+                                          'BillingState': 'WA'
+                                      }
+            run_assignment_rules (bool): If true this will add the assginment
+                                         rule header to the request.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            str: This only returns 'Update Successful' if the update worked, or
+                 returns an error message if the update wasn't successful. The
+                 response isn't more detailed because Salesforce returns no
+                 text, only a response code of 204
+        """
+        patch_row_uri = '/sobjects/' + object_name + '/' + record_id
+        header_details = Util.get_standard_header(access_token)
+        header_details["Sforce-Auto-Assign"] = "true" if run_assignment_rules else "false"
+
+        data_body_json = json.dumps(record_json, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.patch_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + patch_row_uri, data_body_json,
+            header_details)
+        response_text = ""
+
+        if response.status_code == 204:
+            response_text = "Update Successful"
+        else:
+            response_text = response.text
+
+        return response_text
+
+    @staticmethod
+    def update_sobject_rows(records, all_or_none, run_assignment_rules, access_token, instance_url):
+        """
+        Updates a list of up to 200 records.
+        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections.htm
+
+        Args:
+            records_json (object): The JSON describing the records you want to
+                                   insert on the given object. Each object needs
+                                   to contain an attributes field that contains
+                                   the "type" which is the object name, and an
+                                   "id" field which is the record id for
+                                   each record being updated. This key is used
+                                   in the response to show a result for each
+                                   record being updated.
+                                   example:
+                                       [{
+                                          "attributes" : {"type" : "Account", "id" : "001xx000003DGb2AAG"},
+                                          "Name" : "example.com",
+                                          "BillingCity" : "San Francisco"
+                                       }, {
+                                          "attributes" : {"type" : "Contact", "id": "003xx000004TmiQAAS"},
+                                          "LastName" : "Johnson",
+                                          "FirstName" : "Erica"
+                                       }]
+            all_or_none (bool): Indicates whether to roll back the entire request
+                                when the update of any object fails (true) or to
+                                continue with the independent update of other
+                                objects in the request. The default is false.
+            run_assignment_rules (bool): If true this will add the assginment
+                                         rule header to the request.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: Returns a response object that should have a success or failure
+                  for each item in the request in the same order.
+                example:
+                [
+                   {
+                      "id" : "001xx000003DGb2AAG",
+                      "success" : true,
+                      "errors" : [ ]
+                   },
+                   {
+                      "id" : "003xx000004TmiQAAS",
+                      "success" : true,
+                      "errors" : [ ]
+                   }
+                ]
+        """
+        patch_rows_uri = '/composite/sobjects'
+        header_details = Util.get_standard_header(access_token)
+
+        if run_assignment_rules:
+            header_details["Sforce-Auto-Assign"] = "true"
+        else:
+            header_details["Sforce-Auto-Assign"] = "false"
+
+        request_body = {}
+        request_body["allOrNone"] = all_or_none
+        request_body["records"] = records
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.patch_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + patch_rows_uri, data_body_json,
+            header_details)
+
+        return json.loads(response.text)
+
+    @staticmethod
+    def upsert_sobject_rows(object_api_name, records, access_token, instance_url, all_or_none=False, run_assignment_rules=False, external_id_field_name='Id'):
+        """
+        Upserts a list of up to 200 records.
+        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections_upsert.htm
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (object): The JSON describing the records you want to
+                              insert on the given object. Each object needs
                               to contain an attributes field that contains
                               the "type" which is the object name, and an
                               "id" field which is the record id for
@@ -1134,1461 +2194,5651 @@ class Standard:
                                 login response
             instance_url (str): This is the instance_url value received from the
                                 login response
-            all_or_none (bool): Indicates whether to roll back the entire request
-                                when the update of any object fails (true) or to
-                                continue with the independent update of other
-                                objects in the request. The default is false.
-            run_assignment_rules (bool): If true this will add the assginment
-                                         rule header to the request.
-            external_id_field_name (str): This is the external Id field that is
-                                          used to determine whether this record
-                                          will be inserted or updated. This is
-                                          required for upserts, but will default
-                                          to the record Id field
+            all_or_none (bool): Indicates whether to roll back the entire request
+                                when the update of any object fails (true) or to
+                                continue with the independent update of other
+                                objects in the request. The default is false.
+            run_assignment_rules (bool): If true this will add the assginment
+                                         rule header to the request.
+            external_id_field_name (str): This is the external Id field that is
+                                          used to determine whether this record
+                                          will be inserted or updated. This is
+                                          required for upserts, but will default
+                                          to the record Id field
+
+        Returns:
+            list: A list of the response from each of the upsert requests in the
+                  request list.
+                  [
+                      {
+                          "id": "001xx0000004GxDAAU",
+                          "success": true,
+                          "errors": [],
+                          "created": true
+                      },
+                      {
+                          "id": "001xx0000004GxEAAU",
+                          "success": true,
+                          "errors": [],
+                          "created": false
+                      }
+                  ]
+        """
+        # /composite/sobjects/SobjectName/ExternalIdFieldName
+        patch_rows_uri = "/composite/sobjects/" + object_api_name + "/" + external_id_field_name
+        header_details = Util.get_standard_header(access_token)
+
+        if run_assignment_rules:
+            header_details["Sforce-Auto-Assign"] = "true"
+        else:
+            header_details["Sforce-Auto-Assign"] = "false"
+
+        request_body = {}
+        request_body["allOrNone"] = all_or_none
+        request_body["records"] = records
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.patch_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + patch_rows_uri, data_body_json,
+            header_details)
+
+        return json.loads(response.text)
+
+    @staticmethod
+    def delete_sobject_rows(record_ids, all_or_none, access_token, instance_url):
+        """
+        Deletes a list of up to 200 records.
+        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections.htm
+
+        Args:
+            record_ids (list): List of record Ids to be deleted.
+            all_or_none (bool): Indicates whether to roll back the entire request
+                                when the update of any object fails (true) or to
+                                continue with the independent update of other
+                                objects in the request. The default is false.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: The result in order of the Id delete list requested.
+                example:
+                [
+                   {
+                      "id" : "001RM000003oLruYAE",
+                      "success" : false,
+                      "errors" : [
+                         {
+                            "statusCode" : "ALL_OR_NONE_OPERATION_ROLLED_BACK",
+                            "message" : "Record rolled back because not all records were valid and the request was using AllOrNone header",
+                            "fields" : [ ]
+                         }
+                      ]
+                   },
+                   {
+                      "success" : false,
+                      "errors" : [
+                         {
+                            "statusCode" : "MALFORMED_ID",
+                            "message" : "malformed id 001RM000003oLrB000",
+                            "fields" : [ ]
+                         }
+                      ]
+                   }
+                ]
+        """
+        delete_rows_uri = '/composite/sobjects'
+        header_details = Util.get_standard_header(access_token)
+
+        delete_params = "?ids=" + ",".join(record_ids)
+
+        if all_or_none:
+            delete_params += "&allOrNone=true"
+        else:
+            delete_params += "&allOrNone=false"
+
+        response = webservice.Tools.delete_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + delete_rows_uri + delete_params, None,
+            header_details)
+
+        return json.loads(response.text)
+
+    @staticmethod
+    def get_collection_sender(operation_type, access_token, instance_url, object_api_name=None, all_or_none=False,
+                              run_assignment_rules=False, external_id_field_name='Id'):
+        """
+        Gets a function that sends one chunk of up to 200 records with the
+        sObject Collections method for the operation. If the request fails,
+        the function returns a REQUEST_FAILED error for each record in the
+        chunk instead of raising the exception.
+
+        Args:
+            operation_type (str): The operation to perform: insert, update,
+                                  upsert or delete
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            object_api_name (str): REQUIRED WITH UPSERT. The API Name of the
+                                   object being upserted
+            all_or_none (bool): Indicates whether to roll back the chunk when
+                                any record in it fails.
+            run_assignment_rules (bool): If true this will add the assginment
+                                         rule header to the requests.
+            external_id_field_name (str): The external Id field used for
+                                          upserts.
+
+        Returns:
+            function: A function that takes a list of records (or Ids for a
+                      delete) and returns the list of results.
+        """
+        if operation_type == 'insert':
+            send_chunk = lambda chunk: Standard.create_sobject_rows(chunk, all_or_none, run_assignment_rules,
+                                                                    access_token, instance_url)
+        elif operation_type == 'update':
+            send_chunk = lambda chunk: Standard.update_sobject_rows(chunk, all_or_none, run_assignment_rules,
+                                                                    access_token, instance_url)
+        elif operation_type == 'upsert':
+            if object_api_name is None:
+                raise ValueError('object_api_name is required for an upsert')
+
+            send_chunk = lambda chunk: Standard.upsert_sobject_rows(object_api_name, chunk, access_token,
+                                                                    instance_url, all_or_none, run_assignment_rules,
+                                                                    external_id_field_name)
+        elif operation_type == 'delete':
+            send_chunk = lambda chunk: Standard.delete_sobject_rows(chunk, all_or_none, access_token, instance_url)
+        else:
+            raise ValueError('Unsupported collection operation: {}'.format(operation_type))
+
+        def run_chunk(record_chunk):
+            try:
+                return send_chunk(record_chunk)
+            except requests.exceptions.RequestException as e:
+                error = {'statusCode': 'REQUEST_FAILED', 'message': str(e), 'fields': []}
+                return [{'success': False, 'errors': [error]} for record in record_chunk]
+
+        return run_chunk
+
+    @staticmethod
+    def perform_collection_operation(operation_type, records, access_token, instance_url, object_api_name=None,
+                                     all_or_none=False, run_assignment_rules=False, external_id_field_name='Id',
+                                     batch_size=COLLECTION_MAX_RECORDS, max_workers=DEFAULT_MAX_WORKERS,
+                                     max_retries=0, retry_wait=1):
+        """
+        Runs an sObject Collections insert, update, upsert or delete for any
+        number of records. The records are split into chunks of up to 200
+        records (delete chunks are also kept short enough for the URL), the
+        chunks are sent on a pool of max_workers threads, and the results are
+        returned in the same order as the records.
+
+        all_or_none is applied to each chunk separately. If a record fails with
+        all_or_none set to True, only the other records in the same chunk are
+        rolled back; chunks that already succeeded are not. If a whole chunk
+        request fails, each record in that chunk gets a REQUEST_FAILED error
+        with the exception message.
+
+        Args:
+            operation_type (str): The operation to perform: insert, update,
+                                  upsert or delete
+            records (list): The records to send. These are the same record
+                            dicts used by create_sobject_rows,
+                            update_sobject_rows and upsert_sobject_rows. For a
+                            delete this is the list of record Ids.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            object_api_name (str): REQUIRED WITH UPSERT. The API Name of the
+                                   object being upserted
+            all_or_none (bool): Indicates whether to roll back the rest of a
+                                chunk when any record in it fails.
+            run_assignment_rules (bool): If true this will add the assginment
+                                         rule header to the requests. This is
+                                         ignored for deletes.
+            external_id_field_name (str): The external Id field used for
+                                          upserts. Defaults to the record Id
+                                          field.
+            batch_size (int): The number of records sent in each request. This
+                              can't be more than 200.
+            max_workers (int): The maximum number of requests sent at once
+            max_retries (int): The number of times records with transient
+                               failures are resent with
+                               Util.resubmit_failures. Defaults to 0, which
+                               doesn't resend anything.
+            retry_wait (float): The number of seconds to wait before the first
+                                retry, doubling for each retry after that
+
+        Returns:
+            list: A list with the result for each record in the same order as
+                  the records.
+                  example:
+                  [
+                      {
+                          "id": "001xx000003DGb2AAG",
+                          "success": true,
+                          "errors": []
+                      },
+                      {
+                          "success": false,
+                          "errors": [
+                              {
+                                  "statusCode": "REQUEST_FAILED",
+                                  "message": "500 Server Error: ...",
+                                  "fields": []
+                              }
+                          ]
+                      }
+                  ]
+        """
+        if batch_size > COLLECTION_MAX_RECORDS:
+            raise ValueError('sObject Collections requests can have at most {} records'.format(COLLECTION_MAX_RECORDS))
+
+        records = list(records)
+        send_chunk = Standard.get_collection_sender(operation_type, access_token, instance_url, object_api_name,
+                                                    all_or_none, run_assignment_rules, external_id_field_name)
+
+        if operation_type == 'delete':
+            delete_url = instance_url + Standard.base_standard_uri + 'v' + API_VERSION + \
+                '/composite/sobjects?ids=&allOrNone=false'
+            chunked_records_list = Util.chunk_joined(records, batch_size, MAX_URL_LENGTH - len(delete_url))
+        else:
+            chunked_records_list = Util.chunk(records, batch_size)
+
+        results_list = []
+
+        for chunk_results in Util.map_concurrent(send_chunk, chunked_records_list, max_workers):
+            results_list.extend(chunk_results)
+
+        if max_retries:
+            resend_records = lambda retry_records, retry_batch_size: Standard.perform_collection_operation(
+                operation_type, retry_records, access_token, instance_url, object_api_name, all_or_none,
+                run_assignment_rules, external_id_field_name, retry_batch_size, max_workers)
+            results_list = Util.resubmit_failures(records, results_list, resend_records, batch_size, max_retries,
+                                                  retry_wait)
+
+        return results_list
+
+    @staticmethod
+    def perform_lock_aware_operation(operation_type, records, lock_key_field, access_token, instance_url,
+                                     object_api_name=None, all_or_none=False, run_assignment_rules=False,
+                                     external_id_field_name='Id', max_workers=DEFAULT_MAX_WORKERS, max_retries=3,
+                                     retry_wait=1):
+        """
+        Runs an sObject Collections operation in parallel without children of
+        the same parent locking each other. The records are split into
+        max_workers lanes by the lock key field (see Util.get_lock_key_lanes),
+        the lanes run at the same time and each lane sends its records in
+        chunks of 200 one after another, so two requests for the same parent
+        are never in flight at once. Records that still fail with a transient
+        error such as UNABLE_TO_LOCK_ROW, e.g. because of other jobs in the
+        org, are resent with Util.resubmit_failures.
+
+        Args:
+            operation_type (str): The operation to perform: insert, update,
+                                  upsert or delete
+            records (list): The record dicts to send. For a delete, each record
+                            needs the Id and the lock key field.
+            lock_key_field (str): The parent lookup the records lock on, e.g.
+                                  AccountId for Contacts or OpportunityId for
+                                  OpportunityLineItems
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            object_api_name (str): REQUIRED WITH UPSERT. The API Name of the
+                                   object being upserted
+            all_or_none (bool): Indicates whether to roll back the rest of a
+                                chunk when any record in it fails.
+            run_assignment_rules (bool): If true this will add the assginment
+                                         rule header to the requests.
+            external_id_field_name (str): The external Id field used for
+                                          upserts.
+            max_workers (int): The number of lanes run at the same time
+            max_retries (int): The maximum number of times to resend a record
+                               that failed with a transient error
+            retry_wait (float): The number of seconds to wait before the first
+                                retry, doubling for each retry after that
+
+        Returns:
+            list: A list with the result for each record in the same order as
+                  the records, as described in perform_collection_operation.
+        """
+        send_chunk = Standard.get_collection_sender(operation_type, access_token, instance_url, object_api_name,
+                                                    all_or_none, run_assignment_rules, external_id_field_name)
+
+        def send_records(record_list, batch_size):
+            results = [None] * len(record_list)
+
+            def run_lane(lane):
+                for batch in Util.chunk(lane, batch_size):
+                    if operation_type == 'delete':
+                        record_chunk = [record_list[index]['Id'] for index in batch]
+                    else:
+                        record_chunk = [record_list[index] for index in batch]
+
+                    for index, result in zip(batch, send_chunk(record_chunk)):
+                        results[index] = result
+
+            Util.map_concurrent(run_lane, Util.get_lock_key_lanes(record_list, lock_key_field, max_workers),
+                                max_workers)
+
+            return results
+
+        records = list(records)
+
+        return Util.resubmit_failures(records, send_records(records, COLLECTION_MAX_RECORDS), send_records,
+                                      COLLECTION_MAX_RECORDS, max_retries, retry_wait)
+
+    @staticmethod
+    def query(query_string, access_token, instance_url):
+        """
+        Executes the specified SOQL query. If the query results are too large,
+        the response contains the first batch of results and a query identifier
+        in the nextRecordsUrl field of the response. The identifier can be used
+        in an additional request to retrieve the next batch.
+
+        Args:
+            query_string (str): This query you'd like to run
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns the query results, if they are too large, then it
+                    will also return a nextRecordsUrl to get more records.
+        """
+        query_uri = '/query/?q='
+        header_details = Util.get_standard_header(access_token)
+        url_encoded_query = urllib.parse.quote(query_string)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri + url_encoded_query,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def query_all(query_string, access_token, instance_url):
+        """
+        Executes the specified SOQL query. If the query results are too large,
+        the response contains the first batch of results and a query identifier
+        in the nextRecordsUrl field of the response. The identifier can be used
+        in an additional request to retrieve the next batch. The difference
+        between this and query is that query all can retrieve deleted records.
+
+        Args:
+            query_string (str): This query you'd like to run
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns the query results, if they are too large, then it
+                    will also return a nextRecordsUrl to get more records.
+        """
+        query_uri = '/queryAll/?q='
+        header_details = Util.get_standard_header(access_token)
+        url_encoded_query = urllib.parse.quote(query_string)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri + url_encoded_query,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def explain(query_string, access_token, instance_url):
+        """
+        Gets the query plans Salesforce would consider for the given SOQL query
+        without running it. The plans are returned in order of preference, so
+        the first plan is the one that would be used. A relativeCost above 1
+        means the query isn't selective and will likely run as a full scan.
+        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/dome_query_explain.htm
+
+        Args:
+            query_string (str): The query you'd like the plan for
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: returns the query plans for the query.
+                example:
+                {
+                    "plans" : [ {
+                        "cardinality" : 1,
+                        "fields" : [ "CreatedDate" ],
+                        "leadingOperationType" : "Index",
+                        "notes" : [ ],
+                        "relativeCost" : 0.0,
+                        "sobjectCardinality" : 3,
+                        "sobjectType" : "Merchandise__c"
+                    }, {
+                        "cardinality" : 1,
+                        "fields" : [ ],
+                        "leadingOperationType" : "TableScan",
+                        "notes" : [ ],
+                        "relativeCost" : 0.65,
+                        "sobjectCardinality" : 3,
+                        "sobjectType" : "Merchandise__c"
+                    } ]
+                }
+        """
+        explain_uri = '/query/?explain='
+        header_details = Util.get_standard_header(access_token)
+        url_encoded_query = urllib.parse.quote(query_string)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + explain_uri + url_encoded_query,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def explain_report(queries, access_token, instance_url, base_query=None):
+        """
+        Runs explain for each of the candidate queries and ranks them from the
+        cheapest to the most expensive leading plan. This is meant to be run
+        before a large export to pick the filter or partitioning key that is
+        selective enough to use an index instead of a full table scan.
+
+        Args:
+            queries (list): The candidate SOQL queries to compare. If base_query
+                            is provided, these are the predicates that will be
+                            formatted into the base_query instead, e.g.:
+                                ["CreatedDate = LAST_N_DAYS:30",
+                                 "OwnerId = '005xx000001Sv6lAAC'"]
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            base_query (str): Optional query with a {} placeholder where each of
+                              the predicates will be inserted, e.g.:
+                                  "SELECT Id FROM Account WHERE {}"
+
+        Returns:
+            list: A list of the candidates ordered from the lowest to the highest
+                  relative cost of their leading plan. A relativeCost of None
+                  means Salesforce returned no plans for the query and those
+                  are ranked last.
+                  example:
+                  [
+                      {
+                          "query": "SELECT Id FROM Account WHERE CreatedDate = LAST_N_DAYS:30",
+                          "predicate": "CreatedDate = LAST_N_DAYS:30",
+                          "leadingOperationType": "Index",
+                          "relativeCost": 0.2,
+                          "cardinality": 4210,
+                          "sobjectCardinality": 1500000,
+                          "fields": ["CreatedDate"],
+                          "notes": [],
+                          "selective": true,
+                          "plans": [<all plans returned by explain>]
+                      }
+                  ]
+        """
+        report = []
+
+        for candidate in queries:
+            predicate = None
+            query_string = candidate
+
+            if base_query != None:
+                predicate = candidate
+                query_string = base_query.format(candidate)
+
+            plans = Standard.explain(query_string, access_token, instance_url).get('plans', [])
+            leading_plan = plans[0] if plans else {}
+            relative_cost = leading_plan.get('relativeCost')
+
+            report.append({
+                'query': query_string,
+                'predicate': predicate,
+                'leadingOperationType': leading_plan.get('leadingOperationType'),
+                'relativeCost': relative_cost,
+                'cardinality': leading_plan.get('cardinality'),
+                'sobjectCardinality': leading_plan.get('sobjectCardinality'),
+                'fields': leading_plan.get('fields', []),
+                'notes': leading_plan.get('notes', []),
+                'selective': relative_cost != None and relative_cost < 1,
+                'plans': plans
+            })
+
+        report.sort(key=lambda entry: (entry['relativeCost'] is None, entry['relativeCost'] or 0,
+                                       entry['cardinality'] or 0))
+
+        return report
+
+    @staticmethod
+    def search(search_string, access_token, instance_url):
+        """
+        Executes the specified SOSL search. If the search results are too large,
+        the response contains the first batch of results and a search identifier
+        in the nextRecordsUrl field of the response. The identifier can be used
+        in an additional request to retrieve the next batch. The difference
+        between this and search is that search all can retrieve deleted records.
+
+        Args:
+            search_string (str): This search you'd like to run
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns the search results, if they are too large, then it
+                    will also return a nextRecordsUrl to get more records.
+
+        """
+        search_uri = '/search/?q='
+        header_details = Util.get_standard_header(access_token)
+        url_encoded_search = urllib.parse.quote(search_string)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + search_uri + url_encoded_search,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def reset_users_password(user_id, access_token, instance_url):
+        """
+        Resets a users' password.
+
+        Args:
+            user_id (str):      The user id of the user who's password should be reset
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns information about the password reset
+        """
+        query_uri = f'/sobjects/User/{user_id}/password'
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.delete_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri, None,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def get_current_user_info(access_token, instance_url):
+        """
+        Gets information about the currently logged in user.
+
+        Args:
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns information about the current user
+        """
+        query_uri = '/chatter/users/me'
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def post_chatter_mention(text, mention_id, subject_id, access_token, instance_url):
+        """
+        Posts a chatter mention. E.g. @someone
+
+        Args:
+            text (str): The text to go after the mention
+            mention_id (str): The id of the user/group you want to mention
+            subject_id (str): The id of the object you want to attach the comment to
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: returns the query results, if they are too large, then it
+                    will also return a nextRecordsUrl to get more records.
+        """
+        query_uri = '/chatter/feed-elements'
+        header_details = Util.get_standard_header(access_token)
+        request_body = {}
+        request_body['body'] = {}
+        request_body['body']["messageSegments"] = [{"type": "Mention", "id": mention_id}, {'type': 'Text', "text": text}]
+        request_body["feedElementType"] = "FeedItem"
+        request_body["subjectId"] = subject_id
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri, data_body_json,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def get_next_query_batch(next_record_url, access_token, instance_url):
+        """
+        Does a GET on the url passed. If the query results are still too large,
+        the response contains the first batch of results and a query identifier
+        in the nextRecordsUrl field of the response. The identifier can be used
+        in an additional request to retrieve the next batch.
+
+        Args:
+            next_record_url (str): The url of the next record
+            access_token (str)   : This is the access_token value received from the
+                                   login response
+            instance_url (str)   : This is the instance_url value received from the
+                                   login response
+
+        Returns:
+            object: returns the query results, if they are too large, then it
+                    will also return a nextRecordsUrl to get more records.
+        """
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(instance_url + next_record_url,
+            header_details)
+
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def get_updated(object_name, start_date_time, end_date_time, access_token, instance_url):
+        """
+        Retrieves the list of individual records that have been updated (added
+        or changed) within the given timespan for the specified object. SObject
+        Get Updated is available in API version 29.0 and later.
+
+        This resource is commonly used in data replication applications. Note
+        the following considerations:
+            * Results are returned for no more than 30 days previous to the day
+              the call is executed.
+            * Your client application can replicate any objects to which it has
+              sufficient permissions. For example, to replicate all data for
+              your organization, your client application must be logged in with
+              “View All Data” access rights to the specified object. Similarly,
+              the objects must be within your sharing rules.
+            * There is a limit of 600,000 IDs returned from this resource. If
+              more than 600,000 IDs would be returned, EXCEEDED_ID_LIMIT is
+              returned. You can correct the error by choosing start and end
+              dates that are closer together.
+
+        Args:
+            object_name (str): The name of the object to get updated records for.
+
+            startDateTime (datetime): Starting date/time (Coordinated Universal
+                Time (UTC) time zone—not local— timezone) of the timespan for
+                which to retrieve the data. The API ignores the seconds portion
+                of the specified dateTime value (for example, 12:30:15 is
+                interpreted as 12:30:00 UTC).
+
+            start_date_time (datetime): Ending date/time (Coordinated Universal
+                Time (UTC) time zone—not local— timezone) of the timespan for
+                which to retrieve the data. The API ignores the seconds portion
+                of the specified dateTime value (for example, 12:35:15 is
+                interpreted as 12:35:00 UTC).
+
+            access_token (str): This is the access_token value received from the
+                                login response
+
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: Returns a dictionary containing the record Ids that were
+                updated and the latest record updated in that window.
+                {
+                    'ids': ['<id 1>', ..., '<id N>'],
+                    'latestDateCovered': '2020-03-13T12:00:00.000+0000'
+                }
+        """
+        get_updated_uri = '/sobjects/' + object_name + '/updated/?start=' + \
+            urllib.parse.quote(start_date_time.strftime('%Y-%m-%dT%H:%M:%SZ')) + '&end=' + \
+            urllib.parse.quote(end_date_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_updated_uri,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def retrieve(object_name, ids, fields, access_token, instance_url):
+        """
+        Use a GET or POST request with sObject Collections to retrieve one or
+        more records of the same object type. A list of sObjects that represents
+        the individual records of the specified type is returned. The number of
+        sObjects returned matches the number of IDs passed in the request.
+
+        You can specify approximately 800 IDs before the URL length causes the
+        HTTP 414 error URI too long. To retrieve more records than the URL
+        length can accommodate, use a POST request to retrieve up to 2,000
+        records of the same object type. If you use POST, the IDs and fields of
+        the records to retrieve are specified in the request body.
+
+        Args:
+            object_name (str): The name of the object to get updated records for.
+
+            ids (list): A list of one or more IDs of the objects to return. All
+                IDs must belong to the same object type.
+
+            fields (list): A list of fields to include in the response. The
+                field names you specify must be valid, and you must have
+                read-level permissions to each field.
+
+            access_token (str): This is the access_token value received from the
+                login response
+
+            instance_url (str): This is the instance_url value received from the
+                login response
+
+        Returns:
+            list: A list of dicts with the Salesforce records: Example:
+            [
+                {
+                    "attributes" : {
+                        "type" : "Account",
+                        "url" : "/services/data/v51.0/sobjects/Account/001xx000003DGb1AAG"
+                    },
+                    "Id" : "001xx000003DGb1AAG",
+                    "Name" : "Acme"
+                },
+                {
+                    "attributes" : {
+                         "type" : "Account",
+                        "url" : "/services/data/v51.0/sobjects/Account/001xx000003DGb0AAG"
+                    },
+                    "Id" : "001xx000003DGb0AAG",
+                    "Name" : "Global Media"
+                },
+                None
+            ]
+        """
+        retrieve_uri = '/composite/sobjects/' + object_name
+        header_details = Util.get_standard_header(access_token)
+
+        request_body = {}
+        request_body['ids'] = ids
+        request_body['fields'] = fields
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + retrieve_uri, data_body_json,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def iter_retrieve(object_name, ids, fields, access_token, instance_url, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Retrieves any number of records of the same object type. Duplicate IDs
+        are removed, the IDs are split into POST requests of up to 2,000 IDs
+        for Standard.retrieve, and up to max_workers requests are sent at once.
+        Each chunk is yielded as soon as its request completes, so the chunks
+        are not in the order of the IDs.
+
+        Args:
+            object_name (str): The name of the object to retrieve records for.
+
+            ids (list): A list of IDs of the objects to return. All IDs must
+                belong to the same object type.
+
+            fields (list): A list of fields to include in the response.
+
+            access_token (str): This is the access_token value received from the
+                login response
+
+            instance_url (str): This is the instance_url value received from the
+                login response
+
+            max_workers (int): The maximum number of requests sent at once
+
+        Returns:
+            tuple: Yields (chunk_ids, records) for each chunk where records is
+                the list returned by Standard.retrieve for the chunk_ids, in
+                the same order and with None for IDs that weren't found.
+        """
+        unique_ids = list(dict.fromkeys(ids))
+
+        retrieve_chunk = lambda chunk_ids: Standard.retrieve(object_name, chunk_ids, fields, access_token,
+                                                             instance_url)
+
+        for chunk_ids, records in Util.iter_concurrent(retrieve_chunk, Util.chunk(unique_ids, RETRIEVE_MAX_IDS),
+                                                       max_workers):
+            yield chunk_ids, records
+
+    @staticmethod
+    def retrieve_many(object_name, ids, fields, access_token, instance_url, max_workers=DEFAULT_MAX_WORKERS,
+                      key_by_id=False):
+        """
+        Retrieves any number of records of the same object type using
+        Standard.iter_retrieve and puts the records back in the order of the
+        IDs.
+
+        Args:
+            object_name (str): The name of the object to retrieve records for.
+
+            ids (list): A list of IDs of the objects to return. All IDs must
+                belong to the same object type.
+
+            fields (list): A list of fields to include in the response.
+
+            access_token (str): This is the access_token value received from the
+                login response
+
+            instance_url (str): This is the instance_url value received from the
+                login response
+
+            max_workers (int): The maximum number of requests sent at once
+
+            key_by_id (bool): If True, return a dict keyed by the requested IDs
+                instead of a list.
+
+        Returns:
+            list: A list with the record for each of the IDs in the same order
+                as the IDs, with None for IDs that weren't found. Duplicate
+                IDs get the same record. If key_by_id is True, this is a dict
+                of the requested ID to the record instead.
+        """
+        records_by_id = {}
+
+        for chunk_ids, records in Standard.iter_retrieve(object_name, ids, fields, access_token, instance_url,
+                                                         max_workers):
+            records_by_id.update(zip(chunk_ids, records))
+
+        if key_by_id:
+            return records_by_id
+
+        return [records_by_id.get(record_id) for record_id in ids]
+
+    @staticmethod
+    def get_deleted(object_name, start_date_time, end_date_time, access_token, instance_url):
+        """
+        Retrieves the list of individual records that have been deleted within
+        the given timespan for the specified object. SObject Get Deleted is
+        available in API version 29.0 and later.
+
+        This resource is commonly used in data replication applications. Note
+        the following considerations:
+            * Results are returned for no more than 30 days previous to the day
+              the call is executed.
+            * Your client application can replicate any objects to which it has
+              sufficient permissions. For example, to replicate all data for
+              your organization, your client application must be logged in with
+              “View All Data” access rights to the specified object. Similarly,
+              the objects must be within your sharing rules.
+            * There is a limit of 600,000 IDs returned from this resource. If
+              more than 600,000 IDs would be returned, EXCEEDED_ID_LIMIT is
+              returned. You can correct the error by choosing start and end
+              dates that are closer together.
+
+        Args:
+            object_name (str): The name of the object to get deleted records for.
+
+            startDateTime (datetime): Starting date/time (Coordinated Universal
+                Time (UTC) time zone—not local— timezone) of the timespan for
+                which to retrieve the data. The API ignores the seconds portion
+                of the specified dateTime value (for example, 12:30:15 is
+                interpreted as 12:30:00 UTC).
+
+            start_date_time (datetime): Ending date/time (Coordinated Universal
+                Time (UTC) time zone—not local— timezone) of the timespan for
+                which to retrieve the data. The API ignores the seconds portion
+                of the specified dateTime value (for example, 12:35:15 is
+                interpreted as 12:35:00 UTC).
+
+            access_token (str): This is the access_token value received from the
+                                login response
+
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: Returns a dictionary containing the record Ids that were
+                deleted and the latest record deleted in that window.
+                {
+                    'ids': ['<id 1>', ..., '<id N>'],
+                    'latestDateCovered': '2020-03-13T12:00:00.000+0000'
+                }
+        """
+        get_deleted_uri = '/sobjects/' + object_name + '/deleted/?start=' + \
+            urllib.parse.quote(start_date_time.strftime('%Y-%m-%dT%H:%M:%SZ')) + '&end=' + \
+            urllib.parse.quote(end_date_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_deleted_uri,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def batch_request(batch_requests, halt_on_error, access_token, instance_url, run_assignment_rules=False):
+        """
+        https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_batch.htm
+
+        Executes up to 25 independent subrequests in a single call. Each
+        subrequest counts against the rate limits, but the batch only takes
+        one round trip.
+
+        Args:
+            batch_requests (list): The subrequests to run. The url is relative
+                to /services/data/ and a body is passed as richInput, e.g.:
+                [{
+                    "method": "PATCH",
+                    "url": "v50.0/sobjects/Account/001D000000K0fXOIAZ",
+                    "richInput": {"Name": "NewName"}
+                }, {
+                    "method": "GET",
+                    "url": "v50.0/sobjects/Account/001D000000K0fXOIAZ?fields=Name"
+                }]
+
+            halt_on_error (bool): If True, the subrequests after the first one
+                that fails are not run.
+
+            access_token (str): This is the access_token value received from the
+                                login response
+
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+            run_assignment_rules (bool): If true this will add the assginment
+                rule header to the request.
+
+        Returns:
+            dict: The results of the subrequests in the same order.
+                {
+                    "hasErrors": false,
+                    "results": [
+                        {
+                            "statusCode": 204,
+                            "result": null
+                        },
+                        {
+                            "statusCode": 200,
+                            "result": {
+                                "attributes": {...},
+                                "Name": "NewName",
+                                "Id": "001D000000K0fXOIAZ"
+                            }
+                        }
+                    ]
+                }
+        """
+        batch_uri = '/composite/batch'
+
+        header_details = Util.get_standard_header(access_token)
+        header_details["Sforce-Auto-Assign"] = "true" if run_assignment_rules else "false"
+
+        request_body = {}
+        request_body['haltOnError'] = halt_on_error
+        request_body['batchRequests'] = batch_requests
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + batch_uri, data_body_json,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def graph_composite_request(request_body, access_token, instance_url):
+        """
+        https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_graph_introduction.htm#!
+
+        Composite graphs provide an enhanced way to perform composite requests,
+        which execute a series of REST API requests in a single call.
+          * Regular composite requests allow you to execute a series of REST API
+            requests in a single call. And you can use the output of one request
+            as the input to a subsequent request.
+          * Composite graphs extend this by allowing you to assemble a more
+            complicated and complete series of related objects and records.
+          * Composite graphs also enable you to ensure that the steps in a given
+            set of operations are either all completed or all not completed.
+            This avoids requiring you to check for a mix of successful and
+            unsuccessful results.
+          * Regular composite requests have a limit of 25 subrequests. Composite
+            graphs increase this limit to 500. This gives a single API call much
+            greater power.
+
+        Args:
+            request_body (dict): The request body contains a list of graphs.
+                Each graph must have a graphId, and a composite request. The
+                composite requests are then built just like the original
+                composite requests. An example request looks like this:
+                {
+                   "graphs": [{
+                      "graphId": "graph1",
+                      "compositeRequest": [{
+                            "body": {
+                               "name": "Cloudy Consulting"
+                            },
+                            "method": "POST",
+                            "referenceId": "reference_id_account_1",
+                            "url": "/services/data/v50.0/sobjects/Account/"
+                         },
+                         {
+                            "body": {
+                               "FirstName": "Nellie",
+                               "LastName": "Cashman",
+                               "AccountId": "@{reference_id_account_1.id}"
+                            },
+                            "method": "POST",
+                            "referenceId": "reference_id_contact_1",
+                            "url": "/services/data/v50.0/sobjects/Contact/"
+                         }
+                      ]
+                   }]
+                }
+
+            access_token (str): This is the access_token value received from the
+                                login response
+
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: The dict returns an object containing a list of the graphs and
+                the results.
+                {
+                    "graphs": [
+                        {
+                            "graphId": "graph1",
+                            "graphResponse": {
+                                "compositeResponse": {
+                                    <response from the composite request>
+                                }
+                            }
+                        }
+                    ]
+                }
+
+            output_records = salesforce_records["graphs"][0]["graphResponse"]["compositeResponse"]
+        """
+        graph_uri = '/composite/graph'
+
+        header_details = Util.get_standard_header(access_token)
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + graph_uri, data_body_json,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def create_sobject_tree(object_name, records, access_token, instance_url):
+        """
+        https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobject_tree.htm
+
+        Creates one or more sObject trees with root records of the specified
+        type. A request can have up to 200 records across all trees and up to 5
+        levels, and the whole request is rolled back if any record fails.
+
+        Args:
+            object_name (str): The API name of the root records.
+
+            records (list): The root records. Each record has attributes with
+                the type and a unique referenceId, and child records are nested
+                under their child relationship name, e.g.:
+                [{
+                    "attributes": {"type": "Account", "referenceId": "ref1"},
+                    "Name": "SampleAccount1",
+                    "Contacts": {
+                        "records": [{
+                            "attributes": {"type": "Contact", "referenceId": "ref2"},
+                            "LastName": "Smith"
+                        }]
+                    }
+                }]
+
+            access_token (str): This is the access_token value received from the
+                                login response
+
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: The new record Id for each referenceId.
+                {
+                    "hasErrors": false,
+                    "results": [
+                        {"referenceId": "ref1", "id": "001D000000K0fXOIAZ"},
+                        {"referenceId": "ref2", "id": "003D000000QV9n2IAD"}
+                    ]
+                }
+        """
+        tree_uri = '/composite/tree/' + object_name
+
+        header_details = Util.get_standard_header(access_token)
+
+        request_body = {}
+        request_body['records'] = records
+
+        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+
+        response = webservice.Tools.post_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + tree_uri, data_body_json,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def insert_sobject_trees(object_name, records, relationships, access_token, instance_url,
+                             max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Inserts parents and children in as few sObject tree requests as
+        possible from a flat list of records. Each child's parent field holds
+        the referenceId of its parent in the same list, which relationships
+        uses to nest the child under the parent. The trees are packed into
+        requests of up to 200 records, the requests are sent on a pool of
+        max_workers threads, and the new Ids are returned in the order of the
+        records.
+
+        Args:
+            object_name (str): The API name of the root records.
+
+            records (list): The flat list of records. Each record has
+                attributes with its type and a referenceId. If the referenceId
+                is missing, one that isn't used by another record is assigned.
+                A ValueError is raised if two records have the same
+                referenceId. e.g.:
+                [{
+                    "attributes": {"type": "Account", "referenceId": "acme"},
+                    "Name": "Acme"
+                }, {
+                    "attributes": {"type": "Contact"},
+                    "AccountId": "acme",
+                    "LastName": "Smith"
+                }]
+
+            relationships (dict): The parent field and child relationship name
+                for each child object type, e.g.:
+                {"Contact": {"field": "AccountId", "relationship": "Contacts"}}
+                A parent field that doesn't hold a referenceId from records is
+                sent as a normal field value.
+
+            access_token (str): This is the access_token value received from the
+                                login response
+
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+            max_workers (int): The maximum number of requests sent at once
+
+        Returns:
+            list: The result for each of the records in the same order. If any
+                record in a request fails, the request is rolled back and every
+                record in it has success set to False. The records Salesforce
+                rejected have its errors, and if the whole request fails, each
+                record gets a REQUEST_FAILED error.
+                [{
+                    "referenceId": "acme",
+                    "id": "001D000000K0fXOIAZ",
+                    "success": true,
+                    "errors": []
+                }, ...]
+        """
+        reference_ids = []
+        tree_records = {}
+        given_reference_ids = set()
+
+        for record in records:
+            reference_id = record.get('attributes', {}).get('referenceId')
+
+            if reference_id != None:
+                if reference_id in given_reference_ids:
+                    raise ValueError('More than one record has the referenceId {}'.format(reference_id))
+
+                given_reference_ids.add(reference_id)
+
+        reference_count = 0
+
+        for record in records:
+            attributes = dict(record.get('attributes', {}))
+
+            # the assigned referenceIds skip the ones in the records
+            while 'referenceId' not in attributes:
+                if 'ref' + str(reference_count) not in given_reference_ids:
+                    attributes['referenceId'] = 'ref' + str(reference_count)
+
+                reference_count += 1
+
+            reference_ids.append(attributes['referenceId'])
+            tree_records[attributes['referenceId']] = dict(record, attributes=attributes)
+
+        roots = []
+
+        for reference_id in reference_ids:
+            tree_record = tree_records[reference_id]
+            relationship = relationships.get(tree_record['attributes']['type'])
+            parent_reference_id = tree_record.get(relationship['field']) if relationship else None
+
+            if parent_reference_id in tree_records:
+                parent_record = tree_records[parent_reference_id]
+                del tree_record[relationship['field']]
+                parent_record.setdefault(relationship['relationship'], {'records': []})
+                parent_record[relationship['relationship']]['records'].append(tree_record)
+            elif tree_record['attributes']['type'] == object_name:
+                roots.append(tree_record)
+            else:
+                raise ValueError('Record {} is not a {} and has no parent in the records'.format(
+                    reference_id, object_name))
+
+        def get_tree_size(tree_record, depth):
+            if depth > TREE_MAX_DEPTH:
+                raise ValueError('sObject trees can be at most {} levels deep'.format(TREE_MAX_DEPTH))
+
+            size = 1
+
+            for relationship in relationships.values():
+                for child_record in tree_record.get(relationship['relationship'], {}).get('records', []):
+                    size += get_tree_size(child_record, depth + 1)
+
+            return size
+
+        # first fit decreasing, largest trees first
+        requests_list = []
+
+        for size, root in sorted([(get_tree_size(root, 1), root) for root in roots], key=lambda tree: -tree[0]):
+            if size > TREE_MAX_RECORDS:
+                raise ValueError('The tree for {} has {} records, which is more than the {} allowed'.format(
+                    root['attributes']['referenceId'], size, TREE_MAX_RECORDS))
+
+            for tree_request in requests_list:
+                if tree_request['size'] + size <= TREE_MAX_RECORDS:
+                    break
+            else:
+                tree_request = {'size': 0, 'records': [], 'reference_ids': []}
+                requests_list.append(tree_request)
+
+            tree_request['size'] += size
+            tree_request['records'].append(root)
+
+        def collect_reference_ids(tree_record, reference_id_list):
+            reference_id_list.append(tree_record['attributes']['referenceId'])
+
+            for relationship in relationships.values():
+                for child_record in tree_record.get(relationship['relationship'], {}).get('records', []):
+                    collect_reference_ids(child_record, reference_id_list)
+
+        for tree_request in requests_list:
+            for root in tree_request['records']:
+                collect_reference_ids(root, tree_request['reference_ids'])
+
+        def send_tree_request(tree_request):
+            try:
+                response = Standard.create_sobject_tree(object_name, tree_request['records'], access_token,
+                                                        instance_url)
+            except requests.exceptions.RequestException as e:
+                # a rolled back tree comes back as a 400 with the errors of the records that failed
+                try:
+                    return e.response.json()['results']
+                except (AttributeError, KeyError, TypeError, ValueError):
+                    error = {'statusCode': 'REQUEST_FAILED', 'message': str(e), 'fields': []}
+                    return [{'referenceId': reference_id, 'errors': [error]}
+                            for reference_id in tree_request['reference_ids']]
+
+            return response['results']
+
+        results_by_reference_id = {}
+
+        for tree_results in Util.map_concurrent(send_tree_request, requests_list, max_workers):
+            for tree_result in tree_results:
+                results_by_reference_id[tree_result['referenceId']] = tree_result
+
+        results = []
+
+        for reference_id in reference_ids:
+            tree_result = results_by_reference_id.get(reference_id, {})
+            results.append({
+                'referenceId': reference_id,
+                'id': tree_result.get('id'),
+                'success': tree_result.get('id') != None,
+                'errors': tree_result.get('errors', [])
+            })
+
+        return results
+
+    @staticmethod
+    def build_composite_graphs(record_trees, max_nodes=GRAPH_MAX_NODES):
+        """
+        Builds composite graphs that insert a forest of parent/child record
+        trees. Every record gets a referenceId, each child's parent field is
+        set to the @{referenceId.id} of its parent, and the trees are packed
+        into as few graphs as possible without going over max_nodes per graph.
+        A tree is never split across graphs, so a failure only rolls back the
+        graph it is in.
+
+        Args:
+            record_trees (list): The trees to insert. Each node has the object
+                name, the record fields and its children. Each child also has
+                the parent_field that looks up to its parent, e.g.:
+                [{
+                    "object": "Account",
+                    "record": {"Name": "Cloudy Consulting"},
+                    "children": [{
+                        "object": "Contact",
+                        "parent_field": "AccountId",
+                        "record": {"FirstName": "Nellie", "LastName": "Cashman"},
+                        "children": []
+                    }]
+                }]
+
+            max_nodes (int): The maximum number of records in a graph. This
+                can't be more than 500.
+
+        Returns:
+            tuple: The list of graphs to send with Standard.graph_composite_request
+                and, for each of the record_trees in the same order, the
+                graphId it was packed into and its nodes in parent before
+                child order:
+                [{
+                    "graphId": "graph0",
+                    "nodes": [{
+                        "referenceId": "ref0",
+                        "object": "Account",
+                        "record": {"Name": "Cloudy Consulting"}
+                    }, ...]
+                }]
+        """
+        if max_nodes > GRAPH_MAX_NODES:
+            raise ValueError('Composite graphs can have at most {} nodes'.format(GRAPH_MAX_NODES))
+
+        tree_requests = []
+        reference_count = 0
+
+        for record_tree in record_trees:
+            nodes = []
+            composite_request = []
+            stack = [(record_tree, None, 1)]
+
+            while stack:
+                node, parent_reference_id, depth = stack.pop()
+
+                if depth > GRAPH_MAX_DEPTH:
+                    raise ValueError('Composite graphs can be at most {} levels deep'.format(GRAPH_MAX_DEPTH))
+
+                reference_id = 'ref' + str(reference_count)
+                reference_count += 1
+
+                body = dict(node['record'])
+
+                if parent_reference_id != None:
+                    body[node['parent_field']] = '@{' + parent_reference_id + '.id}'
+
+                nodes.append({'referenceId': reference_id, 'object': node['object'], 'record': node['record']})
+                composite_request.append({
+                    'method': 'POST',
+                    'url': Standard.base_standard_uri + 'v' + API_VERSION + '/sobjects/' + node['object'] + '/',
+                    'referenceId': reference_id,
+                    'body': body
+                })
+
+                for child in reversed(node.get('children', [])):
+                    stack.append((child, reference_id, depth + 1))
+
+            if len(nodes) > max_nodes:
+                raise ValueError('A record tree has {} records, which is more than the {} allowed in a graph'.format(
+                    len(nodes), max_nodes))
+
+            tree_requests.append((nodes, composite_request))
+
+        # first fit decreasing, largest trees first
+        graphs = []
+        tree_graphs = [None] * len(tree_requests)
+
+        for tree_index in sorted(range(len(tree_requests)), key=lambda index: -len(tree_requests[index][0])):
+            nodes, composite_request = tree_requests[tree_index]
+
+            for graph in graphs:
+                if len(graph['compositeRequest']) + len(composite_request) <= max_nodes:
+                    break
+            else:
+                graph = {'graphId': 'graph' + str(len(graphs)), 'compositeRequest': []}
+                graphs.append(graph)
+
+            graph['compositeRequest'].extend(composite_request)
+            tree_graphs[tree_index] = {'graphId': graph['graphId'], 'nodes': nodes}
+
+        return graphs, tree_graphs
+
+    @staticmethod
+    def insert_record_graphs(record_trees, access_token, instance_url, max_nodes=GRAPH_MAX_NODES,
+                             max_graphs_per_request=GRAPH_REQUEST_MAX_GRAPHS, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Inserts a forest of parent/child record trees with composite graphs.
+        The trees are packed into graphs with Standard.build_composite_graphs,
+        the graphs are grouped into requests of up to max_graphs_per_request
+        graphs, the requests are sent on a pool of max_workers threads, and
+        each graph response is mapped back to the records it inserted.
+
+        Args:
+            record_trees (list): The trees to insert, as described in
+                Standard.build_composite_graphs
+
+            access_token (str): This is the access_token value received from the
+                                login response
+
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+            max_nodes (int): The maximum number of records in a graph.
+
+            max_graphs_per_request (int): The maximum number of graphs in each
+                composite graph request.
+
+            max_workers (int): The maximum number of requests sent at once
+
+        Returns:
+            list: The result for each of the record_trees in the same order.
+                The graph is either entirely committed or entirely rolled back,
+                which isSuccessful shows. Each node has the httpStatusCode and
+                body of its subresponse, where the body has the new id on
+                success or the errors on failure. If the request with a graph
+                fails, the graph is unsuccessful and each of its nodes has a
+                REQUEST_FAILED error with no httpStatusCode, while the graphs
+                of the other requests keep their responses.
+                [{
+                    "graphId": "graph0",
+                    "isSuccessful": true,
+                    "nodes": [{
+                        "referenceId": "ref0",
+                        "object": "Account",
+                        "record": {"Name": "Cloudy Consulting"},
+                        "httpStatusCode": 201,
+                        "body": {"id": "001R00000064wc7IAA", "success": true, "errors": []}
+                    }, ...]
+                }]
+        """
+        graphs, tree_graphs = Standard.build_composite_graphs(record_trees, max_nodes)
+
+        def send_graphs(request_graphs):
+            try:
+                return Standard.graph_composite_request({'graphs': request_graphs}, access_token, instance_url)
+            except requests.exceptions.RequestException as e:
+                error = {'errorCode': 'REQUEST_FAILED', 'message': str(e)}
+                return {'graphs': [{'graphId': graph['graphId'], 'isSuccessful': False, 'graphResponse': {
+                    'compositeResponse': [{'referenceId': subrequest['referenceId'], 'httpStatusCode': None,
+                                           'body': [error]} for subrequest in graph['compositeRequest']]}}
+                    for graph in request_graphs]}
+
+        graph_responses = {}
+
+        for response in Util.map_concurrent(send_graphs, Util.chunk(graphs, max_graphs_per_request), max_workers):
+            for graph_response in response['graphs']:
+                graph_responses[graph_response['graphId']] = graph_response
+
+        results = []
+
+        for tree_graph in tree_graphs:
+            graph_response = graph_responses.get(tree_graph['graphId'], {})
+            subresponses = {}
+
+            for subresponse in graph_response.get('graphResponse', {}).get('compositeResponse', []):
+                subresponses[subresponse['referenceId']] = subresponse
+
+            nodes = []
+
+            for node in tree_graph['nodes']:
+                subresponse = subresponses.get(node['referenceId'], {})
+                nodes.append(dict(node, httpStatusCode=subresponse.get('httpStatusCode'),
+                                  body=subresponse.get('body')))
+
+            results.append({'graphId': tree_graph['graphId'],
+                            'isSuccessful': graph_response.get('isSuccessful', False),
+                            'nodes': nodes})
+
+        return results
+
+    @staticmethod
+    def get_object_describe(object_name, modified_since_date, access_token, instance_url):
+        """
+        Completely describes the individual metadata at all levels for the
+        specified object. For example, this can be used to retrieve the fields,
+        URLs, and child relationships for the Account object.
+
+        The If-Modified-Since header param should be provided as GMT time if it
+        is provided. If the object metadata has not changed since the provided
+        date, a 304 Not Modified status code is returned, with no response body.
+
+        Args:
+            object_name (str): The name of the object to get the describe
+                details for.
+
+            modified_since_date (datetime): If None, this header will not be
+                used. If provided, it will converted to appropriate format for
+                the header and time should be in GMT.
+
+            access_token (str): This is the access_token value received from the
+                login response
+
+            instance_url (str): This is the instance_url value received from the
+                login response
+        Returns:
+            dict: Returns a dictionary with the metadata description of the
+                given object.
+        """
+        describe_uri = "/sobjects/{}/describe/".format(object_name)
+
+        header_details = Util.get_standard_header(access_token)
+
+        if modified_since_date:
+            modified_since_date = modified_since_date.strftime('%a, %-d %b %Y %H:%M:%S GMT')
+            header_details["If-Modified-Since"] = modified_since_date
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + describe_uri,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def limits(access_token, instance_url):
+        """
+        Lists the org limits with the maximum and remaining allocation for
+        each limit, e.g. the remaining daily API requests.
+
+        Args:
+            access_token (str): This is the access_token value received from the
+                login response
+
+            instance_url (str): This is the instance_url value received from the
+                login response
+        Returns:
+            dict: Returns a dictionary keyed by limit name.
+                {
+                    "DailyApiRequests": {
+                        "Max": 15000,
+                        "Remaining": 14998
+                    },
+                    ...
+                }
+        """
+        limits_uri = '/limits/'
+
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + limits_uri,
+            header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+
+class Bulk:
+    """
+    This class is used for doing bulk operations. Please use this and not the
+    Standard class singular methods when you're performing DML operations. This
+    is faster and will use fewer of your API calls.
+    API details here: https://developer.salesforce.com/docs/atlas.en-us.api_asynch.meta/api_asynch/asynch_api_intro.htm
+    examples here: https://trailhead-salesforce-com.firelayers.net/en/api_basics/api_basics_bulk
+    Considerations here: https://developer.salesforce.com/docs/atlas.en-us.salesforce_app_limits_cheatsheet.meta/salesforce_app_limits_cheatsheet/salesforce_app_limits_platform_bulkapi.htm
+    """
+    base_bulk_uri = '/services/async/' + API_VERSION
+    batch_uri = '/job/'
+
+    @staticmethod
+    def get_status_check(job_id, access_token, instance_url):
+        """
+        This method returns the function JobPoller calls to check on a job.
+        Progress is measured in batches, so the poller can estimate when the
+        job will finish.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            function: Returns a function that gets the job info and returns
+                      (is_done, job_info, finished_batches, total_batches)
+        """
+        header_details = Util.get_bulk_header(access_token)
+
+        def status_check():
+            response = webservice.Tools.get_http_response(
+                instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id, header_details)
+            json_response = Util.parse_bulk_info(response)
+
+            total_jobs_run = json_response['numberBatchesCompleted'] + json_response['numberBatchesFailed']
+
+            return (total_jobs_run == json_response['numberBatchesTotal'], json_response, total_jobs_run,
+                    json_response['numberBatchesTotal'])
+
+        return status_check
+
+    @staticmethod
+    def print_job_status(json_response):
+        """
+        This method prints the batch counts of a job.
+
+        Args:
+            json_response (dict): The job info
+        """
+        print("Batches completed/failed/total: {}/{}/{}".format(json_response['numberBatchesCompleted'],
+                                                                json_response['numberBatchesFailed'],
+                                                                json_response['numberBatchesTotal']))
+
+    @staticmethod
+    def get_job_status(job_id, polling_wait, verbose, access_token, instance_url):
+        """
+        This method is used for printing job status. If verbose = False, it will
+        ignore the print statements.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll. If None, the job is polled
+                                adaptively by the shared JobPoller.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            objects: Prints the status of the bulk job and polls for an update
+                     until every batch is completed or failed, then it returns
+                     the final job status response.
+        """
+        if verbose:
+            print("Status for job: {}".format(job_id))
+
+        def print_status(json_response, seconds_left):
+            if verbose:
+                Bulk.print_job_status(json_response)
+
+        status_check = Bulk.get_status_check(job_id, access_token, instance_url)
+
+        return JobPoller.get_default().submit(status_check, print_status, polling_wait).result()
+
+    @staticmethod
+    def get_batch_result(job_id, batch_id, access_token, instance_url):
+        """
+        This method will retrieve the results of a batch operation.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            batch_id (str): This is the batch Id returned when creating a new
+                            batch
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            array: Returns the an array containing the results for each record
+                   in the given batch. The results of CSV jobs are converted
+                   with Util.get_bulk_csv_result so they have the same keys as
+                   the JSON results. For a query job this is the list of query
+                   result ids.
+        """
+        header_details = Util.get_bulk_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch/' + batch_id + '/result',
+            header_details)
+
+        return Util.parse_bulk_response(response, Util.get_bulk_csv_result)
+
+    @staticmethod
+    def get_query_result(job_id, batch_id, query_result_id, access_token, instance_url):
+        """
+        This method will retrieve the results of a batch operation.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            batch_id (str): This is the batch Id returned when creating a new
+                            batch
+            query_result_id (str): Ths is the Id returned with a successful
+                                   batch for a Salesforce bulk query.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            array: Returns the an array containing the results for the query
+                   request. The rows of a CSV job are dicts of the column values
+                   as strings.
+        """
+        header_details = Util.get_bulk_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch/' + batch_id + '/result' + '/' + query_result_id,
+            header_details)
+
+        return Util.parse_bulk_response(response)
+
+    @staticmethod
+    def download_query_result(job_id, batch_id, query_result_id, file_object, access_token, instance_url):
+        """
+        This method streams a query result set into a file instead of reading
+        it into memory.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            batch_id (str): This is the batch Id returned when creating a new
+                            batch
+            query_result_id (str): Ths is the Id returned with a successful
+                                   batch for a Salesforce bulk query.
+            file_object (file): The binary file to write the result set to
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            str: Returns the Content-Type of the result set
+        """
+        header_details = Util.get_bulk_header(access_token)
+
+        response = webservice.Tools.download_http_response(
+            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch/' + batch_id + '/result' + '/' + query_result_id,
+            header_details, file_object)
+
+        return response.headers.get('Content-Type', '')
+
+    @staticmethod
+    def iter_query_results(job_id, result_sets, access_token, instance_url, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        This generator downloads query result sets on up to max_workers threads
+        and yields their rows. Each result set is streamed to a temporary file
+        and parsed incrementally as its rows are consumed, so the memory used
+        depends on max_workers rather than on the size of the results. The
+        result sets are yielded in the order their downloads finish.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            result_sets (iterable): The (batch_id, query_result_id) of each
+                                    result set. This can be a generator that
+                                    yields the result sets as their batches
+                                    complete.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            max_workers (int): The maximum number of result sets downloaded at
+                               once
+
+        Returns:
+            dict: Yields each row of the result sets. The rows of a CSV job are
+                  dicts of the column values as strings.
+        """
+        def download(result_set):
+            result_file = tempfile.TemporaryFile()
+
+            try:
+                result_content_type = Bulk.download_query_result(job_id, result_set[0], result_set[1], result_file,
+                                                                 access_token, instance_url)
+            except Exception:
+                result_file.close()
+                raise
+
+            result_file.seek(0)
+
+            return result_file, result_content_type
+
+        for result_set, (result_file, result_content_type) in Util.iter_concurrent(download, result_sets,
+                                                                                   max_workers):
+            with io.TextIOWrapper(result_file, encoding='utf-8', newline='') as text_file:
+                if 'csv' in result_content_type:
+                    rows = csv.DictReader(text_file)
+                else:
+                    rows = Util.iter_json_array(text_file)
+
+                for row in rows:
+                    yield row
+
+    @staticmethod
+    def add_batch(job_id, data_body, access_token, instance_url, content_type='JSON'):
+        """
+        This method adds a batch to an open job. Salesforce queues the batch for
+        processing as soon as it's added.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            data_body (str): The batch records serialized for the job's content
+                             type, or the query for a query job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            content_type (str): The contentType of the job: JSON, CSV, ZIP_CSV
+                                or ZIP_JSON
+
+        Returns:
+            dict: Returns the batch info, including the batch id and state
+        """
+        header_details = Util.get_bulk_header(access_token)
+        header_details['Content-Type'] = BULK_CONTENT_TYPES[content_type]
+
+        job_batch_response = webservice.Tools.post_http_response(
+            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch', data_body, header_details)
+        json_job_batch_response = Util.parse_bulk_info(job_batch_response)
+
+        return json_job_batch_response
+
+    @staticmethod
+    def get_batch_info(job_id, batch_id, access_token, instance_url):
+        """
+        This method retrieves the state of a single batch.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            batch_id (str): This is the batch Id returned when creating a new
+                            batch
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: Returns the batch info, including the state, stateMessage and
+                  numberRecordsProcessed
+        """
+        header_details = Util.get_bulk_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch/' + batch_id, header_details)
+
+        return Util.parse_bulk_info(response)
+
+    @staticmethod
+    def get_batch_info_list(job_id, access_token, instance_url):
+        """
+        This method retrieves the state of every batch in a job, including the
+        batches Salesforce creates for a PK chunked query.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            array: Returns the batch info of each batch in the job
+        """
+        header_details = Util.get_bulk_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch', header_details)
+
+        return Util.parse_bulk_info(response).get('batchInfo', [])
+
+    @staticmethod
+    def iter_completed_batches(job_id, polling_wait, verbose, access_token, instance_url, include_failed=False,
+                               poller=None):
+        """
+        This generator polls the batches of a job and yields the info of each
+        batch as soon as it completes, so its results can be downloaded while
+        the other batches are still processing. The NotProcessed batch left
+        behind by PK chunking is skipped. The batches are polled by a
+        JobPoller, so its deadlines and timeouts apply, and closing the
+        generator early stops the polling.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the job. If None, the
+                                wait adapts to the progress of the batches.
+            verbose (bool): If True, print the batch status while polling
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            include_failed (bool): If True, failed batches are yielded like the
+                                   completed ones instead of raising an error
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
+
+        Returns:
+            dict: Yields the batch info of each completed batch. If a batch
+                  fails, a RuntimeError is raised with its stateMessage.
+        """
+        if poller is None:
+            poller = JobPoller.get_default()
+
+        batch_events = queue.Queue()
+        yielded_batch_ids = set()
+
+        if verbose:
+            print("Status for job: {}".format(job_id))
+
+        # like BulkJob.check_bulk_status, each poll hands the batch list to this generator through the queue
+        def status_check():
+            batch_info_list = Bulk.get_batch_info_list(job_id, access_token, instance_url)
+            batch_events.put(('batches', batch_info_list))
+            finished_count = len([batch_info for batch_info in batch_info_list
+                                  if batch_info['state'] in ('Completed', 'Failed', 'NotProcessed')])
+
+            if verbose:
+                print("Batches completed/total: {}/{}".format(finished_count, len(batch_info_list)))
+
+            return finished_count == len(batch_info_list), None, finished_count, len(batch_info_list)
+
+        future = poller.submit(status_check, polling_wait=polling_wait)
+        future.add_done_callback(lambda future: batch_events.put(('done', future)))
+
+        try:
+            while True:
+                event, value = batch_events.get()
+
+                if event == 'done':
+                    if not value.cancelled():
+                        value.result()
+
+                    return
+
+                for batch_info in value:
+                    if batch_info['state'] == 'Failed' and not include_failed:
+                        raise RuntimeError('Batch {} of job {} failed: {}'.format(batch_info['id'], job_id,
+                                                                                 batch_info.get('stateMessage')))
+
+                    if batch_info['state'] in ('Completed', 'Failed') and batch_info['id'] not in yielded_batch_ids:
+                        yielded_batch_ids.add(batch_info['id'])
+                        yield batch_info
+        finally:
+            future.cancel()
+
+    @staticmethod
+    def iter_query_rows(object_api_name, query, query_all, access_token, instance_url, verbose=True,
+                        content_type='JSON', pk_chunking=False, chunk_size=None, parent=None, start_row=None,
+                        polling_wait=None, max_workers=DEFAULT_MAX_WORKERS, poller=None):
+        """
+        This generator runs a bulk query and yields the rows as the result sets
+        are downloaded. With PK chunking, Salesforce splits the query into a
+        batch for each range of record Ids, and the result sets of each batch
+        are streamed with Bulk.iter_query_results as soon as that batch
+        completes, while the rest are still processing. The rows aren't in any
+        particular order.
+
+        Args:
+            object_api_name (str): The API Name of the object being queried
+            query (str): The query you'd like to run to retrieve records
+            query_all (bool): State whether or not this query should query all
+                              records (so you can get deleted records)
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            verbose (bool): If True, print the batch status while polling
+            content_type (str): The format of the results, JSON or CSV
+            pk_chunking (bool): If True, send the Sforce-Enable-PKChunking
+                                header so the query is split into chunks
+            chunk_size (int): The number of records in each PK chunk
+            parent (str): The parent object to chunk on when querying a sharing
+                          object, e.g. Account for AccountShare
+            start_row (str): The record Id to start the first PK chunk at
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the batches. If None,
+                                the wait adapts to the progress of the batches.
+            max_workers (int): The maximum number of result sets downloaded at
+                               once
+            poller (JobPoller): The poller that polls the batches. Defaults to
+                                JobPoller.get_default()
+
+        Returns:
+            dict: Yields each row of the query results
+        """
+        header_details = Util.get_bulk_header(access_token)
+
+        if pk_chunking:
+            header_details['Sforce-Enable-PKChunking'] = Util.get_pk_chunking_header(chunk_size, parent, start_row)
+
+        query_type = 'query'
+
+        if query_all:
+            query_type = 'queryAll'
+
+        # create the bulk job
+        job_body_details = Util.get_bulk_job_body(object_api_name, query_type, None, None, content_type=content_type)
+        create_job_json_body = json.dumps(job_body_details, indent=4, separators=(',', ': '))
+        job_create_response = webservice.Tools.post_http_response(instance_url + Bulk.base_bulk_uri + Bulk.batch_uri,
+                                                                  create_job_json_body, header_details)
+        json_job_create_response = json.loads(job_create_response.text)
+        job_id = json_job_create_response['id']
+
+        # create the query request batch, which PK chunking splits into a batch for each chunk
+        Bulk.add_batch(job_id, query, access_token, instance_url, content_type)
+
+        # close the bulk job
+        close_body = {'state': 'Closed'}
+        json_close_body = json.dumps(close_body, indent=4, separators=(',', ': '))
+        webservice.Tools.post_http_response(instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id,
+                                            json_close_body, Util.get_bulk_header(access_token))
+
+        def iter_result_sets():
+            for batch_info in Bulk.iter_completed_batches(job_id, polling_wait, verbose, access_token, instance_url,
+                                                          poller=poller):
+                for query_result_id in Bulk.get_batch_result(job_id, batch_info['id'], access_token, instance_url):
+                    yield batch_info['id'], query_result_id
+
+        for row in Bulk.iter_query_results(job_id, iter_result_sets(), access_token, instance_url, max_workers):
+            yield row
+
+    @staticmethod
+    def submit_bulk_operation(object_api_name, records, batch_size, operation_type, external_id_field_name,
+                              access_token, instance_url, concurrency_mode=None, chunker=None,
+                              upload_workers=DEFAULT_MAX_WORKERS, content_type='JSON',
+                              max_batch_bytes=BULK_BATCH_MAX_BYTES, polling_wait=None, verbose=False, poller=None,
+                              checkpoint_path=None, batch_encoder=None):
+        """
+        This method creates a bulk job, uploads the records as its batches and
+        closes it, then returns right away with a BulkJob handle instead of
+        waiting for Salesforce to process the job. The handle is polled in the
+        background by a JobPoller, so many jobs can run at once without a
+        thread for each. Use BulkJob.wait_any or BulkJob.wait_all to wait on
+        them.
+
+        If a batch fails to upload, no more batches are uploaded, the job is
+        aborted and the upload error is raised.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (array): The list of records to send. For example:
+                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
+            batch_size (int): The maximum number of records in each batch
+            operation_type (str): This is the operation being performed: delete,
+                                  insert, upsert, update, hardDelete
+            external_id_field_name (str): The external Id field used for
+                                          upserts
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            concurrency_mode (str): Parallel or Serial. See
+                                    Bulk.perform_bulk_operation
+            chunker (function): Optional function called as
+                                chunker(records, batch_size) that returns the
+                                record batches. Defaults to Util.pack_by_size
+                                with batch_size and max_batch_bytes.
+            upload_workers (int): The maximum number of batches uploaded at
+                                  once
+            content_type (str): The format the batches are sent in: JSON, CSV,
+                                ZIP_CSV or ZIP_JSON
+            max_batch_bytes (int): The maximum size of a batch in bytes when
+                                   chunker isn't provided
+            polling_wait (int): The number of seconds between polls. If None,
+                                the job is polled adaptively.
+            verbose (bool): If True, print the job status while polling
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
+            checkpoint_path (str): Optional path of a BulkCheckpoint journal. If
+                                   it already has a job, that job is picked up
+                                   again: the records that were already
+                                   uploaded are skipped and the rest are added
+                                   to it. The batches are uploaded one at a
+                                   time so the journal always knows which
+                                   records each batch holds, and the job is
+                                   left open when an upload fails so it can
+                                   be resumed.
+            batch_encoder (function): Optional function called with each batch
+                                      that returns its body. Defaults to
+                                      Util.get_bulk_batch_body with
+                                      content_type.
+
+        Returns:
+            BulkJob: Returns the handle of the submitted job
+        """
+        header_details = Util.get_bulk_header(access_token)
+        body_details = {}
+
+        if external_id_field_name != None:
+            body_details = Util.get_bulk_job_body(object_api_name, operation_type, None, concurrency_mode,
+                                                  external_id_field_name, content_type=content_type)
+        else:
+            body_details = Util.get_bulk_job_body(object_api_name, operation_type, None, concurrency_mode,
+                                                  content_type=content_type)
+
+        if chunker is None and content_type in ('CSV', 'ZIP_CSV'):
+            chunker = lambda chunk_records, n: Util.pack_csv_by_size(chunk_records, n, max_batch_bytes)
+        elif chunker is None:
+            chunker = lambda chunk_records, n: Util.pack_by_size(chunk_records, n, max_batch_bytes)
+
+        if batch_encoder is None:
+            batch_encoder = lambda record_chunk: Util.get_bulk_batch_body(record_chunk, content_type)
+
+        checkpoint = None
+        uploaded_count = 0
+
+        if checkpoint_path != None:
+            checkpoint = BulkCheckpoint(checkpoint_path)
+            upload_workers = 1
+
+        if checkpoint != None and checkpoint.job != None:
+            job_id = checkpoint.job['job_id']
+            Bulk.reconcile_checkpoint(checkpoint, access_token, instance_url)
+
+            if checkpoint.upload_complete:
+                return BulkJob('bulk', job_id, access_token, instance_url, checkpoint.get_batch_ids(),
+                               polling_wait=polling_wait, verbose=verbose, poller=poller, checkpoint=checkpoint)
+
+            # skip the records that are already in the job
+            uploaded_count = checkpoint.get_uploaded_count()
+
+            if isinstance(records, list):
+                records = records[uploaded_count:]
+            else:
+                records = itertools.islice(records, uploaded_count, None)
+        else:
+            # create the bulk job
+            create_job_json_body = json.dumps(body_details, indent=4, separators=(',', ': '))
+            job_create_response = webservice.Tools.post_http_response(
+                instance_url + Bulk.base_bulk_uri + Bulk.batch_uri, create_job_json_body, header_details)
+            json_job_create_response = json.loads(job_create_response.text)
+            job_id = json_job_create_response['id']
+
+            if checkpoint != None:
+                checkpoint.record('job', api='bulk', job_id=job_id, object=object_api_name, operation=operation_type)
+
+        job_url = instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id
+        chunked_records_list = chunker(records, batch_size)
+        batch_ids = []
+        batch_futures = []
+        upload_errors = []
+
+        def upload_batch(batch_body, offset, count):
+            # the upload stops at the first failed batch
+            if upload_errors:
+                raise RuntimeError('Batch at record {} wasn\'t uploaded because an earlier batch failed'.format(offset))
+
+            try:
+                batch_info = Bulk.add_batch(job_id, batch_body, access_token, instance_url, content_type)
+            except Exception as e:
+                upload_errors.append(e)
+
+                for batch_future in list(batch_futures):
+                    batch_future.cancel()
+
+                raise
+
+            if checkpoint != None:
+                checkpoint.record('batch', id=batch_info['id'], offset=offset, count=count)
+
+            return batch_info
+
+        # loop through the record batches, and add them to the processing queue. Salesforce starts processing
+        # each batch as soon as it's queued, and the next batch is serialized while the previous ones upload.
+        # Only a few batches wait for a free upload worker at a time so they aren't all held in memory.
+        upload_workers = max(1, upload_workers or 1)
+        upload_slots = threading.BoundedSemaphore(upload_workers * 2)
+        offset = uploaded_count
+
+        with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+            for record_chunk in chunked_records_list:
+                if upload_errors:
+                    break
+
+                batch_body = batch_encoder(record_chunk)
+
+                if checkpoint != None:
+                    checkpoint.record('pending_batch', offset=offset, count=len(record_chunk))
+
+                upload_slots.acquire()
+                batch_future = executor.submit(upload_batch, batch_body, offset, len(record_chunk))
+                batch_future.add_done_callback(lambda future: upload_slots.release())
+                batch_futures.append(batch_future)
+                offset += len(record_chunk)
+
+            if upload_errors:
+                for batch_future in batch_futures:
+                    batch_future.cancel()
+
+        if upload_errors:
+            # a checkpointed job is left open so it can be resumed, any other job is thrown away
+            if checkpoint == None:
+                abort_body = json.dumps({'state': 'Aborted'}, indent=4, separators=(',', ': '))
+
+                try:
+                    webservice.Tools.post_http_response(job_url, abort_body, header_details)
+                except Exception:
+                    # the upload error is raised either way
+                    pass
+
+            raise upload_errors[0]
+
+        for batch_future in batch_futures:
+            batch_ids.append(batch_future.result()['id'])
+
+        if checkpoint != None:
+            batch_ids = checkpoint.get_batch_ids()
+
+        # close the bulk job
+        close_body = {'state': 'Closed'}
+        json_close_body = json.dumps(close_body, indent=4, separators=(',', ': '))
+        webservice.Tools.post_http_response(job_url, json_close_body, header_details)
+
+        if checkpoint != None:
+            checkpoint.record('upload_complete')
+
+        return BulkJob('bulk', job_id, access_token, instance_url, batch_ids, polling_wait=polling_wait,
+                       verbose=verbose, poller=poller, checkpoint=checkpoint)
+
+    @staticmethod
+    def reconcile_checkpoint(checkpoint, access_token, instance_url):
+        """
+        This method brings a BulkCheckpoint up to date with the job in
+        Salesforce after a crash. A batch that Salesforce accepted before its
+        Id could be written to the journal is matched to the oldest pending
+        batch, which works because checkpointed batches are uploaded one at a
+        time. A job that was closed before that was written is marked as
+        uploaded.
+
+        Args:
+            checkpoint (BulkCheckpoint): The checkpoint of the job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+        """
+        job_id = checkpoint.job['job_id']
+        header_details = Util.get_bulk_header(access_token)
+
+        response = webservice.Tools.get_http_response(
+            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id, header_details)
+        job_info = Util.parse_bulk_info(response)
+
+        if job_info['state'] in ['Aborted', 'Failed']:
+            raise RuntimeError('Job {} in {} is {} and can\'t be resumed'.format(job_id, checkpoint.path,
+                                                                                 job_info['state']))
+
+        if checkpoint.upload_complete:
+            return
+
+        known_batch_ids = set(checkpoint.get_batch_ids())
+        unknown_batch_ids = [batch_info['id'] for batch_info in Bulk.get_batch_info_list(job_id, access_token,
+                                                                                          instance_url)
+                             if batch_info['id'] not in known_batch_ids]
+        pending_batches = sorted(checkpoint.pending_batches, key=lambda pending_batch: pending_batch['offset'])
+
+        if len(unknown_batch_ids) > len(pending_batches):
+            raise RuntimeError('Job {} has {} batches that aren\'t in {}'.format(job_id, len(unknown_batch_ids),
+                                                                                checkpoint.path))
+
+        for batch_id, pending_batch in zip(unknown_batch_ids, pending_batches):
+            checkpoint.record('batch', id=batch_id, offset=pending_batch['offset'], count=pending_batch['count'])
+
+        if job_info['state'] == 'Closed':
+            checkpoint.record('upload_complete')
+
+    @staticmethod
+    def perform_bulk_operation(object_api_name, records, batch_size, operation_type, polling_wait,
+                               external_id_field_name, access_token, instance_url, concurrency_mode=None,
+                               verbose=True, chunker=None, max_retries=0, retry_wait=5,
+                               upload_workers=DEFAULT_MAX_WORKERS, content_type='JSON',
+                               max_batch_bytes=BULK_BATCH_MAX_BYTES, checkpoint_path=None, on_batch_result=None):
+        """
+        This method updates a list of records provided as an object.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (array): The list of records that needs to be updated. This
+                             Should be provided as an array. For example:
+                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
+            batch_size (int): This is the batch size of the records to process.
+                              If you were to pass 5000 records into the process
+                              with a batch size of 1000, then there would be 5
+                              batches processed.
+            operation_type (str): This is the operation being performed: delete,
+                                  insert, query, upsert, update, hardDelete
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the job. If None, the
+                                job is polled adaptively by the shared
+                                JobPoller.
+            external_id_field_name (str): This is the external Id field that is
+                                          used to determine whether this record
+                                          will be inserted or updated. This is
+                                          required for upserts, but will default
+                                          to the record Id field
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            concurrency_mode (str): Can't update after creation. The concurrency
+                                    mode for the job. The valid values are:
+                                    Parallel: Process batches in parallel mode.
+                                              This is the default value.
+                                    Serial: Process batches in serial mode.
+                                            Processing in parallel can cause
+                                            database contention. When this is
+                                            severe, the job may fail. If
+                                            you're experiencing this issue,
+                                            submit the job with serial
+                                            concurrency mode. This guarantees
+                                            that batches are processed one at
+                                            a time. Note that using this
+                                            option may significantly increase
+                                            the processing time for a job.
+            verbose (bool): If True, print the job status while polling
+            chunker (function): Optional function called as
+                                chunker(records, batch_size) that returns the
+                                record batches. Defaults to Util.pack_by_size
+                                with batch_size and max_batch_bytes. The
+                                results are returned in the order of the
+                                batches.
+            max_retries (int): The number of times records with transient
+                               failures are resent in a new job with
+                               Util.resubmit_failures. Defaults to 0, which
+                               doesn't resend anything.
+            retry_wait (float): The number of seconds to wait before the first
+                                retry, doubling for each retry after that
+            upload_workers (int): The maximum number of batches uploaded at
+                                  once. The next batch is serialized while the
+                                  previous ones upload.
+            content_type (str): The format the batches are sent in: JSON, CSV,
+                                ZIP_CSV or ZIP_JSON. Defaults to JSON. The
+                                results have the same format either way.
+            max_batch_bytes (int): The maximum size of a batch in bytes when
+                                   chunker isn't provided. Batches are closed
+                                   early so wide records don't go over the
+                                   Bulk API limit. None only limits the number
+                                   of records.
+            checkpoint_path (str): Optional path of a BulkCheckpoint journal, so
+                                   calling this again after a crash picks the
+                                   job up where it stopped instead of loading
+                                   the records twice. Retries of transient
+                                   failures run as new jobs outside of the
+                                   checkpoint.
+            on_batch_result (function): Optional function called as
+                                        on_batch_result(batch_info, results) as
+                                        soon as each batch of the job finishes,
+                                        while the other batches are still
+                                        processing. results is None for a
+                                        failed batch. Retries aren't passed to
+                                        it.
+
+        Returns:
+            object: Returns an object containing the status for each record that
+                    was put into the batch
+        """
+        sent_records = []
+
+        if chunker is None and content_type in ('CSV', 'ZIP_CSV'):
+            chunker = lambda chunk_records, n: Util.pack_csv_by_size(chunk_records, n, max_batch_bytes)
+        elif chunker is None:
+            chunker = lambda chunk_records, n: Util.pack_by_size(chunk_records, n, max_batch_bytes)
+
+        # keep the records that were sent, in the order of their results, in case they need to be resent. A
+        # resumed job has results for records that were uploaded before, so it keeps all of them.
+        if max_retries and checkpoint_path != None:
+            records = list(records)
+            sent_records = records
+        elif max_retries:
+            batch_chunker = chunker
+
+            def chunker(chunk_records, n):
+                for record_chunk in batch_chunker(chunk_records, n):
+                    sent_records.extend(record_chunk)
+                    yield record_chunk
+
+        bulk_job = Bulk.submit_bulk_operation(object_api_name, records, batch_size, operation_type,
+                                              external_id_field_name, access_token, instance_url, concurrency_mode,
+                                              chunker, upload_workers, content_type, max_batch_bytes, polling_wait,
+                                              verbose, checkpoint_path=checkpoint_path)
+
+        # download the results of each batch as soon as it finishes, then put them back in the order of the batches
+        batch_results_by_id = {}
+        failed_batches = []
+
+        for batch_info, batch_results in bulk_job.iter_batch_results():
+            if batch_results is None:
+                failed_batches.append(batch_info)
+            else:
+                batch_results_by_id[batch_info['id']] = batch_results
+
+            if on_batch_result != None:
+                on_batch_result(batch_info, batch_results)
+
+        # the batches collected before a resume aren't yielded again, so their results are downloaded here
+        failed_batch_ids = set(batch_info['id'] for batch_info in failed_batches)
+        collected_batch_ids = [batch_id for batch_id in bulk_job.batch_ids
+                               if batch_id not in batch_results_by_id and batch_id not in failed_batch_ids]
+
+        if len(collected_batch_ids) > 0:
+            for batch_info in Bulk.get_batch_info_list(bulk_job.job_id, access_token, instance_url):
+                if batch_info['id'] in collected_batch_ids and batch_info['state'] == 'Failed':
+                    failed_batches.append(batch_info)
+
+        if len(failed_batches) > 0:
+            raise RuntimeError('Batch {} of job {} failed: {}'.format(failed_batches[0]['id'], bulk_job.job_id,
+                                                                     failed_batches[0].get('stateMessage')))
+
+        for batch_id, batch_results in zip(collected_batch_ids, Util.map_concurrent(bulk_job.get_batch_result,
+                                                                                     collected_batch_ids)):
+            batch_results_by_id[batch_id] = batch_results
+
+        results_list = [result for batch_id in bulk_job.batch_ids for result in batch_results_by_id[batch_id]]
+
+        if max_retries:
+            resend_records = lambda retry_records, retry_batch_size: Bulk.perform_bulk_operation(
+                object_api_name, retry_records, retry_batch_size, operation_type, polling_wait,
+                external_id_field_name, access_token, instance_url, concurrency_mode, verbose,
+                upload_workers=upload_workers, content_type=content_type, max_batch_bytes=max_batch_bytes)
+            results_list = Util.resubmit_failures(sent_records, results_list, resend_records, batch_size,
+                                                  max_retries, retry_wait)
+
+        return results_list
+
+    @staticmethod
+    def perform_attachment_operation(object_api_name, attachments, operation_type, polling_wait, access_token,
+                                     instance_url, content_type='ZIP_JSON', blob_field=None,
+                                     max_files=BULK_ZIP_MAX_FILES, max_batch_bytes=BULK_BATCH_MAX_BYTES,
+                                     upload_workers=DEFAULT_MAX_WORKERS, verbose=True, on_batch_result=None):
+        """
+        This method loads files as binary attachments with a Bulk API job
+        instead of a Standard.create_sobject_blob_record call for each file.
+        The files are streamed into zip batches with their records, the zips
+        are packed up to the Bulk API limits of max_files files and
+        max_batch_bytes bytes and uploaded in parallel, and the result of each
+        record is returned with the path of its file.
+
+        Example:
+            attachments = [({'Name': 'photo.jpg', 'ParentId': account_id}, '/tmp/photo.jpg')]
+            results = Bulk.perform_attachment_operation('Attachment', attachments, 'insert', None, access_token,
+                                                        instance_url)
+
+        Args:
+            object_api_name (str): The API Name of the object, like Attachment,
+                                   ContentVersion or Document
+            attachments (iterable): The (record, file_path) tuples to load. The
+                                    blob field of the record is filled in with
+                                    the file.
+            operation_type (str): insert, update or upsert
+            polling_wait (int): The number of seconds between polls. If None,
+                                the job is polled adaptively.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            content_type (str): ZIP_JSON or ZIP_CSV
+            blob_field (str): The field that holds the file. Defaults to the
+                              BlobField of the object in SOBJECT_BLOB_FIELDS
+            max_files (int): The maximum number of files in a zip
+            max_batch_bytes (int): The maximum size of the files and records in
+                                   a zip in bytes
+            upload_workers (int): The maximum number of zips uploaded at once
+            verbose (bool): If True, print the job status while polling
+            on_batch_result (function): Optional function called as
+                                        on_batch_result(batch_info, results) as
+                                        soon as each batch finishes. results is
+                                        None for a failed batch.
+
+        Returns:
+            array: Returns a (file_path, result) tuple for each attachment, in
+                   the order of the attachments
+        """
+        if blob_field is None:
+            if object_api_name not in SOBJECT_BLOB_FIELDS:
+                raise ValueError('blob_field is required for {}'.format(object_api_name))
+
+            blob_field = SOBJECT_BLOB_FIELDS[object_api_name]['BlobField']
+
+        attachments = list(attachments)
+        chunker = lambda chunk_attachments, n: Util.pack_by_size(chunk_attachments, n, max_batch_bytes,
+                                                                 Util.get_attachment_size)
+        batch_encoder = lambda attachment_chunk: Util.get_bulk_zip_body(attachment_chunk, content_type, blob_field)
+
+        bulk_job = Bulk.submit_bulk_operation(object_api_name, attachments, max_files, operation_type, None,
+                                              access_token, instance_url, chunker=chunker,
+                                              upload_workers=upload_workers, content_type=content_type,
+                                              polling_wait=polling_wait, verbose=verbose,
+                                              batch_encoder=batch_encoder)
+
+        batch_results_by_id = {}
+        failed_batches = []
+
+        for batch_info, batch_results in bulk_job.iter_batch_results():
+            if batch_results is None:
+                failed_batches.append(batch_info)
+            else:
+                batch_results_by_id[batch_info['id']] = batch_results
+
+            if on_batch_result != None:
+                on_batch_result(batch_info, batch_results)
+
+        if len(failed_batches) > 0:
+            raise RuntimeError('Batch {} of job {} failed: {}'.format(failed_batches[0]['id'], bulk_job.job_id,
+                                                                     failed_batches[0].get('stateMessage')))
+
+        results_list = [result for batch_id in bulk_job.batch_ids for result in batch_results_by_id[batch_id]]
+
+        return [(file_path, result) for (record, file_path), result in zip(attachments, results_list)]
+
+    @staticmethod
+    def perform_lock_aware_operation(object_api_name, records, lock_key_field, batch_size, operation_type,
+                                     polling_wait, external_id_field_name, access_token, instance_url,
+                                     max_retries=3, retry_wait=5, verbose=True):
+        """
+        Runs a Parallel mode bulk operation without children of the same parent
+        locking each other. The records are packed into batches with
+        Util.get_lock_key_batches so every parent is in a single batch, and
+        parents with more than batch_size records are split into batches that
+        are spread out in the batch order. Records that still fail with a
+        transient error such as UNABLE_TO_LOCK_ROW are resent in a new job
+        with Util.resubmit_failures.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (array): The list of records to send
+            lock_key_field (str): The parent lookup the records lock on, e.g.
+                                  AccountId for Contacts or OpportunityId for
+                                  OpportunityLineItems
+            batch_size (int): The maximum number of records in each batch
+            operation_type (str): This is the operation being performed: delete,
+                                  insert, upsert, update, hardDelete
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the job
+            external_id_field_name (str): The external Id field used for
+                                          upserts
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            max_retries (int): The maximum number of times to resend a record
+                               that failed with a transient error
+            retry_wait (float): The number of seconds to wait before the first
+                                retry, doubling for each retry after that
+            verbose (bool): If True, print the job status while polling
+
+        Returns:
+            object: Returns the result for each record in the same order as the
+                    records
+        """
+        def send_records(record_list, send_batch_size):
+            batches = Util.get_lock_key_batches(record_list, lock_key_field, send_batch_size)
+            ordered_indexes = [index for batch in batches for index in batch]
+
+            def chunker(ordered_records, n):
+                start = 0
+
+                for batch in batches:
+                    yield ordered_records[start:start + len(batch)]
+                    start += len(batch)
+
+            ordered_results = Bulk.perform_bulk_operation(object_api_name,
+                                                          [record_list[index] for index in ordered_indexes],
+                                                          send_batch_size, operation_type, polling_wait,
+                                                          external_id_field_name, access_token, instance_url,
+                                                          'Parallel', verbose, chunker)
+            results = [None] * len(record_list)
+
+            for index, result in zip(ordered_indexes, ordered_results):
+                results[index] = result
+
+            return results
+
+        records = list(records)
+
+        return Util.resubmit_failures(records, send_records(records, batch_size), send_records, batch_size,
+                                      max_retries, retry_wait)
+
+    @staticmethod
+    def insert_sobject_rows(object_api_name, records, batch_size, polling_wait, access_token, instance_url,
+                            concurrency_mode=None):
+        """
+        This method inserts a list of records provided as an object.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (array): The list of records that needs to be updated. This
+                             Should be provided as an array. For example:
+                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
+            batch_size (int): This is the batch size of the records to process.
+                              If you were to pass 5000 records into the process
+                              with a batch size of 1000, then there would be 5
+                              batches processed.
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                               login response
+            concurrency_mode (str): Can't update after creation. The concurrency
+                                    mode for the job. The valid values are:
+                                    Parallel: Process batches in parallel mode.
+                                              This is the default value.
+                                    Serial: Process batches in serial mode.
+                                            Processing in parallel can cause
+                                            database contention. When this is
+                                            severe, the job may fail. If
+                                            you're experiencing this issue,
+                                            submit the job with serial
+                                            concurrency mode. This guarantees
+                                            that batches are processed one at
+                                            a time. Note that using this
+                                            option may significantly increase
+                                            the processing time for a job.
+        Returns:
+            object: Returns an object containing the status for each record that
+                    was put into the batch
+        """
+        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, 'insert', polling_wait, None,
+                                             access_token, instance_url, concurrency_mode)
+
+        return result
+
+    @staticmethod
+    def update_sobject_rows(object_api_name, records, batch_size, polling_wait, access_token, instance_url,
+                            concurrency_mode=None):
+        """
+        This method updates a list of records provided as an object.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (array): The list of records that needs to be updated. This
+                             Should be provided as an array. For example:
+                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
+            batch_size (int): This is the batch size of the records to process.
+                              If you were to pass 5000 records into the process
+                              with a batch size of 1000, then there would be 5
+                              batches processed.
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            concurrency_mode (str): Can't update after creation. The concurrency
+                                    mode for the job. The valid values are:
+                                    Parallel: Process batches in parallel mode.
+                                              This is the default value.
+                                    Serial: Process batches in serial mode.
+                                            Processing in parallel can cause
+                                            database contention. When this is
+                                            severe, the job may fail. If
+                                            you're experiencing this issue,
+                                            submit the job with serial
+                                            concurrency mode. This guarantees
+                                            that batches are processed one at
+                                            a time. Note that using this
+                                            option may significantly increase
+                                            the processing time for a job.
+        Returns:
+            object: Returns an object containing the status for each record that
+                    was put into the batch
+        """
+        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, 'update', polling_wait, None,
+                                             access_token, instance_url, concurrency_mode)
+
+        return result
+
+    @staticmethod
+    def upsert_sobject_rows(object_api_name, records, batch_size, polling_wait, access_token, instance_url,
+                            external_id_field_name='Id', concurrency_mode=None):
+        """
+        This method upserts a list of records provided as an object.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (array): The list of records that needs to be updated. This
+                             Should be provided as an array. For example:
+                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
+            batch_size (int): This is the batch size of the records to process.
+                              If you were to pass 5000 records into the process
+                              with a batch size of 1000, then there would be 5
+                              batches processed.
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            external_id_field_name (str): This is the external Id field that is
+                                          used to determine whether this record
+                                          will be inserted or updated. This is
+                                          required for upserts, but will default
+                                          to the record Id field
+            concurrency_mode (str): Can't update after creation. The concurrency
+                                    mode for the job. The valid values are:
+                                    Parallel: Process batches in parallel mode.
+                                              This is the default value.
+                                    Serial: Process batches in serial mode.
+                                            Processing in parallel can cause
+                                            database contention. When this is
+                                            severe, the job may fail. If
+                                            you're experiencing this issue,
+                                            submit the job with serial
+                                            concurrency mode. This guarantees
+                                            that batches are processed one at
+                                            a time. Note that using this
+                                            option may significantly increase
+                                            the processing time for a job.
+        Returns:
+            @return               Returns an object containing the status for each
+                                  record that was put into the batch
+        """
+        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, 'upsert', polling_wait,
+                                             external_id_field_name, access_token, instance_url, concurrency_mode)
+
+        return result
+
+    @staticmethod
+    def delete_sobject_rows(object_api_name, records, hard_delete, batch_size, polling_wait, access_token,
+                            instance_url):
+        """
+        This method upserts a list of records provided as an object.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            records (array): The list of records that needs to be updated. This
+                             Should be provided as an array. For example:
+                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
+            hard_delete (bool): This Bool indicates whether or not the record
+                                should be hard deleted. NOTE: There is a profile
+                                System Permission option called "Bulk API Hard
+                                Delete" that must be enabled for this option to
+                                work.
+            batch_size (int): This is the batch size of the records to process.
+                              If you were to pass 5000 records into the process
+                              with a batch size of 1000, then there would be 5
+                              batches processed.
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll for updates on the job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            object: Returns an object containing the status for each record that
+                    was put into the batch
+        """
+        delete_type = 'delete'
+
+        if hard_delete:
+            delete_type = 'hardDelete'
+
+        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, delete_type, polling_wait, None,
+                                             access_token, instance_url)
+
+        return result
+
+    @staticmethod
+    def query_sobject_rows(object_api_name, query, query_all, access_token, instance_url, verbose=True,
+                           content_type='JSON', pk_chunking=False, chunk_size=None, parent=None, start_row=None,
+                           max_workers=DEFAULT_MAX_WORKERS):
+        """
+        This returns the result for a bulk query operations. See
+        Bulk.iter_query_rows to process the rows without holding them all.
+
+        Args:
+            object_api_name (str): The API Name of the object being updated
+            query (str): The query you'd like to run to retrieve records
+            query_all (bool): State whether or not this query should query all
+                              records (so you can get deleted records)
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            verbose (bool): If True, print the job status while polling
+            content_type (str): The format of the results, JSON or CSV. The CSV
+                                rows are dicts of the column values as strings.
+            pk_chunking (bool): If True, split the query into chunks of record
+                                Ids that are processed as separate batches
+            chunk_size (int): The number of records in each PK chunk
+            parent (str): The parent object to chunk on when querying a sharing
+                          object, e.g. Account for AccountShare
+            start_row (str): The record Id to start the first PK chunk at
+            max_workers (int): The maximum number of result sets downloaded at
+                               once
+
+        Returns:
+            object: Returns an array of results for the specified query
+        """
+        return list(Bulk.iter_query_rows(object_api_name, query, query_all, access_token, instance_url, verbose,
+                                         content_type, pk_chunking, chunk_size, parent, start_row, None, max_workers))
+
+
+class Bulk2:
+    """
+    Bulk API 2.0 provides a simple interface for quickly loading large amounts
+    of data into your Salesforce org. Currently csv is the only supported format.
+
+    https://developer.salesforce.com/docs/atlas.en-us.api_bulk_v2.meta/api_bulk_v2/introduction_bulk_api_2.htm
+    """
+    base_bulk2_uri = '/services/data/v' + API_VERSION + '/jobs/ingest'
+    base_bulk2_query_uri = '/services/data/v' + API_VERSION + '/jobs/query'
+
+    @staticmethod
+    def get_job_list(is_pk_chunking_enabled, job_type, query_locator, access_token, instance_url):
+        """
+        Retrieves all jobs in the org.
+
+        Args:
+            is_pk_chunking_enabled (bool): If set to true, filters jobs with PK
+                                           chunking enabled.
+            job_type (str): Filters jobs based on job type. Valid values include:
+                            BigObjectIngest—BigObjects job
+                            Classic—Bulk API 1.0 job
+                            V2Ingest—Bulk API 2.0 job
+            query_locator (int): Use queryLocator with a locator value to get a
+                                 specific set of job results. Get All Jobs returns
+                                 up to 1000 result rows per request, along with
+                                 a nextRecordsUrl value that contains the locator
+                                 value used to get the next set of results.
+
+        Returns:
+            dict: Object containing a list of every job and the details of the
+                  jobs.
+                  done (bool): Indicates whether there are more jobs to get. If
+                               false, use the nextRecordsUrl value to retrieve
+                               the next group of jobs.
+                  records (dict): The same details of the job that can be
+                                  retrieved with the get_job_info.
+                  nextRecordsUrl (str): A URL that contains a query locator used
+                                        to get the next set of results in a
+                                        subsequent request if done isn’t true.
+        """
+        header_details = Util.get_standard_header(access_token)
+
+        uri_params = []
+        uri_param_string = ""
+
+        if is_pk_chunking_enabled:
+            uri_params.append("isPkChunkingEnabled=true")
+
+        if job_type:
+            uri_params.append("jobType=" + job_type)
+
+        if query_locator:
+            uri_params.append("queryLocator=" + str(query_locator))
+
+        if uri_params:
+            uri_param_string = "?" + "&".join(uri_params)
+
+        response = webservice.Tools.get_http_response(instance_url + Bulk2.base_bulk2_uri + uri_param_string,
+                                                      header_details)
+
+    @staticmethod
+    def create_job(object_name, operation, external_id_field_name, column_delimiter, content_type, line_ending,
+                   access_token, instance_url):
+        """
+        Creates a job, which represents a bulk operation (and associated data)
+        that is sent to Salesforce for asynchronous processing. Provide job data
+        via an Upload Job Data request, or as part of a multipart create job
+        request.
+
+        Args:
+            object_name (str): Required. The object type for the data being
+                               processed. Use only a single object type per job.
+            operation (str): Required. The processing operation for the job.
+                             Valid values are:
+                                insert
+                                delete
+                                update
+                                upsert
+            external_id_field_name (str): Required for upsert operations. The
+                                          external ID field in the object being
+                                          updated. Only needed for upsert
+                                          operations. Field values must also
+                                          exist in CSV job data.
+            column_delimiter (str): Optional. The column delimiter used for CSV
+                                    job data. The default value is COMMA. Valid
+                                    values are:
+                                        BACKQUOTE—backquote character (`)
+                                        CARET—caret character (^)
+                                        COMMA—comma character (,) which is the
+                                            default delimiter
+                                        PIPE—pipe character (|)
+                                        SEMICOLON—semicolon character (;)
+                                        TAB—tab character
+            content_type (str): Optional. The content type for the job. The only
+                                valid value (and the default) is CSV.
+            line_ending (str): Optional. The line ending used for CSV job data,
+                               marking the end of a data row. The default is LF.
+                               Valid values are:
+                                    LF—linefeed character
+                                    CRLF—carriage return character followed by a
+                                        linefeed character
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            dict: Returns data about the job. The "id" field provides the job Id
+                  necessary for the remaining calls. Create job response details:
+                  https://developer.salesforce.com/docs/atlas.en-us.api_bulk_v2.meta/api_bulk_v2/create_job.htm
+        """
+        header_details = Util.get_standard_header(access_token)
+        header_details["Content-Type"] = "application/json; charset=UTF-8"
+        header_details["Accept"] = "application/json"
+
+        post_body = {}
+        post_body["object"] = object_name
+        post_body["operation"] = operation
+
+        if external_id_field_name:
+            post_body["externalIdFieldName"] = external_id_field_name
+
+        if column_delimiter:
+            post_body["columnDelimiter"] = column_delimiter
+
+        if content_type:
+            post_body["contentType"] = content_type
+
+        if line_ending:
+            post_body["lineEnding"] = line_ending
+
+        json_post_body_data = json.dumps(post_body, indent=4, separators=(',', ': '))
+        response = webservice.Tools.post_http_response(instance_url + Bulk2.base_bulk2_uri, json_post_body_data,
+                                                       header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def upload_csv_batch(data_set, job_id, access_token, instance_url):
+        """
+        Uploads data for a job using CSV data you provide.
+
+        Args:
+            data_set (str): This is a base64 encoded csv set. It can also be a
+                            binary file or a generator of bytes, which is
+                            streamed into the upload.
+            job_id (str): This is the job id from the Bulk2.create_job response.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response.
+
+        Returns:
+            int: Returns the status code. If the upload was successful, the
+                 response code should be 201.
+        """
+        header_details = Util.get_standard_header(access_token)
+        header_details["Content-Type"] = "text/csv"
+        header_details["Accept"] = "application/json"
+
+        response = webservice.Tools.put_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/batches',
+                                                      data_set, header_details)
+
+        return response.status_code
+
+    @staticmethod
+    def change_job_state(job_state, job_id, access_token, instance_url):
+        """
+        Closes or aborts a job. If you close a job, Salesforce queues the job
+        and uploaded data for processing, and you can’t add any additional job
+        data. If you abort a job, the job does not get queued or processed.
+
+        Args:
+            job_state (str): The state to update the job to. Use UploadComplete
+                             to close a job, or Aborted to abort a job.
+            job_id (str): The job id returned by Bulk2.create_job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response.
 
         Returns:
-            list: A list of the response from each of the upsert requests in the
-                  request list.
-                  [
-                      {
-                          "id": "001xx0000004GxDAAU",
-                          "success": true,
-                          "errors": [],
-                          "created": true
-                      },
-                      {
-                          "id": "001xx0000004GxEAAU",
-                          "success": true,
-                          "errors": [],
-                          "created": false
-                      }
-                  ]
+            dict: Returns the current job state details.
         """
-        # /composite/sobjects/SobjectName/ExternalIdFieldName
-        patch_rows_uri = "/composite/sobjects/" + object_api_name + "/" + external_id_field_name
         header_details = Util.get_standard_header(access_token)
 
-        if run_assignment_rules:
-            header_details["Sforce-Auto-Assign"] = "true"
-        else:
-            header_details["Sforce-Auto-Assign"] = "false"
+        request_body = {"state": job_state}
 
-        request_body = {}
-        request_body["allOrNone"] = all_or_none
-        request_body["records"] = records
+        json_request_body = json.dumps(request_body, indent=4, separators=(',', ': '))
+        response = webservice.Tools.patch_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id,
+                                                        json_request_body, header_details)
+        json_response = json.loads(response.text)
 
-        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+        return json_response
+
+    @staticmethod
+    def delete_job(job_id, access_token, instance_url):
+        """
+        Deletes a job. To be deleted, a job must have a state of UploadComplete,
+        JobComplete, Aborted, or Failed.
+
+        Args:
+            job_id (str): The job id returned by Bulk2.create_job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response.
+
+        Returns:
+            int: Returns the http status code. Should be 204 which indicates the
+                 job was deleted successfully.
+        """
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.delete_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id, None,
+                                                         header_details)
+
+        return response.status_code
+
+    @staticmethod
+    def get_job_info(job_id, access_token, instance_url):
+        """
+        Retrieves detailed information about a job.
+
+        Args:
+            job_id (str): The job id returned by Bulk2.create_job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response.
+
+        Returns:
+            dict: Returns details about the status of the given job. If the job
+                  succeeds, the status will be 'JobComplete' vs 'Failed' for
+                  a failed job. More details here:
+                  https://developer.salesforce.com/docs/atlas.en-us.api_bulk_v2.meta/api_bulk_v2/get_job_info.htm
+        """
+        header_details = Util.get_standard_header(access_token)
+
+        response = webservice.Tools.get_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id,
+                                                      header_details)
+        json_response = json.loads(response.text)
+
+        return json_response
+
+    @staticmethod
+    def get_status_check(job_id, access_token, instance_url, record_count=None, min_stable_seconds=10):
+        """
+        This method returns the function JobPoller calls to check on a job.
+        Progress is measured in records processed.
+
+        Bulk API 2.0 can report a job as Failed while it's still processing
+        records, so a Failed job is only treated as finished once all of its
+        records are processed, or once the records processed haven't changed
+        for min_stable_seconds, however often the job is polled.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            record_count (int): The number of records uploaded to the job, if
+                                known, so the poller can estimate when the job
+                                will finish
+            min_stable_seconds (float): The number of seconds the records
+                                        processed of a Failed job have to stay
+                                        the same before it's finished
+
+        Returns:
+            function: Returns a function that gets the job info and returns
+                      (is_done, job_info, records_processed, record_count)
+        """
+        last_change = {'processed': None, 'time': None}
+
+        def status_check():
+            json_response = Bulk2.get_job_info(job_id, access_token, instance_url)
+            processed_total = json_response['numberRecordsProcessed']
+            now = time.time()
+
+            if processed_total != last_change['processed']:
+                last_change['processed'] = processed_total
+                last_change['time'] = now
+
+            # Bulk v2 will set status to Failed even while the job is processing if it encounters a record
+            # failure, so a failed job is only finished once the records processed stop moving
+            is_done = json_response['state'] in ['JobComplete', 'Aborted'] or \
+                (json_response['state'] == 'Failed' and
+                 ((record_count != None and processed_total >= record_count) or
+                  now - last_change['time'] >= min_stable_seconds))
+
+            return is_done, json_response, processed_total, record_count
+
+        return status_check
+
+    @staticmethod
+    def print_job_status(json_response):
+        """
+        This method prints the state and record counts of a job.
+
+        Args:
+            json_response (dict): The job info
+        """
+        print("Job state/failed/total: {}/{}/{}".format(json_response['state'],
+                                                        json_response['numberRecordsFailed'],
+                                                        json_response['numberRecordsProcessed']))
+
+    @staticmethod
+    def get_job_status(job_id, polling_wait, verbose, access_token, instance_url):
+        """
+        This method is used for printing job status. If verbose is False it will
+        still wait but ignore the print statements.
+
+        Args:
+            job_id (str): The job id returned when creating a batch job
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll. If None, the job is polled
+                                adaptively by the shared JobPoller.
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+
+        Returns:
+            objects: Prints the status of the bulk job and polls for an update
+                     until the job is complete, aborted or failed, then it
+                     returns the final job status response.
+        """
+        if verbose:
+            print("Status for job: {}".format(job_id))
+
+        def print_status(json_response, seconds_left):
+            if verbose:
+                Bulk2.print_job_status(json_response)
+
+        status_check = Bulk2.get_status_check(job_id, access_token, instance_url)
+
+        return JobPoller.get_default().submit(status_check, print_status, polling_wait).result()
+
+    @staticmethod
+    def submit_ingest_job(object_name, operation, records, external_id_field_name, access_token, instance_url,
+                          polling_wait=None, verbose=False, poller=None, checkpoint_path=None, fields=None,
+                          max_job_bytes=BULK2_UPLOAD_MAX_BYTES, max_job_records=BULK2_UPLOAD_MAX_RECORDS):
+        """
+        This method creates an ingest job, uploads the records as CSV and marks
+        the upload complete, then returns right away with a BulkJob handle
+        instead of waiting for Salesforce to process the job. The CSV is
+        written to a temporary file one row at a time and streamed from it
+        into the upload, so it's never held in memory. A load that doesn't fit
+        in one job raises a ValueError before the job is created; use
+        Bulk2.ingest to split it across jobs.
+
+        Args:
+            object_name (str): The object type for the data being processed
+            operation (str): The processing operation for the job: insert,
+                             delete, update, upsert or hardDelete
+            records (iterable): The record dicts to load. They're converted
+                                with Util.iter_csv_rows
+            external_id_field_name (str): The external ID field for upserts
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            polling_wait (int): The number of seconds between polls. If None,
+                                the job is polled adaptively.
+            verbose (bool): If True, print the job status while polling
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
+            checkpoint_path (str): Optional path of a BulkCheckpoint journal. If
+                                   the job in it finished uploading, it's picked
+                                   up again instead of loading the records
+                                   twice. A job that was still open is aborted
+                                   and replaced, since Salesforce doesn't
+                                   process anything until the upload is
+                                   complete.
+            fields (array): The columns of the CSV. Pass them with a generator
+                            of records so it isn't read into memory to find the
+                            columns.
+            max_job_bytes (int): The maximum size of the raw CSV. It defaults
+                                 to 100 MB, which is the 150 MB limit after
+                                 base64 encoding.
+            max_job_records (int): The maximum number of records in the job
+
+        Returns:
+            BulkJob: Returns the handle of the submitted job
+        """
+        checkpoint = None
+
+        if checkpoint_path != None:
+            checkpoint = BulkCheckpoint(checkpoint_path)
+
+            if checkpoint.job != None and not checkpoint.upload_complete:
+                job_info = Bulk2.get_job_info(checkpoint.job['job_id'], access_token, instance_url)
+
+                if job_info['state'] == 'Open':
+                    Bulk2.change_job_state('Aborted', checkpoint.job['job_id'], access_token, instance_url)
+                elif job_info['state'] != 'Aborted':
+                    checkpoint.record('upload_complete')
+
+            if checkpoint.job != None and checkpoint.upload_complete:
+                return BulkJob('bulk2', checkpoint.job['job_id'], access_token, instance_url,
+                               record_count=checkpoint.job.get('record_count'), polling_wait=polling_wait,
+                               verbose=verbose, poller=poller, checkpoint=checkpoint)
+
+        with tempfile.TemporaryFile() as csv_file:
+            csv_rows = Util.iter_csv_rows(records, fields)
+            csv_file.write(next(csv_rows).encode('utf-8'))
+            record_count = 0
+
+            # the limits are checked as the rows are written, so nothing is uploaded for a load that's too big
+            for row in csv_rows:
+                csv_file.write(row.encode('utf-8'))
+                record_count += 1
+
+                if csv_file.tell() > max_job_bytes:
+                    raise ValueError('The CSV is more than the {} bytes allowed in a job'.format(max_job_bytes))
+
+                if record_count > max_job_records:
+                    raise ValueError('There are more than the {} records allowed in a job'.format(max_job_records))
+
+            csv_file.seek(0)
+            job = Bulk2.create_job(object_name, operation, external_id_field_name, None, None, None, access_token,
+                                   instance_url)
+
+            if checkpoint != None:
+                checkpoint.record('job', api='bulk2', job_id=job['id'], object=object_name, operation=operation,
+                                  record_count=record_count)
+
+            Bulk2.upload_csv_batch(csv_file, job['id'], access_token, instance_url)
+
+        Bulk2.change_job_state('UploadComplete', job['id'], access_token, instance_url)
+
+        if checkpoint != None:
+            checkpoint.record('upload_complete')
+
+        return BulkJob('bulk2', job['id'], access_token, instance_url, record_count=record_count,
+                       polling_wait=polling_wait, verbose=verbose, poller=poller, checkpoint=checkpoint)
+
+    @staticmethod
+    def ingest(object_name, operation, source, access_token, instance_url, external_id_field_name=None,
+               fields=None, max_job_bytes=BULK2_UPLOAD_MAX_BYTES, max_job_records=BULK2_UPLOAD_MAX_RECORDS,
+               polling_wait=None, verbose=False, poller=None):
+        """
+        This method runs a whole Bulk API 2.0 load in one call. The records are
+        encoded as CSV one row at a time and streamed into the upload of a job
+        while they're encoded. When a job reaches max_job_bytes or
+        max_job_records, it's marked complete and the rest of the records go to
+        a new job, which is uploaded while the earlier jobs process. Once every
+        job has finished, a summary is returned with the results streamed from
+        each job.
+
+        Example:
+            summary = Bulk2.ingest('Contact', 'insert', 'contacts.csv', access_token, instance_url)
+            for result in summary['failedResults']:
+                print(result['errors'][0]['message'])
+
+        Args:
+            object_name (str): The object type for the data being processed
+            operation (str): The processing operation for the job: insert,
+                             delete, update, upsert or hardDelete
+            source (object): The path of a CSV file, or an iterable of record
+                             dicts that are converted with Util.iter_csv_rows
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            external_id_field_name (str): The external ID field for upserts
+            fields (array): The columns of the CSV. Pass them with a generator
+                            of records so it isn't read into memory to find the
+                            columns. The header of a CSV file is used by
+                            default.
+            max_job_bytes (int): The maximum size of the raw CSV uploaded to a
+                                 job. It defaults to 100 MB, which is the 150
+                                 MB limit after base64 encoding.
+            max_job_records (int): The maximum number of records in a job
+            polling_wait (int): The number of seconds between polls. If None,
+                                the jobs are polled adaptively.
+            verbose (bool): If True, print the job status while polling
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
+
+        Returns:
+            dict: Returns the final info of each job, the totals and generators
+                  that download and yield the results of all the jobs from
+                  Bulk2.iter_results:
+                  {
+                      "jobs": [...],
+                      "numberRecordsProcessed": 2,
+                      "numberRecordsFailed": 1,
+                      "successfulResults": <generator>,
+                      "failedResults": <generator>,
+                      "unprocessedRecords": <generator>
+                  }
+        """
+        if isinstance(source, str):
+            with open(source, newline='', encoding='utf-8') as source_file:
+                reader = csv.DictReader(source_file)
+
+                return Bulk2.ingest(object_name, operation, reader, access_token, instance_url,
+                                    external_id_field_name, fields or reader.fieldnames, max_job_bytes,
+                                    max_job_records, polling_wait, verbose, poller)
+
+        csv_rows = Util.iter_csv_rows(source, fields)
+        header = next(csv_rows).encode('utf-8')
+        next_row = [None]
+
+        def take_row():
+            row = next(csv_rows, None)
+            next_row[0] = row.encode('utf-8') if row != None else None
+
+            if next_row[0] != None and len(header) + len(next_row[0]) > max_job_bytes:
+                raise ValueError('A record is {} bytes, which is more than the {} bytes allowed in a job'.format(
+                    len(next_row[0]), max_job_bytes))
+
+        def job_rows(record_count):
+            job_bytes = len(header)
+            yield header
+
+            while next_row[0] != None:
+                if record_count[0] >= max_job_records or job_bytes + len(next_row[0]) > max_job_bytes:
+                    return
+
+                yield next_row[0]
+                job_bytes += len(next_row[0])
+                record_count[0] += 1
+                take_row()
+
+        take_row()
+        bulk_jobs = []
+
+        while next_row[0] != None:
+            record_count = [0]
+            job = Bulk2.create_job(object_name, operation, external_id_field_name, None, None, None, access_token,
+                                   instance_url)
+
+            try:
+                Bulk2.upload_csv_batch(job_rows(record_count), job['id'], access_token, instance_url)
+                Bulk2.change_job_state('UploadComplete', job['id'], access_token, instance_url)
+            except Exception:
+                # a job that is left open holds the records that were uploaded so far, so it's thrown away
+                Bulk2.change_job_state('Aborted', job['id'], access_token, instance_url)
+                raise
+
+            bulk_jobs.append(BulkJob('bulk2', job['id'], access_token, instance_url, record_count=record_count[0],
+                                     polling_wait=polling_wait, verbose=verbose, poller=poller))
+
+        job_infos = [bulk_job.wait() for bulk_job in bulk_jobs]
+        job_ids = [bulk_job.job_id for bulk_job in bulk_jobs]
+
+        return {
+            'jobs': job_infos,
+            'numberRecordsProcessed': sum(job_info['numberRecordsProcessed'] for job_info in job_infos),
+            'numberRecordsFailed': sum(job_info['numberRecordsFailed'] for job_info in job_infos),
+            'successfulResults': Bulk2.iter_results(job_ids, 'successfulResults', access_token, instance_url),
+            'failedResults': Bulk2.iter_results(job_ids, 'failedResults', access_token, instance_url),
+            'unprocessedRecords': Bulk2.iter_results(job_ids, 'unprocessedrecords', access_token, instance_url)
+        }
+
+    @staticmethod
+    def ingest_sharded(object_name, operation, records, shard_key, shard_count, access_token, instance_url,
+                       external_id_field_name=None, fields=None, max_concurrent_jobs=DEFAULT_MAX_WORKERS,
+                       polling_wait=None, verbose=False, poller=None):
+        """
+        This method splits a load into shard_count shards by the value of
+        shard_key and runs each shard as its own Bulk2.ingest, with at most
+        max_concurrent_jobs shards loading at once, so several jobs process in
+        parallel instead of one. Records with the same shard_key value always
+        land in the same shard, so sharding on the parent of the records, like
+        AccountId for Contacts, keeps jobs from locking the same parent. The
+        records are spooled into a temporary file for each shard, so the input
+        is only read once and never held in memory.
+
+        Example:
+            summary = Bulk2.ingest_sharded('Contact', 'insert', records, 'AccountId', 8, access_token,
+                                           instance_url, max_concurrent_jobs=4)
+
+        Args:
+            object_name (str): The object type for the data being processed
+            operation (str): The processing operation for the job: insert,
+                             delete, update, upsert or hardDelete
+            records (iterable): The record dicts to load
+            shard_key (str): The field the records are sharded on. Nested
+                             relationship fields use the column name, like
+                             Account.External_Id__c
+            shard_count (int): The number of shards
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            external_id_field_name (str): The external ID field for upserts
+            fields (array): The columns of the CSV. If None, every field of the
+                            records is used
+            max_concurrent_jobs (int): The maximum number of shards loading at
+                                       once. A shard over the Bulk2.ingest
+                                       limits rolls over to more jobs.
+            polling_wait (int): The number of seconds between polls. If None,
+                                the jobs are polled adaptively.
+            verbose (bool): If True, print the progress as each shard finishes
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
+
+        Returns:
+            dict: Returns the same summary as Bulk2.ingest for all the jobs, plus
+                  the summary of each shard in shards. Shards without records
+                  are left out.
+        """
+        if shard_count < 1:
+            raise ValueError('shard_count must be at least 1')
 
-        response = webservice.Tools.patch_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + patch_rows_uri, data_body_json,
-            header_details)
+        shard_files = [tempfile.TemporaryFile('w+', encoding='utf-8') for i in range(shard_count)]
+        shard_sizes = [0] * shard_count
+        found_fields = [] if fields is None else None
+        found_field_names = set()
 
-        return json.loads(response.text)
+        try:
+            for record in records:
+                record = Util.flatten_record(record)
+                shard_value = record.get(shard_key)
+                shard = zlib.crc32(str(shard_value).encode('utf-8')) % shard_count
+
+                if found_fields != None:
+                    for field_name in record:
+                        if field_name not in found_field_names:
+                            found_field_names.add(field_name)
+                            found_fields.append(field_name)
+
+                shard_files[shard].write(json.dumps(record) + '\n')
+                shard_sizes[shard] += 1
+
+            if found_fields != None:
+                fields = found_fields
+
+            def read_shard(shard):
+                shard_files[shard].seek(0)
+
+                for line in shard_files[shard]:
+                    yield json.loads(line)
+
+            def ingest_shard(shard):
+                return Bulk2.ingest(object_name, operation, read_shard(shard), access_token, instance_url,
+                                    external_id_field_name, fields, polling_wait=polling_wait, poller=poller)
+
+            shard_summaries = {}
+            loaded_shards = [shard for shard in range(shard_count) if shard_sizes[shard] > 0]
+
+            for shard, shard_summary in Util.iter_concurrent(ingest_shard, loaded_shards, max_concurrent_jobs):
+                shard_summaries[shard] = shard_summary
+
+                if verbose:
+                    print("Shards done/total: {}/{}, records processed/failed: {}/{}".format(
+                        len(shard_summaries), len(loaded_shards),
+                        sum(summary['numberRecordsProcessed'] for summary in shard_summaries.values()),
+                        sum(summary['numberRecordsFailed'] for summary in shard_summaries.values())))
+        finally:
+            for shard_file in shard_files:
+                shard_file.close()
+
+        shards = [shard_summaries[shard] for shard in loaded_shards]
+        job_infos = [job_info for shard_summary in shards for job_info in shard_summary['jobs']]
+        job_ids = [job_info['id'] for job_info in job_infos]
+
+        return {
+            'shards': shards,
+            'jobs': job_infos,
+            'numberRecordsProcessed': sum(shard_summary['numberRecordsProcessed'] for shard_summary in shards),
+            'numberRecordsFailed': sum(shard_summary['numberRecordsFailed'] for shard_summary in shards),
+            'successfulResults': Bulk2.iter_results(job_ids, 'successfulResults', access_token, instance_url),
+            'failedResults': Bulk2.iter_results(job_ids, 'failedResults', access_token, instance_url),
+            'unprocessedRecords': Bulk2.iter_results(job_ids, 'unprocessedrecords', access_token, instance_url)
+        }
 
     @staticmethod
-    def delete_sobject_rows(record_ids, all_or_none, access_token, instance_url):
+    def iter_results(job_ids, result_type, access_token, instance_url):
         """
-        Deletes a list of up to 200 records.
-        documentation: https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_sobjects_collections.htm
+        This generator streams the results of ingest jobs into a temporary file
+        one job at a time and parses their rows as they're read, so the results
+        of a large load are never held in memory. Nothing is downloaded until
+        the first result is read.
 
         Args:
-            record_ids (list): List of record Ids to be deleted.
-            all_or_none (bool): Indicates whether to roll back the entire request
-                                when the update of any object fails (true) or to
-                                continue with the independent update of other
-                                objects in the request. The default is false.
+            job_ids (array): The Ids of the jobs
+            result_type (str): successfulResults, failedResults or
+                               unprocessedrecords
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
                                 login response
 
         Returns:
-            dict: The result in order of the Id delete list requested.
-                example:
-                [
-                   {
-                      "id" : "001RM000003oLruYAE",
-                      "success" : false,
-                      "errors" : [
-                         {
-                            "statusCode" : "ALL_OR_NONE_OPERATION_ROLLED_BACK",
-                            "message" : "Record rolled back because not all records were valid and the request was using AllOrNone header",
-                            "fields" : [ ]
-                         }
-                      ]
-                   },
-                   {
-                      "success" : false,
-                      "errors" : [
-                         {
-                            "statusCode" : "MALFORMED_ID",
-                            "message" : "malformed id 001RM000003oLrB000",
-                            "fields" : [ ]
-                         }
-                      ]
-                   }
-                ]
+            dict: Yields each result converted with Util.get_bulk2_result
         """
-        delete_rows_uri = '/composite/sobjects'
         header_details = Util.get_standard_header(access_token)
 
-        delete_params = "?ids=" + ",".join(record_ids)
+        for job_id in job_ids:
+            with tempfile.TemporaryFile() as result_file:
+                webservice.Tools.download_http_response(
+                    instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/' + result_type + '/', header_details,
+                    result_file)
+                result_file.seek(0)
 
-        if all_or_none:
-            delete_params += "&allOrNone=true"
-        else:
-            delete_params += "&allOrNone=false"
+                for result in Util.iter_bulk2_results(result_file, result_type):
+                    yield result
 
-        response = webservice.Tools.delete_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + delete_rows_uri + delete_params, None,
-            header_details)
+    @staticmethod
+    def get_joined_results(records, job_ids, access_token, instance_url, key_field=None, fields=None):
+        """
+        This method streams the successful, failed and unprocessed results of
+        ingest jobs and matches them back to the records that were loaded with
+        Util.join_bulk2_results.
 
-        return json.loads(response.text)
+        Args:
+            records (iterable): The record dicts that were loaded
+            job_ids (array): The Ids of the jobs
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            key_field (str): The column to match on, like an external Id. If
+                             None, the records are matched on all their columns.
+            fields (array): The columns the records were sent with, if they
+                            were passed to the load
+
+        Returns:
+            array: Returns the result of each record in the order of the
+                   records, or None for a record without a result
+        """
+        results = itertools.chain.from_iterable(Bulk2.iter_results(job_ids, result_type, access_token, instance_url)
+                                                for result_type in ['successfulResults', 'failedResults',
+                                                                    'unprocessedrecords'])
+
+        return Util.join_bulk2_results(records, results, key_field, fields)
 
     @staticmethod
-    def query(query_string, access_token, instance_url):
+    def get_success_results(job_id, access_token, instance_url):
         """
-        Executes the specified SOQL query. If the query results are too large,
-        the response contains the first batch of results and a query identifier
-        in the nextRecordsUrl field of the response. The identifier can be used
-        in an additional request to retrieve the next batch.
+        Retrieves a list of successfully processed records for a completed job.
 
         Args:
-            query_string (str): This query you'd like to run
+            job_id (str): The job id returned by Bulk2.create_job
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
-                                login response
+                                login response.
 
         Returns:
-            object: returns the query results, if they are too large, then it
-                    will also return a nextRecordsUrl to get more records.
+            str: Returns a CSV with 2 columns at the start, then all the fields
+                 that were originally sent.
+                 sf__Created (bool): Indicates if the record was created.
+                 sf__Id (str): ID of the record that was successfully processed.
         """
-        query_uri = '/query/?q='
         header_details = Util.get_standard_header(access_token)
-        url_encoded_query = urllib.parse.quote(query_string)
 
         response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri + url_encoded_query,
-            header_details)
-        json_response = json.loads(response.text)
+            instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/successfulResults/', header_details)
 
-        return json_response
+        return response.text
 
     @staticmethod
-    def query_all(query_string, access_token, instance_url):
+    def get_failed_results(job_id, access_token, instance_url):
         """
-        Executes the specified SOQL query. If the query results are too large,
-        the response contains the first batch of results and a query identifier
-        in the nextRecordsUrl field of the response. The identifier can be used
-        in an additional request to retrieve the next batch. The difference
-        between this and query is that query all can retrieve deleted records.
+        Retrieves a list of failed records for a completed job.
 
         Args:
-            query_string (str): This query you'd like to run
+            job_id (str): The job id returned by Bulk2.create_job
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
-                                login response
+                                login response.
 
         Returns:
-            object: returns the query results, if they are too large, then it
-                    will also return a nextRecordsUrl to get more records.
+            str: Returns a CSV with 2 columns at the start, then all the fields
+                 that were originally sent.
+                 sf__Error (str): Error code and message, if applicable.
+                 sf__Id (str): ID of the record that had an error during
+                               processing, if applicable.
         """
-        query_uri = '/queryAll/?q='
         header_details = Util.get_standard_header(access_token)
-        url_encoded_query = urllib.parse.quote(query_string)
 
         response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri + url_encoded_query,
-            header_details)
-        json_response = json.loads(response.text)
+            instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/failedResults/', header_details)
+
+        return response.text
 
-        return json_response
-    
     @staticmethod
-    def search(search_string, access_token, instance_url):
+    def get_unprocessed_results(job_id, access_token, instance_url):
         """
-        Executes the specified SOSL search. If the search results are too large,
-        the response contains the first batch of results and a search identifier
-        in the nextRecordsUrl field of the response. The identifier can be used
-        in an additional request to retrieve the next batch. The difference
-        between this and search is that search all can retrieve deleted records.
+        Retrieves a list of unprocessed records for a completed job.
 
         Args:
-            search_string (str): This search you'd like to run
+            job_id (str): The job id returned by Bulk2.create_job
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
-                                login response
+                                login response.
 
         Returns:
-            object: returns the search results, if they are too large, then it
-                    will also return a nextRecordsUrl to get more records.
-
+            str: Returns a CSV with all the fields that were originally supplied.
         """
-        search_uri = '/search/?q='
         header_details = Util.get_standard_header(access_token)
-        url_encoded_search = urllib.parse.quote(search_string)
 
         response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + search_uri + url_encoded_search,
-            header_details)
-        json_response = json.loads(response.text)
+            instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/unprocessedrecords/', header_details)
 
-        return json_response
+        return response.text
 
     @staticmethod
-    def reset_users_password(user_id, access_token, instance_url):
+    def create_query_job(query, query_all, access_token, instance_url):
         """
-        Resets a users' password.
+        Creates a query job. Salesforce starts running the query as soon as the
+        job is created.
 
         Args:
-            user_id (str):      The user id of the user who's password should be reset
+            query (str): The SOQL query to run
+            query_all (bool): If True, the query includes deleted and archived
+                              records
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
-                                login response
+                                login response.
 
         Returns:
-            object: returns information about the password reset
+            dict: Returns the details of the new job
         """
-        query_uri = f'/sobjects/User/{user_id}/password'
         header_details = Util.get_standard_header(access_token)
 
-        response = webservice.Tools.delete_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri, None,
-            header_details)
+        post_body = {
+            "operation": "queryAll" if query_all else "query",
+            "query": query
+        }
+
+        json_post_body_data = json.dumps(post_body, indent=4, separators=(',', ': '))
+        response = webservice.Tools.post_http_response(instance_url + Bulk2.base_bulk2_query_uri, json_post_body_data,
+                                                       header_details)
         json_response = json.loads(response.text)
 
         return json_response
 
     @staticmethod
-    def get_current_user_info(access_token, instance_url):
+    def get_query_job_info(job_id, access_token, instance_url):
         """
-        Gets information about the currently logged in user.
+        Retrieves detailed information about a query job.
 
         Args:
+            job_id (str): The job id returned by Bulk2.create_query_job
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
-                                login response
+                                login response.
 
         Returns:
-            object: returns information about the current user
+            dict: Returns the details of the job. Its state is UploadComplete,
+                  InProgress, JobComplete, Failed or Aborted.
         """
-        query_uri = '/chatter/users/me'
         header_details = Util.get_standard_header(access_token)
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri,
-            header_details)
+        response = webservice.Tools.get_http_response(instance_url + Bulk2.base_bulk2_query_uri + '/' + job_id,
+                                                      header_details)
         json_response = json.loads(response.text)
 
         return json_response
 
     @staticmethod
-    def post_chatter_mention(text, mention_id, subject_id, access_token, instance_url):
+    def abort_query_job(job_id, access_token, instance_url):
         """
-        Posts a chatter mention. E.g. @someone
+        Aborts a query job that is still running.
 
         Args:
-            text (str): The text to go after the mention
-            mention_id (str): The id of the user/group you want to mention
-            subject_id (str): The id of the object you want to attach the comment to
+            job_id (str): The job id returned by Bulk2.create_query_job
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
-                                login response
+                                login response.
 
         Returns:
-            object: returns the query results, if they are too large, then it
-                    will also return a nextRecordsUrl to get more records.
+            dict: Returns the details of the job
         """
-        query_uri = '/chatter/feed-elements'
         header_details = Util.get_standard_header(access_token)
-        request_body = {}
-        request_body['body'] = {}
-        request_body['body']["messageSegments"] = [{"type": "Mention", "id": mention_id}, {'type': 'Text', "text": text}]
-        request_body["feedElementType"] = "FeedItem"
-        request_body["subjectId"] = subject_id
-
-        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
 
-        response = webservice.Tools.post_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + query_uri, data_body_json,
-            header_details)
+        json_request_body = json.dumps({"state": "Aborted"}, indent=4, separators=(',', ': '))
+        response = webservice.Tools.patch_http_response(instance_url + Bulk2.base_bulk2_query_uri + '/' + job_id,
+                                                        json_request_body, header_details)
         json_response = json.loads(response.text)
 
         return json_response
 
     @staticmethod
-    def get_next_query_batch(next_record_url, access_token, instance_url):
+    def delete_query_job(job_id, access_token, instance_url):
         """
-        Does a GET on the url passed. If the query results are still too large,
-        the response contains the first batch of results and a query identifier
-        in the nextRecordsUrl field of the response. The identifier can be used
-        in an additional request to retrieve the next batch.
+        Deletes a query job and its results. To be deleted, a job must have a
+        state of JobComplete, Aborted, or Failed.
 
         Args:
-            next_record_url (str): The url of the next record
-            access_token (str)   : This is the access_token value received from the
-                                   login response
-            instance_url (str)   : This is the instance_url value received from the
-                                   login response
+            job_id (str): The job id returned by Bulk2.create_query_job
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response.
 
         Returns:
-            object: returns the query results, if they are too large, then it
-                    will also return a nextRecordsUrl to get more records.
+            int: Returns the http status code. Should be 204 which indicates the
+                 job was deleted successfully.
         """
         header_details = Util.get_standard_header(access_token)
 
-        response = webservice.Tools.get_http_response(instance_url + next_record_url,
-            header_details)
-
-        json_response = json.loads(response.text)
+        response = webservice.Tools.delete_http_response(instance_url + Bulk2.base_bulk2_query_uri + '/' + job_id,
+                                                         None, header_details)
 
-        return json_response
+        return response.status_code
 
     @staticmethod
-    def get_updated(object_name, start_date_time, end_date_time, access_token, instance_url):
+    def get_query_status_check(job_id, access_token, instance_url):
         """
-        Retrieves the list of individual records that have been updated (added
-        or changed) within the given timespan for the specified object. SObject
-        Get Updated is available in API version 29.0 and later.
-
-        This resource is commonly used in data replication applications. Note
-        the following considerations:
-            * Results are returned for no more than 30 days previous to the day
-              the call is executed.
-            * Your client application can replicate any objects to which it has
-              sufficient permissions. For example, to replicate all data for
-              your organization, your client application must be logged in with
-              “View All Data” access rights to the specified object. Similarly,
-              the objects must be within your sharing rules.
-            * There is a limit of 600,000 IDs returned from this resource. If
-              more than 600,000 IDs would be returned, EXCEEDED_ID_LIMIT is
-              returned. You can correct the error by choosing start and end
-              dates that are closer together.
+        This method builds the status check a JobPoller uses to poll a query
+        job.
 
         Args:
-            object_name (str): The name of the object to get updated records for.
-
-            startDateTime (datetime): Starting date/time (Coordinated Universal
-                Time (UTC) time zone—not local— timezone) of the timespan for
-                which to retrieve the data. The API ignores the seconds portion
-                of the specified dateTime value (for example, 12:30:15 is
-                interpreted as 12:30:00 UTC).
-
-            start_date_time (datetime): Ending date/time (Coordinated Universal
-                Time (UTC) time zone—not local— timezone) of the timespan for
-                which to retrieve the data. The API ignores the seconds portion
-                of the specified dateTime value (for example, 12:35:15 is
-                interpreted as 12:35:00 UTC).
-
+            job_id (str): The job id returned by Bulk2.create_query_job
             access_token (str): This is the access_token value received from the
                                 login response
-
             instance_url (str): This is the instance_url value received from the
                                 login response
 
         Returns:
-            dict: Returns a dictionary containing the record Ids that were
-                updated and the latest record updated in that window.
-                {
-                    'ids': ['<id 1>', ..., '<id N>'],
-                    'latestDateCovered': '2020-03-13T12:00:00.000+0000'
-                }
+            function: Returns a function that gets the job info and returns
+                      (is_done, job_info, records_processed, None)
+        """
+        def status_check():
+            json_response = Bulk2.get_query_job_info(job_id, access_token, instance_url)
+            is_done = json_response['state'] in ['JobComplete', 'Failed', 'Aborted']
+
+            return is_done, json_response, json_response.get('numberRecordsProcessed', 0), None
+
+        return status_check
+
+    @staticmethod
+    def wait_for_query_job(job_id, polling_wait, verbose, access_token, instance_url, poller=None):
+        """
+        This method waits for a query job to finish.
+
+        Args:
+            job_id (str): The job id returned by Bulk2.create_query_job
+            polling_wait (int): This is the number of seconds to wait between
+                                each poll. If None, the job is polled
+                                adaptively.
+            verbose (bool): If True, print the job state after each poll
+            access_token (str): This is the access_token value received from the
+                                login response
+            instance_url (str): This is the instance_url value received from the
+                                login response
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
+
+        Returns:
+            dict: Returns the final job info. A RuntimeError is raised if the job
+                  failed or was aborted.
         """
-        get_updated_uri = '/sobjects/' + object_name + '/updated/?start=' + \
-            urllib.parse.quote(start_date_time.strftime('%Y-%m-%dT%H:%M:%SZ')) + '&end=' + \
-            urllib.parse.quote(end_date_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        if verbose:
+            print("Status for job: {}".format(job_id))
 
-        header_details = Util.get_standard_header(access_token)
+        def print_status(json_response, seconds_left):
+            if verbose:
+                print("Job state/records: {}/{}".format(json_response['state'],
+                                                        json_response.get('numberRecordsProcessed', 0)))
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_updated_uri,
-            header_details)
-        json_response = json.loads(response.text)
+        if poller is None:
+            poller = JobPoller.get_default()
+
+        status_check = Bulk2.get_query_status_check(job_id, access_token, instance_url)
+        json_response = poller.submit(status_check, print_status, polling_wait).result()
+
+        if json_response['state'] != 'JobComplete':
+            raise RuntimeError('Query job {} is {}: {}'.format(job_id, json_response['state'],
+                                                              json_response.get('errorMessage')))
 
         return json_response
 
     @staticmethod
-    def retrieve(object_name, ids, fields, access_token, instance_url):
+    def download_query_results_page(job_id, file_object, locator, max_records, access_token, instance_url):
         """
-        Use a GET or POST request with sObject Collections to retrieve one or
-        more records of the same object type. A list of sObjects that represents
-        the individual records of the specified type is returned. The number of
-        sObjects returned matches the number of IDs passed in the request.
-
-        You can specify approximately 800 IDs before the URL length causes the
-        HTTP 414 error URI too long. To retrieve more records than the URL
-        length can accommodate, use a POST request to retrieve up to 2,000
-        records of the same object type. If you use POST, the IDs and fields of
-        the records to retrieve are specified in the request body.
+        This method streams one page of the results of a query job into a file.
 
         Args:
-            object_name (str): The name of the object to get updated records for.
-
-            ids (list): A list of one or more IDs of the objects to return. All
-                IDs must belong to the same object type.
-
-            fields (list): A list of fields to include in the response. The
-                field names you specify must be valid, and you must have
-                read-level permissions to each field.
-
+            job_id (str): The job id returned by Bulk2.create_query_job
+            file_object (file): The binary file the CSV page is written to
+            locator (str): The Sforce-Locator of the previous page, or None for
+                           the first page
+            max_records (int): The maximum number of records in the page, or
+                               None to let Salesforce decide
             access_token (str): This is the access_token value received from the
-                login response
-
+                                login response
             instance_url (str): This is the instance_url value received from the
-                login response
+                                login response
 
         Returns:
-            list: A list of dicts with the Salesforce records: Example:
-            [
-                {
-                    "attributes" : {
-                        "type" : "Account",
-                        "url" : "/services/data/v51.0/sobjects/Account/001xx000003DGb1AAG"
-                    },
-                    "Id" : "001xx000003DGb1AAG",
-                    "Name" : "Acme"
-                },
-                {
-                    "attributes" : {
-                         "type" : "Account",
-                        "url" : "/services/data/v51.0/sobjects/Account/001xx000003DGb0AAG"
-                    },
-                    "Id" : "001xx000003DGb0AAG",
-                    "Name" : "Global Media"
-                },
-                None
-            ]
+            tuple: Returns (locator, record_count), where locator is the
+                   locator of the next page, or None after the last page
         """
-        retrieve_uri = '/composite/sobjects/' + object_name
         header_details = Util.get_standard_header(access_token)
+        header_details['Accept'] = 'text/csv'
+        uri_params = []
 
-        request_body = {}
-        request_body['ids'] = ids
-        request_body['fields'] = fields
-
-        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+        if locator != None:
+            uri_params.append('locator=' + urllib.parse.quote(locator))
 
-        response = webservice.Tools.post_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + retrieve_uri, data_body_json,
-            header_details)
-        json_response = json.loads(response.text)
+        if max_records != None:
+            uri_params.append('maxRecords=' + str(max_records))
 
-        return json_response
+        uri = instance_url + Bulk2.base_bulk2_query_uri + '/' + job_id + '/results'
 
-    @staticmethod
-    def get_deleted(object_name, start_date_time, end_date_time, access_token, instance_url):
-        """
-        Retrieves the list of individual records that have been deleted within
-        the given timespan for the specified object. SObject Get Deleted is
-        available in API version 29.0 and later.
+        if len(uri_params) > 0:
+            uri += '?' + '&'.join(uri_params)
 
-        This resource is commonly used in data replication applications. Note
-        the following considerations:
-            * Results are returned for no more than 30 days previous to the day
-              the call is executed.
-            * Your client application can replicate any objects to which it has
-              sufficient permissions. For example, to replicate all data for
-              your organization, your client application must be logged in with
-              “View All Data” access rights to the specified object. Similarly,
-              the objects must be within your sharing rules.
-            * There is a limit of 600,000 IDs returned from this resource. If
-              more than 600,000 IDs would be returned, EXCEEDED_ID_LIMIT is
-              returned. You can correct the error by choosing start and end
-              dates that are closer together.
+        response = webservice.Tools.download_http_response(uri, header_details, file_object)
+        next_locator = response.headers.get('Sforce-Locator')
 
-        Args:
-            object_name (str): The name of the object to get deleted records for.
+        if next_locator in [None, '', 'null']:
+            next_locator = None
 
-            startDateTime (datetime): Starting date/time (Coordinated Universal
-                Time (UTC) time zone—not local— timezone) of the timespan for
-                which to retrieve the data. The API ignores the seconds portion
-                of the specified dateTime value (for example, 12:30:15 is
-                interpreted as 12:30:00 UTC).
+        return next_locator, int(response.headers.get('Sforce-NumberOfRecords', 0))
 
-            start_date_time (datetime): Ending date/time (Coordinated Universal
-                Time (UTC) time zone—not local— timezone) of the timespan for
-                which to retrieve the data. The API ignores the seconds portion
-                of the specified dateTime value (for example, 12:35:15 is
-                interpreted as 12:35:00 UTC).
+    @staticmethod
+    def download_query_results(job_id, sink, access_token, instance_url, max_records=None):
+        """
+        This method follows the Sforce-Locator of a finished query job through
+        every page of its results. Each page is streamed into a temporary file
+        and handed to the sink before the next one is downloaded, so an export
+        of any size only holds one page on disk and none in memory.
 
+        Args:
+            job_id (str): The job id returned by Bulk2.create_query_job
+            sink (object): Receives the pages. This is any object with a
+                           write_page(page_file) method that takes a binary
+                           file of CSV positioned at its start, like
+                           CsvFileSink or RowSink.
             access_token (str): This is the access_token value received from the
                                 login response
-
             instance_url (str): This is the instance_url value received from the
                                 login response
+            max_records (int): The maximum number of records in each page, or
+                               None to let Salesforce decide
 
         Returns:
-            dict: Returns a dictionary containing the record Ids that were
-                deleted and the latest record deleted in that window.
-                {
-                    'ids': ['<id 1>', ..., '<id N>'],
-                    'latestDateCovered': '2020-03-13T12:00:00.000+0000'
-                }
+            int: Returns the number of records downloaded
         """
-        get_deleted_uri = '/sobjects/' + object_name + '/deleted/?start=' + \
-            urllib.parse.quote(start_date_time.strftime('%Y-%m-%dT%H:%M:%SZ')) + '&end=' + \
-            urllib.parse.quote(end_date_time.strftime('%Y-%m-%dT%H:%M:%SZ'))
-
-        header_details = Util.get_standard_header(access_token)
+        locator = None
+        record_count = 0
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + get_deleted_uri,
-            header_details)
-        json_response = json.loads(response.text)
+        while True:
+            with tempfile.TemporaryFile() as page_file:
+                locator, page_record_count = Bulk2.download_query_results_page(job_id, page_file, locator,
+                                                                               max_records, access_token,
+                                                                               instance_url)
+                page_file.seek(0)
+                sink.write_page(page_file)
+                record_count += page_record_count
+
+            if locator is None:
+                break
 
-        return json_response
+        return record_count
 
     @staticmethod
-    def graph_composite_request(request_body, access_token, instance_url):
+    def query(query, sink, access_token, instance_url, query_all=False, max_records=None, polling_wait=None,
+              verbose=False, poller=None):
         """
-        https://developer.salesforce.com/docs/atlas.en-us.api_rest.meta/api_rest/resources_composite_graph_introduction.htm#!
+        This method runs a Bulk API 2.0 query job and streams its results into
+        a sink. If anything goes wrong while it runs the job is aborted, and if
+        the download of the results fails the job is deleted with its results.
+        The error that stopped the query is raised even if that cleanup fails.
 
-        Composite graphs provide an enhanced way to perform composite requests,
-        which execute a series of REST API requests in a single call.
-          * Regular composite requests allow you to execute a series of REST API
-            requests in a single call. And you can use the output of one request
-            as the input to a subsequent request.
-          * Composite graphs extend this by allowing you to assemble a more
-            complicated and complete series of related objects and records.
-          * Composite graphs also enable you to ensure that the steps in a given
-            set of operations are either all completed or all not completed.
-            This avoids requiring you to check for a mix of successful and
-            unsuccessful results.
-          * Regular composite requests have a limit of 25 subrequests. Composite
-            graphs increase this limit to 500. This gives a single API call much
-            greater power.
+        Example:
+            with open('accounts.csv', 'wb') as export_file:
+                Bulk2.query('SELECT Id, Name FROM Account', CsvFileSink(export_file), access_token, instance_url)
 
         Args:
-            request_body (dict): The request body contains a list of graphs.
-                Each graph must have a graphId, and a composite request. The
-                composite requests are then built just like the original
-                composite requests. An example request looks like this:
-                {
-                   "graphs": [{
-                      "graphId": "graph1",
-                      "compositeRequest": [{
-                            "body": {
-                               "name": "Cloudy Consulting"
-                            },
-                            "method": "POST",
-                            "referenceId": "reference_id_account_1",
-                            "url": "/services/data/v50.0/sobjects/Account/"
-                         },
-                         {
-                            "body": {
-                               "FirstName": "Nellie",
-                               "LastName": "Cashman",
-                               "AccountId": "@{reference_id_account_1.id}"
-                            },
-                            "method": "POST",
-                            "referenceId": "reference_id_contact_1",
-                            "url": "/services/data/v50.0/sobjects/Contact/"
-                         }
-                      ]
-                   }]
-                }
-
+            query (str): The SOQL query to run
+            sink (object): Receives the pages of results. See
+                           Bulk2.download_query_results
             access_token (str): This is the access_token value received from the
                                 login response
-
             instance_url (str): This is the instance_url value received from the
                                 login response
+            query_all (bool): If True, the query includes deleted and archived
+                              records
+            max_records (int): The maximum number of records in each page of
+                               results
+            polling_wait (int): The number of seconds between polls. If None,
+                                the job is polled adaptively.
+            verbose (bool): If True, print the job state while polling
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
 
         Returns:
-            dict: The dict returns an object containing a list of the graphs and
-                the results.
-                {
-                    "graphs": [
-                        {
-                            "graphId": "graph1",
-                            "graphResponse": {
-                                "compositeResponse": {
-                                    <response from the composite request>
-                                }
-                            }
-                        }
-                    ]
-                }
-
-            output_records = salesforce_records["graphs"][0]["graphResponse"]["compositeResponse"]
+            dict: Returns the final job info, with the number of records
+                  downloaded in numberRecordsDownloaded
         """
-        graph_uri = '/composite/graph'
+        job = Bulk2.create_query_job(query, query_all, access_token, instance_url)
 
-        header_details = Util.get_standard_header(access_token)
+        try:
+            job_info = Bulk2.wait_for_query_job(job['id'], polling_wait, verbose, access_token, instance_url,
+                                                poller)
+            job_info['numberRecordsDownloaded'] = Bulk2.download_query_results(job['id'], sink, access_token,
+                                                                               instance_url, max_records)
+        except BaseException:
+            try:
+                job_state = Bulk2.get_query_job_info(job['id'], access_token, instance_url)['state']
 
-        data_body_json = json.dumps(request_body, indent=4, separators=(',', ': '))
+                if job_state in ['UploadComplete', 'InProgress']:
+                    Bulk2.abort_query_job(job['id'], access_token, instance_url)
+                else:
+                    Bulk2.delete_query_job(job['id'], access_token, instance_url)
+            except Exception:
+                # the error that stopped the query is raised instead
+                pass
 
-        response = webservice.Tools.post_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + graph_uri, data_body_json,
-            header_details)
-        json_response = json.loads(response.text)
+            raise
 
-        return json_response
+        return job_info
 
 
-    @staticmethod
-    def get_object_describe(object_name, modified_since_date, access_token, instance_url):
+class OperationRouter:
+    """
+    This class picks the cheapest way to run a DML operation between sObject
+    Collections (Standard.perform_collection_operation), the Bulk API
+    (Bulk.perform_bulk_operation) and Bulk API 2.0. Each path has a latency
+    model of a fixed overhead plus a time per record, and an estimate of the
+    API calls it will use. The cost of a path is its estimated seconds plus
+    api_call_weight seconds for each API call, and the API calls are weighted
+    more heavily as the remaining API budget drops below low_budget_threshold.
+
+    The models start from default_models and are refit from each run made
+    with perform_operation, or from runs recorded with record_run, so the
+    router adapts to the org it is used against. Example:
+        router = OperationRouter()
+        result = router.perform_operation('Contact', 'update', records, access_token, instance_url)
+        print(result['path'])
+    """
+    default_models = {
+        'collections': {'fixed_seconds': 0.5, 'record_seconds': 0.005},
+        'bulk': {'fixed_seconds': 10.0, 'record_seconds': 0.001},
+        'bulk2': {'fixed_seconds': 20.0, 'record_seconds': 0.0005}
+    }
+    supported_operations = {
+        'collections': ['insert', 'update', 'upsert', 'delete'],
+        'bulk': ['insert', 'update', 'upsert', 'delete', 'hardDelete'],
+        'bulk2': ['insert', 'update', 'upsert', 'delete', 'hardDelete']
+    }
+    polling_wait = 5
+
+    def __init__(self, models=None, api_call_weight=1.0, low_budget_threshold=5000, history_size=50,
+                 bulk_batch_size=BULK_BATCH_MAX_RECORDS, max_workers=DEFAULT_MAX_WORKERS):
         """
-        Completely describes the individual metadata at all levels for the
-        specified object. For example, this can be used to retrieve the fields,
-        URLs, and child relationships for the Account object.
+        Args:
+            models (dict): Optional starting models that override
+                           default_models, e.g.:
+                               {'bulk': {'fixed_seconds': 6.0, 'record_seconds': 0.002}}
+            api_call_weight (float): The number of seconds one API call is
+                                     worth when comparing the paths
+            low_budget_threshold (int): When the remaining API calls drop below
+                                        this, the API call weight is scaled up
+                                        by low_budget_threshold / remaining
+            history_size (int): The number of recent runs per path used to
+                                refit the models
+            bulk_batch_size (int): The batch size used for the Bulk API path
+            max_workers (int): The maximum number of concurrent requests for
+                               the collections path
+        """
+        self.models = {}
+
+        for path, model in OperationRouter.default_models.items():
+            self.models[path] = dict(model)
+
+            if models and path in models:
+                self.models[path].update(models[path])
+
+        self.api_call_weight = api_call_weight
+        self.low_budget_threshold = low_budget_threshold
+        self.history_size = history_size
+        self.bulk_batch_size = bulk_batch_size
+        self.max_workers = max_workers
+        self.history = {path: [] for path in self.models}
+        self.lock = threading.Lock()
+
+    def estimate_seconds(self, path, record_count):
+        """
+        Estimates how long the path will take for the given number of records.
 
-        The If-Modified-Since header param should be provided as GMT time if it
-        is provided. If the object metadata has not changed since the provided
-        date, a 304 Not Modified status code is returned, with no response body.
+        Args:
+            path (str): collections, bulk or bulk2
+            record_count (int): The number of records in the operation
+
+        Returns:
+            float: The estimated number of seconds
+        """
+        model = self.models[path]
+
+        return model['fixed_seconds'] + model['record_seconds'] * record_count
+
+    def estimate_api_calls(self, path, record_count, payload_bytes=None):
+        """
+        Estimates how many API calls the path will use for the given number of
+        records, including the status polls for the bulk paths.
 
         Args:
-            object_name (str): The name of the object to get the describe
-                details for.
+            path (str): collections, bulk or bulk2
+            record_count (int): The number of records in the operation
+            payload_bytes (int): The approximate JSON size of the records
 
-            modified_since_date (datetime): If None, this header will not be
-                used. If provided, it will converted to appropriate format for
-                the header and time should be in GMT.
+        Returns:
+            int: The estimated number of API calls
+        """
+        if path == 'collections':
+            return max(1, math.ceil(record_count / COLLECTION_MAX_RECORDS))
 
-            access_token (str): This is the access_token value received from the
-                login response
+        polls = max(1, math.ceil(self.estimate_seconds(path, record_count) / OperationRouter.polling_wait))
+
+        if path == 'bulk':
+            # create, close, and one upload plus one result call per batch
+            batches = max(1, math.ceil(record_count / self.bulk_batch_size),
+                          math.ceil((payload_bytes or 0) / BULK_BATCH_MAX_BYTES))
+            return 2 + batches * 2 + polls
+
+        # create, upload, close, successful and failed results per job
+        jobs = max(1, math.ceil((payload_bytes or 0) / BULK2_UPLOAD_MAX_BYTES))
+        return jobs * 5 + polls
+
+    def estimate(self, operation_type, record_count, payload_bytes=None, remaining_api_calls=None):
+        """
+        Estimates the cost of every path that supports the operation.
+
+        Args:
+            operation_type (str): insert, update, upsert, delete or hardDelete
+            record_count (int): The number of records in the operation
+            payload_bytes (int): The approximate JSON size of the records
+            remaining_api_calls (int): The remaining daily API calls, e.g.
+                                       Standard.limits(...)['DailyApiRequests']['Remaining'].
+                                       If None, the budget isn't considered.
 
-            instance_url (str): This is the instance_url value received from the
-                login response
         Returns:
-            dict: Returns a dictionary with the metadata description of the
-                given object.
+            list: The candidate paths ordered from the cheapest to the most
+                  expensive. Paths that would use more API calls than
+                  remain are ordered last.
+                  example:
+                  [
+                      {
+                          "path": "collections",
+                          "seconds": 1.5,
+                          "api_calls": 1,
+                          "cost": 2.5,
+                          "within_budget": true
+                      },
+                      ...
+                  ]
         """
-        describe_uri = "/sobjects/{}/describe/".format(object_name)
+        api_call_weight = self.api_call_weight
 
-        header_details = Util.get_standard_header(access_token)
+        if remaining_api_calls is not None:
+            api_call_weight *= max(1.0, self.low_budget_threshold / max(remaining_api_calls, 1))
 
-        if modified_since_date:
-            modified_since_date = modified_since_date.strftime('%a, %-d %b %Y %H:%M:%S GMT')
-            header_details["If-Modified-Since"] = modified_since_date
+        candidates = []
+
+        with self.lock:
+            for path in ['collections', 'bulk', 'bulk2']:
+                if operation_type not in OperationRouter.supported_operations[path]:
+                    continue
+
+                seconds = self.estimate_seconds(path, record_count)
+                api_calls = self.estimate_api_calls(path, record_count, payload_bytes)
+
+                candidates.append({
+                    'path': path,
+                    'seconds': seconds,
+                    'api_calls': api_calls,
+                    'cost': seconds + api_call_weight * api_calls,
+                    'within_budget': remaining_api_calls is None or api_calls <= remaining_api_calls
+                })
+
+        candidates.sort(key=lambda candidate: (not candidate['within_budget'],
+                                               candidate['cost'] if candidate['within_budget']
+                                               else candidate['api_calls']))
+
+        return candidates
+
+    def choose_path(self, operation_type, record_count, payload_bytes=None, remaining_api_calls=None):
+        """
+        Picks the cheapest path for the operation. See estimate for the
+        details of the arguments.
+
+        Returns:
+            str: collections, bulk or bulk2
+        """
+        candidates = self.estimate(operation_type, record_count, payload_bytes, remaining_api_calls)
+
+        if not candidates:
+            raise ValueError('Unsupported operation: {}'.format(operation_type))
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Standard.base_standard_uri + 'v' + API_VERSION + describe_uri,
-            header_details)
-        json_response = json.loads(response.text)
+        return candidates[0]['path']
 
-        return json_response
+    def record_run(self, path, record_count, elapsed_seconds):
+        """
+        Records an observed run and refits the model for that path with a
+        least squares fit over the most recent history_size runs. Until runs
+        with different record counts have been seen, only the fixed overhead
+        is adjusted.
 
+        Args:
+            path (str): collections, bulk or bulk2
+            record_count (int): The number of records in the run
+            elapsed_seconds (float): How long the run took
+        """
+        with self.lock:
+            history = self.history[path]
+            history.append((record_count, elapsed_seconds))
+            del history[:-self.history_size]
 
-class Bulk:
-    """
-    This class is used for doing bulk operations. Please use this and not the
-    Standard class singular methods when you're performing DML operations. This
-    is faster and will use fewer of your API calls.
-    API details here: https://developer.salesforce.com/docs/atlas.en-us.api_asynch.meta/api_asynch/asynch_api_intro.htm
-    examples here: https://trailhead-salesforce-com.firelayers.net/en/api_basics/api_basics_bulk
-    Considerations here: https://developer.salesforce.com/docs/atlas.en-us.salesforce_app_limits_cheatsheet.meta/salesforce_app_limits_cheatsheet/salesforce_app_limits_platform_bulkapi.htm
-    """
-    base_bulk_uri = '/services/async/' + API_VERSION
-    batch_uri = '/job/'
+            model = self.models[path]
+            mean_records = sum(run[0] for run in history) / len(history)
+            mean_seconds = sum(run[1] for run in history) / len(history)
+            variance = sum((run[0] - mean_records) ** 2 for run in history)
 
-    @staticmethod
-    def get_job_status(job_id, polling_wait, verbose, access_token, instance_url):
+            if variance > 0:
+                covariance = sum((run[0] - mean_records) * (run[1] - mean_seconds) for run in history)
+                model['record_seconds'] = max(0.0, covariance / variance)
+
+            model['fixed_seconds'] = max(0.0, mean_seconds - model['record_seconds'] * mean_records)
+
+    def perform_operation(self, object_api_name, operation_type, records, access_token, instance_url,
+                          external_id_field_name=None, remaining_api_calls=None, path=None):
         """
-        This method is used for printing job status. If verbose = False, it will
-        ignore the print statements.
+        Runs the operation on the cheapest path and records the run to refine
+        the model for that path.
 
         Args:
-            job_id (str): The job id returned when creating a batch job
-            polling_wait (int): This is the number of seconds
+            object_api_name (str): The API Name of the object
+            operation_type (str): insert, update, upsert, delete or hardDelete
+            records (list): The record dicts to send. For deletes this can
+                            also be a list of record Ids.
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
                                 login response
+            external_id_field_name (str): REQUIRED WITH UPSERT. The external Id
+                                          field used to match records.
+            remaining_api_calls (int): The remaining daily API calls. If None,
+                                       the budget isn't considered.
+            path (str): Force a specific path instead of choosing one
 
         Returns:
-            objects: Prints the status of the bulk job and polls for an update
-                     ever polling_wait seconds until the numberBatchesQueued = 0,
-                     then it will break out and just returns the final job status
-                     response.
+            dict: The path used and the results from that path. collections
+                  and bulk results are the per-record results in the same
+                  order as the records. bulk2 results are a list with the
+                  final job info and the successful and failed results CSVs
+                  for each job.
+                  {
+                      "path": "collections",
+                      "results": [...]
+                  }
         """
-        header_details = Util.get_bulk_header(access_token)
+        records = list(records)
 
-        if verbose:
-            print("Status for job: {}".format(job_id))
+        if operation_type in ['delete', 'hardDelete']:
+            records = [{'Id': record} if isinstance(record, str) else record for record in records]
 
-        while True:
-            response = webservice.Tools.get_http_response(
-                instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id, header_details)
-            json_response = json.loads(response.text)
+        sample = records[:100]
+        payload_bytes = 0
 
-            if verbose:
-                print("Batches completed/failed/total: {}/{}/{}".format(json_response['numberBatchesCompleted'],
-                                                                        json_response['numberBatchesFailed'],
-                                                                        json_response['numberBatchesTotal']))
+        if sample:
+            payload_bytes = len(json.dumps(sample)) * len(records) // len(sample)
 
-            total_jobs_run = json_response['numberBatchesCompleted'] + json_response['numberBatchesFailed']
-            if total_jobs_run == json_response['numberBatchesTotal']:
-                break
+        if path is None:
+            path = self.choose_path(operation_type, len(records), payload_bytes, remaining_api_calls)
+
+        bulk_records = [{key: value for key, value in record.items() if key != 'attributes'} for record in records]
+        start_time = time.time()
+
+        if path == 'collections':
+            if operation_type == 'delete':
+                collection_records = [record.get('Id', record.get('id')) for record in records]
             else:
-                time.sleep(polling_wait)
+                collection_records = [record if 'attributes' in record
+                                      else dict(record, attributes={'type': object_api_name})
+                                      for record in records]
+
+            results = Standard.perform_collection_operation(operation_type, collection_records, access_token,
+                                                            instance_url, object_api_name,
+                                                            external_id_field_name=external_id_field_name or 'Id',
+                                                            max_workers=self.max_workers)
+        elif path == 'bulk':
+            results = Bulk.perform_bulk_operation(object_api_name, bulk_records, self.bulk_batch_size,
+                                                  operation_type, None, external_id_field_name, access_token,
+                                                  instance_url, verbose=False)
+        else:
+            bulk_jobs = [Bulk2.submit_ingest_job(object_api_name, operation_type, job_records, external_id_field_name,
+                                                 access_token, instance_url)
+                         for job_records in Util.pack_csv_by_size(bulk_records, None, BULK2_UPLOAD_MAX_BYTES)]
+            results = [bulk_job.get_results() for bulk_job in bulk_jobs]
 
-        return json_response
+        self.record_run(path, len(records), time.time() - start_time)
 
-    @staticmethod
-    def get_batch_result(job_id, batch_id, access_token, instance_url):
-        """
-        This method will retrieve the results of a batch operation.
+        return {'path': path, 'results': results}
+
+
+class BatchCoalescer:
+    """
+    This class combines single record calls made from many threads into
+    /composite/batch requests. Each call is queued and returns a Future right
+    away. The queue is sent as one Standard.batch_request when 25 calls have
+    accumulated or max_wait seconds after the first call was queued, and each
+    Future is resolved with the same value the matching Standard method would
+    return, or with the HTTPError it would raise.
+
+    Example:
+        with BatchCoalescer(access_token, instance_url) as coalescer:
+            future = coalescer.update_sobject_row('Account', account_id, {'Name': 'Acme'}, False)
+            print(future.result())
+    """
 
+    def __init__(self, access_token, instance_url, max_wait=0.005, max_batch_size=COMPOSITE_BATCH_MAX_REQUESTS,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        """
         Args:
-            job_id (str): The job id returned when creating a batch job
-            batch_id (str): This is the batch Id returned when creating a new
-                            batch
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
                                 login response
+            max_wait (float): The number of seconds to wait for more calls
+                              after the first call in a batch is queued
+            max_batch_size (int): The number of calls that triggers a batch
+                                  to be sent right away. This can't be more
+                                  than 25.
+            max_workers (int): The maximum number of batch requests sent at
+                               once
+        """
+        if max_batch_size > COMPOSITE_BATCH_MAX_REQUESTS:
+            raise ValueError('Composite batch requests can have at most {} subrequests'.format(
+                COMPOSITE_BATCH_MAX_REQUESTS))
+
+        self.access_token = access_token
+        self.instance_url = instance_url
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue()
+        self.closed = False
+        self.closed_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_sobject_row(self, object_name, record_id, field_list_string):
+        """
+        Queues a Standard.get_sobject_row call.
 
         Returns:
-            array: Returns the an array containing the results for each record
-                   in the given batch
+            Future: Resolves to the record dict.
         """
-        header_details = Util.get_bulk_header(access_token)
+        url = 'v' + API_VERSION + '/sobjects/' + object_name + '/' + record_id
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch/' + batch_id + '/result',
-            header_details)
-        json_response = json.loads(response.text)
+        if field_list_string != None:
+            url = url + '?fields=' + field_list_string
 
-        return json_response
+        return self.submit({'method': 'GET', 'url': url}, False, 'get')
 
-    @staticmethod
-    def get_query_result(job_id, batch_id, query_result_id, access_token, instance_url):
+    def create_sobject_row(self, object_name, record_json, run_assignment_rules):
         """
-        This method will retrieve the results of a batch operation.
-
-        Args:
-            job_id (str): The job id returned when creating a batch job
-            batch_id (str): This is the batch Id returned when creating a new
-                            batch
-            query_result_id (str): Ths is the Id returned with a successful
-                                   batch for a Salesforce bulk query.
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+        Queues a Standard.create_sobject_row call.
 
         Returns:
-            array: Returns the an array containing the results for the query
-                   request
+            Future: Resolves to the text of the creation response.
         """
-        header_details = Util.get_bulk_header(access_token)
+        url = 'v' + API_VERSION + '/sobjects/' + object_name + '/'
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch/' + batch_id + '/result' + '/' + query_result_id,
-            header_details)
-        json_response = json.loads(response.text)
+        return self.submit({'method': 'POST', 'url': url, 'richInput': record_json}, run_assignment_rules, 'create')
 
-        return json_response
+    def update_sobject_row(self, object_name, record_id, record_json, run_assignment_rules):
+        """
+        Queues a Standard.update_sobject_row call.
 
-    @staticmethod
-    def perform_bulk_operation(object_api_name, records, batch_size, operation_type, polling_wait,
-                               external_id_field_name, access_token, instance_url, concurrency_mode=None,
-                               verbose=True):
+        Returns:
+            Future: Resolves to 'Update Successful' if the update worked.
         """
-        This method updates a list of records provided as an object.
+        url = 'v' + API_VERSION + '/sobjects/' + object_name + '/' + record_id
+
+        return self.submit({'method': 'PATCH', 'url': url, 'richInput': record_json}, run_assignment_rules,
+                           'update')
+
+    def submit(self, batch_request, run_assignment_rules, call_type):
+        """
+        Queues a /composite/batch subrequest.
 
         Args:
-            object_api_name (str): The API Name of the object being updated
-            records (array): The list of records that needs to be updated. This
-                             Should be provided as an array. For example:
-                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
-            batch_size (int): This is the batch size of the records to process.
-                              If you were to pass 5000 records into the process
-                              with a batch size of 1000, then there would be 5
-                              batches processed.
-            operation_type (str): This is the operation being performed: delete,
-                                  insert, query, upsert, update, hardDelete
-            polling_wait (int): This is the number of seconds to wait between
-                                each poll for updates on the job
-            external_id_field_name (str): This is the external Id field that is
-                                          used to determine whether this record
-                                          will be inserted or updated. This is
-                                          required for upserts, but will default
-                                          to the record Id field
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
-            concurrency_mode (str): Can't update after creation. The concurrency
-                                    mode for the job. The valid values are:
-                                    Parallel: Process batches in parallel mode.
-                                              This is the default value.
-                                    Serial: Process batches in serial mode.
-                                            Processing in parallel can cause
-                                            database contention. When this is
-                                            severe, the job may fail. If
-                                            you're experiencing this issue,
-                                            submit the job with serial
-                                            concurrency mode. This guarantees
-                                            that batches are processed one at
-                                            a time. Note that using this
-                                            option may significantly increase
-                                            the processing time for a job.
+            batch_request (dict): The subrequest as described in
+                                  Standard.batch_request
+            run_assignment_rules (bool): Calls with different values are sent
+                                         in different batches
+            call_type (str): get, create or update, which decides how the
+                             subresponse is returned
 
         Returns:
-            object: Returns an object containing the status for each record that
-                    was put into the batch
+            Future: Resolves to the subresponse.
         """
-        header_details = Util.get_bulk_header(access_token)
-        body_details = {}
+        future = Future()
 
-        if external_id_field_name != None:
-            body_details = Util.get_bulk_job_body(object_api_name, operation_type, None, concurrency_mode,
-                                                  external_id_field_name)
-        else:
-            body_details = Util.get_bulk_job_body(object_api_name, operation_type, None, concurrency_mode)
+        # checked under the same lock close() takes, so nothing can be queued behind the stop marker
+        with self.closed_lock:
+            if self.closed:
+                raise RuntimeError('The BatchCoalescer has been closed')
 
-        chunked_records_list = Util.chunk(records, batch_size)
-        batch_ids = []
-        results_list = []
+            self.queue.put((batch_request, run_assignment_rules, call_type, future))
 
-        # create the bulk job
-        create_job_json_body = json.dumps(body_details, indent=4, separators=(',', ': '))
-        job_create_response = webservice.Tools.post_http_response(instance_url + Bulk.base_bulk_uri + Bulk.batch_uri,
-                                                                  create_job_json_body, header_details)
-        json_job_create_response = json.loads(job_create_response.text)
-        job_id = json_job_create_response['id']
+        return future
 
-        # loop through the record batches, and add them to the processing queue
-        for record_chunk in chunked_records_list:
-            records_json = json.dumps(record_chunk, indent=4, separators=(',', ': '))
-            job_batch_response = webservice.Tools.post_http_response(
-                instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch', records_json,
-                header_details)
-            json_job_batch_response = json.loads(job_batch_response.text)
-            batch_id = json_job_batch_response['id']
-            batch_ids.append(batch_id)
+    def close(self):
+        """
+        Sends everything that's queued, waits for the responses and stops the
+        background thread.
+        """
+        with self.closed_lock:
+            if not self.closed:
+                self.closed = True
+                self.queue.put(None)
 
-        # close the bulk job
-        close_body = {'state': 'Closed'}
-        json_close_body = json.dumps(close_body, indent=4, separators=(',', ': '))
-        close_response = webservice.Tools.post_http_response(
-            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id, json_close_body, header_details)
-        json_close_response = json.loads(close_response.text)
+        self.thread.join()
+        self.executor.shutdown(wait=True)
 
-        # set default job check polling to 5 seconds
-        if polling_wait is None:
-            polling_wait = 5
+    def run(self):
+        """
+        This is the background thread that collects the queued calls into
+        batches and hands them to the executor.
+        """
+        closing = False
 
-        # check job status until the job completes
-        Bulk.get_job_status(job_id, polling_wait, verbose, access_token, instance_url)
+        while not closing:
+            queued_call = self.queue.get()
 
-        # populate the results_list by appending the results of each batch
-        for this_batch_id in batch_ids:
-            batch_results = Bulk.get_batch_result(job_id, this_batch_id, access_token, instance_url)
-            results_list.extend(batch_results)
+            if queued_call is None:
+                break
 
-        return results_list
+            batch = [queued_call]
+            deadline = time.time() + self.max_wait
 
-    @staticmethod
-    def insert_sobject_rows(object_api_name, records, batch_size, polling_wait, access_token, instance_url,
-                            concurrency_mode=None):
+            while len(batch) < self.max_batch_size:
+                try:
+                    queued_call = self.queue.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+
+                if queued_call is None:
+                    closing = True
+                    break
+
+                batch.append(queued_call)
+
+            for run_assignment_rules in [False, True]:
+                batch_group = [queued_call for queued_call in batch if bool(queued_call[1]) == run_assignment_rules]
+
+                if batch_group:
+                    self.executor.submit(self.send, batch_group, run_assignment_rules)
+
+    def send(self, batch, run_assignment_rules):
         """
-        This method inserts a list of records provided as an object.
+        Sends one batch and resolves the Future of each call with its
+        subresponse.
+        """
+        try:
+            response = Standard.batch_request([queued_call[0] for queued_call in batch], False, self.access_token,
+                                              self.instance_url, run_assignment_rules)
+        except Exception as e:
+            for queued_call in batch:
+                queued_call[3].set_exception(e)
+            return
+
+        for queued_call, result in zip(batch, response['results']):
+            call_type = queued_call[2]
+            future = queued_call[3]
+
+            if result['statusCode'] >= 400:
+                future.set_exception(requests.exceptions.HTTPError(
+                    '{} Error for url: {} response: {}'.format(result['statusCode'], queued_call[0]['url'],
+                                                               result['result'])))
+            elif call_type == 'get':
+                future.set_result(result['result'])
+            elif call_type == 'update' and result['statusCode'] == 204:
+                future.set_result('Update Successful')
+            else:
+                future.set_result(json.dumps(result['result']))
+
+
+class JobPoller:
+    """
+    This class polls the status of any number of bulk jobs from one background
+    thread, so waiting on many jobs doesn't need a sleeping thread for each.
+    Each job is polled right away and then on its own schedule. The wait
+    starts at min_wait and grows by backoff after every poll that sees no
+    progress. When the job is moving and its total is known, the wait is cut
+    to the estimated time left, so it's polled again about when it should
+    finish, and without a total it grows more slowly. The wait is never more
+    than max_wait. The status checks run on a small pool, so a slow or hung
+    request only holds up its own job, and a check that takes longer than
+    check_timeout fails that job's Future with a TimeoutError.
+
+    Example:
+        status_check = Bulk.get_status_check(job_id, access_token, instance_url)
+        job_info = JobPoller.get_default().submit(status_check).result()
+    """
+    default_poller = None
+    default_poller_lock = threading.Lock()
 
+    def __init__(self, min_wait=0.5, max_wait=30, backoff=2.0, max_polls=None, rate_window=5, max_seconds=86400,
+                 check_timeout=300, max_workers=DEFAULT_MAX_WORKERS):
+        """
         Args:
-            object_api_name (str): The API Name of the object being updated
-            records (array): The list of records that needs to be updated. This
-                             Should be provided as an array. For example:
-                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
-            batch_size (int): This is the batch size of the records to process.
-                              If you were to pass 5000 records into the process
-                              with a batch size of 1000, then there would be 5
-                              batches processed.
-            polling_wait (int): This is the number of seconds to wait between
-                                each poll for updates on the job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                               login response
-            concurrency_mode (str): Can't update after creation. The concurrency
-                                    mode for the job. The valid values are:
-                                    Parallel: Process batches in parallel mode.
-                                              This is the default value.
-                                    Serial: Process batches in serial mode.
-                                            Processing in parallel can cause
-                                            database contention. When this is
-                                            severe, the job may fail. If
-                                            you're experiencing this issue,
-                                            submit the job with serial
-                                            concurrency mode. This guarantees
-                                            that batches are processed one at
-                                            a time. Note that using this
-                                            option may significantly increase
-                                            the processing time for a job.
+            min_wait (float): The number of seconds to wait after the first poll
+            max_wait (float): The most seconds to wait between polls
+            backoff (float): The factor the wait grows by after a poll that
+                             sees no progress
+            max_polls (int): The most polls for a single job, after which its
+                             Future fails with a TimeoutError. None doesn't
+                             limit the polls.
+            rate_window (int): The number of recent polls used to measure the
+                               rate of progress
+            max_seconds (float): The most seconds a single job is polled for,
+                                 after which its Future fails with a
+                                 TimeoutError. Defaults to a day. None doesn't
+                                 limit the time.
+            check_timeout (float): The most seconds a single status check can
+                                   take before the job's Future fails with a
+                                   TimeoutError
+            max_workers (int): The maximum number of status checks run at once
+        """
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.backoff = backoff
+        self.max_polls = max_polls
+        self.rate_window = rate_window
+        self.max_seconds = max_seconds
+        self.check_timeout = check_timeout
+        self.jobs = []
+        self.job_count = 0
+        self.checking = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def get_default():
+        """
+        Returns the poller shared by Bulk.get_job_status and
+        Bulk2.get_job_status, which is created the first time it's needed.
+
         Returns:
-            object: Returns an object containing the status for each record that
-                    was put into the batch
+            JobPoller: Returns the shared poller
         """
-        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, 'insert', polling_wait, None,
-                                             access_token, instance_url, concurrency_mode)
+        with JobPoller.default_poller_lock:
+            if JobPoller.default_poller is None:
+                JobPoller.default_poller = JobPoller()
 
-        return result
+            return JobPoller.default_poller
 
-    @staticmethod
-    def update_sobject_rows(object_api_name, records, batch_size, polling_wait, access_token, instance_url,
-                            concurrency_mode=None):
+    def submit(self, status_check, on_poll=None, polling_wait=None):
         """
-        This method updates a list of records provided as an object.
+        Starts polling a job.
 
         Args:
-            object_api_name (str): The API Name of the object being updated
-            records (array): The list of records that needs to be updated. This
-                             Should be provided as an array. For example:
-                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
-            batch_size (int): This is the batch size of the records to process.
-                              If you were to pass 5000 records into the process
-                              with a batch size of 1000, then there would be 5
-                              batches processed.
-            polling_wait (int): This is the number of seconds to wait between
-                                each poll for updates on the job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
-            concurrency_mode (str): Can't update after creation. The concurrency
-                                    mode for the job. The valid values are:
-                                    Parallel: Process batches in parallel mode.
-                                              This is the default value.
-                                    Serial: Process batches in serial mode.
-                                            Processing in parallel can cause
-                                            database contention. When this is
-                                            severe, the job may fail. If
-                                            you're experiencing this issue,
-                                            submit the job with serial
-                                            concurrency mode. This guarantees
-                                            that batches are processed one at
-                                            a time. Note that using this
-                                            option may significantly increase
-                                            the processing time for a job.
+            status_check (function): Called with no arguments for each poll. It
+                                     returns (is_done, status, processed,
+                                     total), where processed and total measure
+                                     the progress of the job. total can be None
+                                     if it isn't known.
+            on_poll (function): Optional function called as
+                                on_poll(status, seconds_left) after each poll.
+                                seconds_left is the estimated time until the
+                                job finishes, or None.
+            polling_wait (float): Poll every polling_wait seconds instead of
+                                  adapting the wait
+
         Returns:
-            object: Returns an object containing the status for each record that
-                    was put into the batch
+            Future: Resolves to the status of the poll that found the job done.
+                    Cancelling the Future stops the polling.
+        """
+        job = {'status_check': status_check, 'on_poll': on_poll, 'polling_wait': polling_wait, 'future': Future(),
+               'polls': 0, 'start_time': time.time()}
+        self.schedule(job, time.time())
+
+        return job['future']
+
+    def schedule(self, job, poll_time):
+        """
+        Queues the next poll of a job.
+        """
+        with self.condition:
+            heapq.heappush(self.jobs, (poll_time, self.job_count, job))
+            self.job_count += 1
+            self.condition.notify()
+
+    def run(self):
+        """
+        This is the background thread that hands each job to the pool when it's
+        due and fails the jobs whose status checks have taken too long.
+        """
+        while True:
+            with self.condition:
+                while True:
+                    now = time.time()
+
+                    for job_number, (deadline, job) in list(self.checking.items()):
+                        if deadline <= now:
+                            del self.checking[job_number]
+
+                            if not job['future'].done():
+                                job['future'].set_exception(TimeoutError(
+                                    'The status check took more than {} seconds'.format(self.check_timeout)))
+
+                    if len(self.jobs) > 0 and self.jobs[0][0] <= now:
+                        break
+
+                    wake_times = [deadline for deadline, job in self.checking.values()]
+
+                    if len(self.jobs) > 0:
+                        wake_times.append(self.jobs[0][0])
+
+                    self.condition.wait(min(wake_times) - now if wake_times else None)
+
+                poll_time, job_number, job = heapq.heappop(self.jobs)
+                self.checking[job_number] = (time.time() + self.check_timeout, job)
+
+            self.executor.submit(self.poll, job_number, job)
+
+    def poll(self, job_number, job):
         """
-        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, 'update', polling_wait, None,
-                                             access_token, instance_url, concurrency_mode)
+        Checks on a job once, then resolves its Future or schedules the next
+        poll. This runs on the pool.
+        """
+        status_check_error = None
 
-        return result
+        if not job['future'].cancelled():
+            try:
+                check_result = job['status_check']()
+            except Exception as e:
+                status_check_error = e
 
-    @staticmethod
-    def upsert_sobject_rows(object_api_name, records, batch_size, polling_wait, access_token, instance_url,
-                            external_id_field_name='Id', concurrency_mode=None):
+        # a check that timed out was already taken off the list and its Future failed
+        with self.condition:
+            if self.checking.pop(job_number, None) is None or job['future'].cancelled():
+                return
+
+            self.condition.notify()
+
+        try:
+            if status_check_error != None:
+                raise status_check_error
+
+            is_done, status, processed, total = check_result
+            job['polls'] += 1
+
+            if is_done:
+                seconds_left = 0
+            elif job['polling_wait'] != None:
+                wait = job['polling_wait']
+                seconds_left = None
+            else:
+                wait = self.get_next_wait(job, processed, total)
+                seconds_left = job['seconds_left']
+
+            if job['on_poll'] != None:
+                job['on_poll'](status, seconds_left)
+
+            if not is_done and self.max_polls != None and job['polls'] >= self.max_polls:
+                raise TimeoutError('The job still wasn\'t done after {} polls'.format(job['polls']))
+
+            if not is_done and self.max_seconds != None and time.time() - job['start_time'] >= self.max_seconds:
+                raise TimeoutError('The job still wasn\'t done after {} seconds'.format(self.max_seconds))
+        except Exception as e:
+            job['future'].set_exception(e)
+            return
+
+        if is_done:
+            job['future'].set_result(status)
+        else:
+            self.schedule(job, time.time() + wait)
+
+    def get_next_wait(self, wait_state, processed, total):
         """
-        This method upserts a list of records provided as an object.
+        Works out how long to wait before the next poll from the progress seen
+        so far, and stores the estimated seconds left in
+        wait_state['seconds_left'].
 
         Args:
-            object_api_name (str): The API Name of the object being updated
-            records (array): The list of records that needs to be updated. This
-                             Should be provided as an array. For example:
-                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
-            batch_size (int): This is the batch size of the records to process.
-                              If you were to pass 5000 records into the process
-                              with a batch size of 1000, then there would be 5
-                              batches processed.
-            polling_wait (int): This is the number of seconds to wait between
-                                each poll for updates on the job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
-            external_id_field_name (str): This is the external Id field that is
-                                          used to determine whether this record
-                                          will be inserted or updated. This is
-                                          required for upserts, but will default
-                                          to the record Id field
-            concurrency_mode (str): Can't update after creation. The concurrency
-                                    mode for the job. The valid values are:
-                                    Parallel: Process batches in parallel mode.
-                                              This is the default value.
-                                    Serial: Process batches in serial mode.
-                                            Processing in parallel can cause
-                                            database contention. When this is
-                                            severe, the job may fail. If
-                                            you're experiencing this issue,
-                                            submit the job with serial
-                                            concurrency mode. This guarantees
-                                            that batches are processed one at
-                                            a time. Note that using this
-                                            option may significantly increase
-                                            the processing time for a job.
+            wait_state (dict): The state kept between the polls of one job.
+                               Start with an empty dict.
+            processed (int): The progress of the job at this poll
+            total (int): The progress the job will have when it's done, or None
+
         Returns:
-            @return               Returns an object containing the status for each
-                                  record that was put into the batch
-        """
-        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, 'upsert', polling_wait,
-                                             external_id_field_name, access_token, instance_url, concurrency_mode)
+            float: Returns the number of seconds to wait
+        """
+        now = time.time()
+        history = wait_state.setdefault('history', [])
+        history.append((now, processed))
+        del history[:-self.rate_window]
+        wait = wait_state.get('wait')
+        wait_state['seconds_left'] = None
+
+        first_poll_time, first_processed = history[0]
+
+        if wait is None:
+            wait = self.min_wait
+        elif processed == history[-2][1]:
+            wait = wait * self.backoff
+        elif total != None and processed != None and first_processed != None and processed > first_processed:
+            rate = (processed - first_processed) / max(now - first_poll_time, 0.001)
+            wait_state['seconds_left'] = max(0, total - processed) / rate
+            wait = min(wait * self.backoff, wait_state['seconds_left'])
+        else:
+            # the job is moving, but without a total there's no telling when it will finish
+            wait = wait * math.sqrt(self.backoff)
 
-        return result
+        wait = min(max(wait, self.min_wait), self.max_wait)
+        wait_state['wait'] = wait
 
-    @staticmethod
-    def delete_sobject_rows(object_api_name, records, hard_delete, batch_size, polling_wait, access_token,
-                            instance_url):
+        return wait
+
+
+class BulkCheckpoint:
+    """
+    This class is the on disk journal of a bulk job, so a load can pick up
+    where it stopped after a crash instead of being sent again. Every step is
+    appended to the file as a line of JSON and synced before the load moves
+    on: the job, each batch with the offset and number of its records, the
+    end of the upload and the Id of each batch once its results have been
+    handed to the caller. Only the Ids are kept, so the journal stays small;
+    the results themselves are downloaded from Salesforce again when they're
+    needed after a resume. Delete the file once the results are safely
+    stored.
+
+    Example:
+        results = Bulk.perform_bulk_operation('Contact', records, 10000, 'update', None, None, access_token,
+                                              instance_url, checkpoint_path='contact-update.checkpoint')
+    """
+
+    def __init__(self, path):
         """
-        This method upserts a list of records provided as an object.
+        Args:
+            path (str): The path of the journal. It's read if it exists.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.job = None
+        self.batches = []
+        self.pending_batches = []
+        self.upload_complete = False
+        self.collected_batch_ids = set()
+
+        if os.path.exists(path):
+            valid_lines = []
+            is_truncated = False
+
+            with open(path) as checkpoint_file:
+                for line in checkpoint_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line was cut off by the crash
+                        is_truncated = True
+                        break
+
+                    self.apply(entry)
+                    valid_lines.append(line)
+
+            # the good entries are written to a new file that replaces the journal, so a crash while it's
+            # repaired can't lose them
+            if is_truncated:
+                temp_path = path + '.tmp'
+
+                with open(temp_path, 'w') as checkpoint_file:
+                    checkpoint_file.writelines(valid_lines)
+                    checkpoint_file.flush()
+                    os.fsync(checkpoint_file.fileno())
+
+                os.replace(temp_path, path)
+
+    def apply(self, entry):
+        """
+        Updates the state of the checkpoint with a journal entry.
+        """
+        event = entry['event']
+
+        if event == 'job':
+            self.job = entry
+            self.batches = []
+            self.pending_batches = []
+            self.upload_complete = False
+            self.collected_batch_ids = set()
+        elif event == 'pending_batch':
+            self.pending_batches.append(entry)
+        elif event == 'batch':
+            self.pending_batches = [pending_batch for pending_batch in self.pending_batches
+                                    if pending_batch['offset'] != entry['offset']]
+            self.batches.append(entry)
+        elif event == 'upload_complete':
+            self.upload_complete = True
+        elif event == 'collected':
+            self.collected_batch_ids.add(entry['batch_id'])
+
+    def record(self, event, **values):
+        """
+        Appends an entry to the journal and syncs it to disk.
 
         Args:
-            object_api_name (str): The API Name of the object being updated
-            records (array): The list of records that needs to be updated. This
-                             Should be provided as an array. For example:
-                             [{'id':'recordId', 'phone':'(123) 456-7890'}]
-            hard_delete (bool): This Bool indicates whether or not the record
-                                should be hard deleted. NOTE: There is a profile
-                                System Permission option called "Bulk API Hard
-                                Delete" that must be enabled for this option to
-                                work.
-            batch_size (int): This is the batch size of the records to process.
-                              If you were to pass 5000 records into the process
-                              with a batch size of 1000, then there would be 5
-                              batches processed.
-            polling_wait (int): This is the number of seconds to wait between
-                                each poll for updates on the job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response
+            event (str): job, pending_batch, batch, upload_complete or
+                         collected
+            values: The values of the entry
+        """
+        entry = dict(values, event=event)
+
+        with self.lock:
+            with open(self.path, 'a') as checkpoint_file:
+                checkpoint_file.write(json.dumps(entry) + '\n')
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
 
+            self.apply(entry)
+
+    def get_batch_ids(self):
+        """
         Returns:
-            object: Returns an object containing the status for each record that
-                    was put into the batch
+            array: Returns the Ids of the uploaded batches in the order of their
+                   records
         """
-        delete_type = 'delete'
+        return [batch['id'] for batch in sorted(self.batches, key=lambda batch: batch['offset'])]
 
-        if hard_delete:
-            delete_type = 'hardDelete'
+    def get_uploaded_count(self):
+        """
+        Returns:
+            int: Returns the number of records uploaded without a gap from the
+                 first record
+        """
+        uploaded_count = 0
 
-        result = Bulk.perform_bulk_operation(object_api_name, records, batch_size, delete_type, polling_wait, None,
-                                             access_token, instance_url)
+        for batch in sorted(self.batches, key=lambda batch: batch['offset']):
+            if batch['offset'] != uploaded_count:
+                break
 
-        return result
+            uploaded_count += batch['count']
 
-    @staticmethod
-    def query_sobject_rows(object_api_name, query, query_all, access_token, instance_url, verbose=True):
-        """
-        This returns the result for a bulk query operations.
+        return uploaded_count
+
+
+class BulkJob:
+    """
+    This class is the handle of a Bulk API or Bulk API 2.0 job returned by
+    Bulk.submit_bulk_operation and Bulk2.submit_ingest_job. The job is polled
+    in the background by a JobPoller, so one process can drive many jobs at
+    once without a thread sleeping for each of them.
+
+    Example:
+        bulk_jobs = [Bulk.submit_bulk_operation('Contact', records, 10000, 'update', None, access_token,
+                                                instance_url) for records in record_groups]
+        done, not_done = BulkJob.wait_any(bulk_jobs)
+        results = done[0].get_results()
+    """
 
+    def __init__(self, api, job_id, access_token, instance_url, batch_ids=None, record_count=None,
+                 polling_wait=None, verbose=False, poller=None, checkpoint=None):
+        """
         Args:
-            object_api_name (str): The API Name of the object being updated
-            query (str): The query you'd like to run to retrieve records
-            query_all (bool): State whether or not this query should query all
-                              records (so you can get deleted records)
+            api (str): bulk for a Bulk API job or bulk2 for a Bulk API 2.0 job
+            job_id (str): The Id of the job
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
                                 login response
+            batch_ids (array): The Ids of the Bulk API batches, in the order of
+                               the records
+            record_count (int): The number of records in a Bulk API 2.0 job, so
+                                the time left can be estimated
+            polling_wait (int): The number of seconds between polls. If None,
+                                the job is polled adaptively.
+            verbose (bool): If True, print the job status after each poll
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
+            checkpoint (BulkCheckpoint): The journal of the job, which keeps
+                                         the Id of each batch once its
+                                         results are collected
+        """
+        if api == 'bulk':
+            self.job_status_check = Bulk.get_status_check(job_id, access_token, instance_url)
+            status_check = self.check_bulk_status
+        elif api == 'bulk2':
+            status_check = Bulk2.get_status_check(job_id, access_token, instance_url, record_count)
+        else:
+            raise ValueError('api must be bulk or bulk2')
+
+        self.api = api
+        self.job_id = job_id
+        self.access_token = access_token
+        self.instance_url = instance_url
+        self.batch_ids = batch_ids or []
+        self.record_count = record_count
+        self.polling_wait = polling_wait
+        self.verbose = verbose
+        self.checkpoint = checkpoint
+        self.status = None
+        self.seconds_left = None
+        self.results = None
+        self.results_lock = threading.Lock()
+        self.batch_events = None
 
-        Returns:
-            object: Returns an array of results for the specified query
-        """
-        header_details = Util.get_bulk_header(access_token)
-        batch_results_list = []
-        query_result_list = []
+        if verbose:
+            print("Status for job: {}".format(job_id))
 
-        query_type = 'query'
+        if poller is None:
+            poller = JobPoller.get_default()
 
-        if query_all:
-            query_type = 'queryAll'
+        self.future = poller.submit(status_check, self.update_status, polling_wait)
 
-        # create the bulk job
-        job_body_details = Util.get_bulk_job_body(object_api_name, query_type, None, None)
-        create_job_json_body = json.dumps(job_body_details, indent=4, separators=(',', ': '))
-        job_create_response = webservice.Tools.post_http_response(instance_url + Bulk.base_bulk_uri + Bulk.batch_uri,
-                                                                  create_job_json_body, header_details)
-        json_job_create_response = json.loads(job_create_response.text)
-        job_id = json_job_create_response['id']
+    def check_bulk_status(self):
+        """
+        This is the status check of a Bulk API job. While iter_batch_results is
+        running, the batches are polled instead and handed to it, so one poll
+        serves both, and the job info is only checked once every batch has
+        finished.
+        """
+        batch_events = self.batch_events
 
-        # create the query request batch
-        job_batch_response = webservice.Tools.post_http_response(
-            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id + '/batch', query, header_details)
-        json_job_batch_response = json.loads(job_batch_response.text)
-        batch_id = json_job_batch_response['id']
+        if batch_events != None:
+            batch_info_list = Bulk.get_batch_info_list(self.job_id, self.access_token, self.instance_url)
+            batch_events.put(('batches', batch_info_list))
+            finished_count = len([batch_info for batch_info in batch_info_list
+                                  if batch_info['state'] in ('Completed', 'Failed', 'NotProcessed')])
 
-        # close the bulk job
-        close_body = {'state': 'Closed'}
-        json_close_body = json.dumps(close_body, indent=4, separators=(',', ': '))
-        close_response = webservice.Tools.post_http_response(
-            instance_url + Bulk.base_bulk_uri + Bulk.batch_uri + '/' + job_id, json_close_body, header_details)
-        json_close_response = json.loads(close_response.text)
+            if finished_count < len(batch_info_list):
+                if self.verbose:
+                    print("Batches completed/total: {}/{}".format(finished_count, len(batch_info_list)))
 
-        # check job status until the job completes
-        Bulk.get_job_status(job_id, 5, verbose, access_token, instance_url)
+                return False, None, finished_count, len(batch_info_list)
 
-        # get results
-        batch_results = Bulk.get_batch_result(job_id, batch_id, access_token, instance_url)
-        batch_results_list.extend(batch_results)
+        return self.job_status_check()
 
-        for query_result_id in batch_results_list:
-            query_result = Bulk.get_query_result(job_id, batch_id, query_result_id, access_token, instance_url)
-            query_result_list.extend(query_result)
+    def update_status(self, status, seconds_left):
+        """
+        Keeps the job info and the estimated seconds left from the latest poll.
+        """
+        self.seconds_left = seconds_left
 
-        return query_result_list
+        # a poll of the batches alone has no job info
+        if status is None:
+            return
 
+        self.status = status
 
-class Bulk2:
-    """
-    Bulk API 2.0 provides a simple interface for quickly loading large amounts
-    of data into your Salesforce org. Currently csv is the only supported format.
+        if self.verbose:
+            if self.api == 'bulk':
+                Bulk.print_job_status(status)
+            else:
+                Bulk2.print_job_status(status)
 
-    https://developer.salesforce.com/docs/atlas.en-us.api_bulk_v2.meta/api_bulk_v2/introduction_bulk_api_2.htm
-    """
-    base_bulk2_uri = '/services/data/v' + API_VERSION + '/jobs/ingest'
+    def done(self):
+        """
+        Returns:
+            bool: Returns True once the job has finished processing
+        """
+        return self.future.done()
 
-    @staticmethod
-    def get_job_list(is_pk_chunking_enabled, job_type, query_locator, access_token, instance_url):
+    def wait(self, timeout=None):
         """
-        Retrieves all jobs in the org.
+        Waits for the job to finish processing.
 
         Args:
-            is_pk_chunking_enabled (bool): If set to true, filters jobs with PK
-                                           chunking enabled.
-            job_type (str): Filters jobs based on job type. Valid values include:
-                            BigObjectIngest—BigObjects job
-                            Classic—Bulk API 1.0 job
-                            V2Ingest—Bulk API 2.0 job
-            query_locator (int): Use queryLocator with a locator value to get a
-                                 specific set of job results. Get All Jobs returns
-                                 up to 1000 result rows per request, along with
-                                 a nextRecordsUrl value that contains the locator
-                                 value used to get the next set of results.
+            timeout (float): The most seconds to wait, or None to wait as long
+                             as it takes
 
         Returns:
-            dict: Object containing a list of every job and the details of the
-                  jobs.
-                  done (bool): Indicates whether there are more jobs to get. If
-                               false, use the nextRecordsUrl value to retrieve
-                               the next group of jobs.
-                  records (dict): The same details of the job that can be
-                                  retrieved with the get_job_info.
-                  nextRecordsUrl (str): A URL that contains a query locator used
-                                        to get the next set of results in a
-                                        subsequent request if done isn’t true.
+            dict: Returns the final job info
         """
-        header_details = Util.get_standard_header(access_token)
+        return self.future.result(timeout)
 
-        uri_params = []
-        uri_param_string = ""
+    def get_results(self, timeout=None, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Waits for the job to finish and downloads its results. They're only
+        downloaded once, so calling this again returns the same results.
 
-        if is_pk_chunking_enabled:
-            uri_params.append("isPkChunkingEnabled=true")
+        Args:
+            timeout (float): The most seconds to wait for the job to finish
+            max_workers (int): The maximum number of batch results downloaded
+                               at once
 
-        if job_type:
-            uri_params.append("jobType=" + job_type)
+        Returns:
+            object: For a Bulk API job, returns the result of each record in
+                    the order of the records. For a Bulk API 2.0 job, returns a
+                    dict with the final job info and the successfulResults and
+                    failedResults CSVs.
+        """
+        job_info = self.wait(timeout)
 
-        if query_locator:
-            uri_params.append("queryLocator=" + str(query_locator))
+        with self.results_lock:
+            if self.results is None:
+                if self.api == 'bulk':
+                    self.results = [result for batch_results in Util.map_concurrent(self.get_batch_result,
+                                                                                    self.batch_ids, max_workers)
+                                    for result in batch_results]
+                else:
+                    self.results = {
+                        'job': job_info,
+                        'successfulResults': Bulk2.get_success_results(self.job_id, self.access_token,
+                                                                       self.instance_url),
+                        'failedResults': Bulk2.get_failed_results(self.job_id, self.access_token, self.instance_url)
+                    }
 
-        if uri_params:
-            uri_param_string = "?" + "&".join(uri_params)
+            return self.results
 
-        response = webservice.Tools.get_http_response(instance_url + Bulk2.base_bulk2_uri + uri_param_string,
-                                                      header_details)
+    def get_batch_result(self, batch_id):
+        """
+        Downloads the results of a batch of the job.
 
-    @staticmethod
-    def create_job(object_name, operation, external_id_field_name, column_delimiter, content_type, line_ending,
-                   access_token, instance_url):
+        Args:
+            batch_id (str): The Id of the batch
+
+        Returns:
+            array: Returns the result of each record in the batch
         """
-        Creates a job, which represents a bulk operation (and associated data)
-        that is sent to Salesforce for asynchronous processing. Provide job data
-        via an Upload Job Data request, or as part of a multipart create job
-        request.
+        return Bulk.get_batch_result(self.job_id, batch_id, self.access_token, self.instance_url)
+
+    def iter_batch_results(self, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        This generator downloads the results of each batch of a Bulk API job
+        as soon as that batch finishes, so they can be processed while the
+        other batches are still running. The batches are polled by the job's
+        own JobPoller check while this runs. Once every batch is yielded,
+        get_results returns the same results without downloading them again.
+
+        With a checkpoint, each batch is recorded as collected once the caller
+        asks for the next one, and the batches collected before a resume
+        aren't yielded again. A batch the caller was still working on when it
+        stopped is yielded again.
 
         Args:
-            object_name (str): Required. The object type for the data being
-                               processed. Use only a single object type per job.
-            operation (str): Required. The processing operation for the job.
-                             Valid values are:
-                                insert
-                                delete
-                                update
-                                upsert
-            external_id_field_name (str): Required for upsert operations. The
-                                          external ID field in the object being
-                                          updated. Only needed for upsert
-                                          operations. Field values must also
-                                          exist in CSV job data.
-            column_delimiter (str): Optional. The column delimiter used for CSV
-                                    job data. The default value is COMMA. Valid
-                                    values are:
-                                        BACKQUOTE—backquote character (`)
-                                        CARET—caret character (^)
-                                        COMMA—comma character (,) which is the
-                                            default delimiter
-                                        PIPE—pipe character (|)
-                                        SEMICOLON—semicolon character (;)
-                                        TAB—tab character
-            content_type (str): Optional. The content type for the job. The only
-                                valid value (and the default) is CSV.
-            line_ending (str): Optional. The line ending used for CSV job data,
-                               marking the end of a data row. The default is LF.
-                               Valid values are:
-                                    LF—linefeed character
-                                    CRLF—carriage return character followed by a
-                                        linefeed character
+            max_workers (int): The maximum number of batch results downloaded
+                               at once
+
+        Returns:
+            tuple: Yields (batch_info, batch_results) for each batch as its
+                   results are downloaded, in no particular order.
+                   batch_results is None for a failed batch, whose reason is
+                   the stateMessage of batch_info.
+        """
+        if self.api != 'bulk':
+            raise ValueError('Only Bulk API jobs have batches')
+
+        def get_result(batch_info):
+            if batch_info['state'] == 'Failed':
+                return None
+
+            return self.get_batch_result(batch_info['id'])
+
+        batch_events = queue.Queue()
+        batch_results_by_id = {}
+        submitted_batch_ids = set()
+
+        if self.checkpoint != None:
+            submitted_batch_ids.update(self.checkpoint.collected_batch_ids)
+
+        def submit_batches(executor, batch_info_list):
+            submitted_count = 0
+
+            for batch_info in batch_info_list:
+                if batch_info['state'] in ('Completed', 'Failed') and batch_info['id'] not in submitted_batch_ids:
+                    submitted_batch_ids.add(batch_info['id'])
+                    future = executor.submit(get_result, batch_info)
+                    future.add_done_callback(lambda future, batch_info=batch_info:
+                                             batch_events.put(('result', (batch_info, future))))
+                    submitted_count += 1
+
+            return submitted_count
+
+        # the poller hands each batch list to this generator, and the downloads post their results to the same
+        # queue, so the finished ones are yielded as soon as they're ready
+        self.batch_events = batch_events
+        self.future.add_done_callback(lambda future: batch_events.put(('done', future)))
+        pending_count = 0
+        is_done = False
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers or 1)) as executor:
+                while not is_done or pending_count > 0:
+                    event, value = batch_events.get()
+
+                    if event == 'batches':
+                        pending_count += submit_batches(executor, value)
+                    elif event == 'result':
+                        batch_info, future = value
+                        pending_count -= 1
+                        batch_results = future.result()
+                        batch_results_by_id[batch_info['id']] = batch_results
+
+                        yield batch_info, batch_results
+
+                        # the caller is done with the batch once it asks for the next one
+                        if self.checkpoint != None:
+                            self.checkpoint.record('collected', batch_id=batch_info['id'])
+                    elif not is_done:
+                        # raises the error if the job failed or timed out
+                        value.result()
+                        is_done = True
+                        pending_count += submit_batches(executor, Bulk.get_batch_info_list(
+                            self.job_id, self.access_token, self.instance_url))
+        finally:
+            self.batch_events = None
+
+        with self.results_lock:
+            if self.results is None and all(batch_results_by_id.get(batch_id) != None
+                                            for batch_id in self.batch_ids):
+                self.results = [result for batch_id in self.batch_ids for result in batch_results_by_id[batch_id]]
+
+    @staticmethod
+    def resume(checkpoint_path, access_token, instance_url, polling_wait=None, verbose=False, poller=None):
+        """
+        Reattaches to the job in a BulkCheckpoint journal after a crash, so it
+        can be waited on and its results downloaded without sending the records
+        again. If the upload didn't finish, run the load again with the same
+        checkpoint_path instead, so the rest of the records are uploaded.
+
+        Args:
+            checkpoint_path (str): The path of the journal
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
                                 login response
+            polling_wait (int): The number of seconds between polls. If None,
+                                the job is polled adaptively.
+            verbose (bool): If True, print the job status after each poll
+            poller (JobPoller): The poller to use. Defaults to
+                                JobPoller.get_default()
 
         Returns:
-            dict: Returns data about the job. The "id" field provides the job Id
-                  necessary for the remaining calls. Create job response details:
-                  https://developer.salesforce.com/docs/atlas.en-us.api_bulk_v2.meta/api_bulk_v2/create_job.htm
+            BulkJob: Returns the handle of the job
         """
-        header_details = Util.get_standard_header(access_token)
-        header_details["Content-Type"] = "application/json; charset=UTF-8"
-        header_details["Accept"] = "application/json"
+        checkpoint = BulkCheckpoint(checkpoint_path)
 
-        post_body = {}
-        post_body["object"] = object_name
-        post_body["operation"] = operation
+        if checkpoint.job is None:
+            raise ValueError('There is no job in {}'.format(checkpoint_path))
 
-        if external_id_field_name:
-            post_body["externalIdFieldName"] = external_id_field_name
+        if checkpoint.job['api'] == 'bulk':
+            Bulk.reconcile_checkpoint(checkpoint, access_token, instance_url)
 
-        if column_delimiter:
-            post_body["columnDelimiter"] = column_delimiter
+        if not checkpoint.upload_complete:
+            raise ValueError('The upload of job {} didn\'t finish. Run the load again with the same checkpoint_path '
+                             'to upload the rest of the records.'.format(checkpoint.job['job_id']))
 
-        if content_type:
-            post_body["contentType"] = content_type
+        return BulkJob(checkpoint.job['api'], checkpoint.job['job_id'], access_token, instance_url,
+                       checkpoint.get_batch_ids(), checkpoint.job.get('record_count'), polling_wait, verbose, poller,
+                       checkpoint)
 
-        if line_ending:
-            post_body["lineEnding"] = line_ending
+    @staticmethod
+    def wait_any(bulk_jobs, timeout=None):
+        """
+        Waits until at least one of the jobs has finished processing.
 
-        json_post_body_data = json.dumps(post_body, indent=4, separators=(',', ': '))
-        response = webservice.Tools.post_http_response(instance_url + Bulk2.base_bulk2_uri, json_post_body_data,
-                                                       header_details)
-        json_response = json.loads(response.text)
+        Args:
+            bulk_jobs (array): The BulkJob handles to wait on
+            timeout (float): The most seconds to wait, or None to wait as long
+                             as it takes
 
-        return json_response
+        Returns:
+            tuple: Returns (done, not_done), the lists of the jobs that have
+                   and haven't finished, in the order they were given
+        """
+        wait([bulk_job.future for bulk_job in bulk_jobs], timeout, FIRST_COMPLETED)
+
+        return ([bulk_job for bulk_job in bulk_jobs if bulk_job.done()],
+                [bulk_job for bulk_job in bulk_jobs if not bulk_job.done()])
 
     @staticmethod
-    def upload_csv_batch(data_set, job_id, access_token, instance_url):
+    def wait_all(bulk_jobs, timeout=None):
         """
-        Uploads data for a job using CSV data you provide.
+        Waits until all of the jobs have finished processing.
 
         Args:
-            data_set (str): This is a base64 encoded csv set.
-            job_id (str): This is the job id from the Bulk2.create_job response.
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response.
+            bulk_jobs (array): The BulkJob handles to wait on
+            timeout (float): The most seconds to wait, or None to wait as long
+                             as it takes
 
         Returns:
-            int: Returns the status code. If the upload was successful, the
-                 response code should be 201.
+            tuple: Returns (done, not_done), the lists of the jobs that have
+                   and haven't finished, in the order they were given
         """
-        header_details = Util.get_standard_header(access_token)
-        header_details["Content-Type"] = "text/csv"
-        header_details["Accept"] = "application/json"
+        wait([bulk_job.future for bulk_job in bulk_jobs], timeout)
 
-        response = webservice.Tools.put_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/batches',
-                                                      data_set, header_details)
+        return ([bulk_job for bulk_job in bulk_jobs if bulk_job.done()],
+                [bulk_job for bulk_job in bulk_jobs if not bulk_job.done()])
 
-        return response.status_code
 
-    @staticmethod
-    def change_job_state(job_state, job_id, access_token, instance_url):
+class ChangeTracker:
+    """
+    This class is a unit of work that sends only the fields that changed.
+    Records are snapshotted when they are tracked, e.g. as they come back from
+    Standard.query or Standard.retrieve, and can then be edited in place. When
+    flush is called, each record is compared to its snapshot, records with no
+    changes are skipped, and only the changed fields are sent through
+    Standard.perform_collection_operation or Bulk.update_sobject_rows.
+
+    Example:
+        tracker = ChangeTracker()
+        records = tracker.track(Standard.query(query_string, access_token, instance_url)['records'])
+        records[0]['Phone'] = '(123) 456-7890'
+        results = tracker.flush(access_token, instance_url)
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.snapshots = {}
+
+    def track(self, records, object_name=None):
         """
-        Closes or aborts a job. If you close a job, Salesforce queues the job
-        and uploaded data for processing, and you can’t add any additional job
-        data. If you abort a job, the job does not get queued or processed.
+        Snapshots the records so their changes can be found later. Records
+        without an Id are ignored, and so are the None placeholders
+        Standard.retrieve returns for the Ids it didn't find.
 
         Args:
-            job_state (str): The state to update the job to. Use UploadComplete
-                             to close a job, or Aborted to abort a job.
-            job_id (str): The job id returned by Bulk2.create_job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response.
+            records (list): The record dicts to track. These are the same dicts
+                            that should be edited.
+            object_name (str): The API name of the object. If None, this is
+                               read from the attributes of each record.
 
         Returns:
-            dict: Returns the current job state details.
+            list: The same records that were passed in
         """
-        header_details = Util.get_standard_header(access_token)
+        for record in records:
+            if record is None:
+                continue
 
-        request_body = {"state": job_state}
+            record_id = record.get('Id')
 
-        json_request_body = json.dumps(request_body, indent=4, separators=(',', ': '))
-        response = webservice.Tools.patch_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id,
-                                                        json_request_body, header_details)
-        json_response = json.loads(response.text)
+            if record_id is None:
+                continue
 
-        return json_response
+            record_object_name = object_name or record.get('attributes', {}).get('type')
 
-    @staticmethod
-    def delete_job(job_id, access_token, instance_url):
+            if record_object_name is None:
+                raise ValueError('No object name for record {}'.format(record_id))
+
+            self.records[record_id] = (record_object_name, record)
+            self.snapshots[record_id] = copy.deepcopy(record)
+
+        return records
+
+    def untrack(self, record_ids):
         """
-        Deletes a job. To be deleted, a job must have a state of UploadComplete,
-        JobComplete, Aborted, or Failed.
+        Stops tracking the records with the given Ids.
 
         Args:
-            job_id (str): The job id returned by Bulk2.create_job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response.
+            record_ids (list): The Ids of the records to stop tracking
+        """
+        for record_id in record_ids:
+            self.records.pop(record_id, None)
+            self.snapshots.pop(record_id, None)
+
+    def get_changes(self):
+        """
+        Compares each tracked record to its snapshot. Fields removed from a
+        record and relationship fields (dict values) are not treated as
+        changes, and setting a field to None will set it to null.
 
         Returns:
-            int: Returns the http status code. Should be 204 which indicates the
-                 job was deleted successfully.
+            dict: The changed fields of each changed record, grouped by object
+                  name.
+                  {
+                      "Account": [
+                          {"Id": "001xx000003DGb2AAG", "Phone": "(123) 456-7890"}
+                      ]
+                  }
         """
-        header_details = Util.get_standard_header(access_token)
+        changes = {}
 
-        response = webservice.Tools.delete_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id, None,
-                                                         header_details)
+        for record_id, (object_name, record) in self.records.items():
+            snapshot = self.snapshots.get(record_id)
 
-        return response.status_code
+            if record is None or snapshot is None:
+                continue
 
-    @staticmethod
-    def get_job_info(job_id, access_token, instance_url):
+            changed_fields = {}
+
+            for field_name, value in record.items():
+                if field_name == 'attributes' or isinstance(value, dict):
+                    continue
+
+                if field_name not in snapshot or snapshot[field_name] != value:
+                    changed_fields[field_name] = copy.deepcopy(value)
+
+            if changed_fields:
+                changed_fields['Id'] = record_id
+                changes.setdefault(object_name, []).append(changed_fields)
+
+        return changes
+
+    def flush(self, access_token, instance_url, use_bulk=False, batch_size=BULK_BATCH_MAX_RECORDS,
+              polling_wait=None, max_workers=DEFAULT_MAX_WORKERS):
         """
-        Retrieves detailed information about a job.
+        Sends the changed fields of every changed record. Records that are
+        saved successfully are snapshotted again, so they won't be sent again
+        unless they change again.
 
         Args:
-            job_id (str): The job id returned by Bulk2.create_job
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
-                                login response.
+                                login response
+            use_bulk (bool): If True, send the changes with
+                             Bulk.update_sobject_rows instead of sObject
+                             Collections
+            batch_size (int): The bulk batch size if use_bulk is True
+            polling_wait (int): The bulk polling wait if use_bulk is True
+            max_workers (int): The maximum number of collection requests sent
+                               at once
 
         Returns:
-            dict: Returns details about the status of the given job. If the job
-                  succeeds, the status will be 'JobComplete' vs 'Failed' for
-                  a failed job. More details here:
-                  https://developer.salesforce.com/docs/atlas.en-us.api_bulk_v2.meta/api_bulk_v2/get_job_info.htm
+            list: The changes sent and the result for each record.
+                  [
+                      {
+                          "object": "Account",
+                          "changes": {"Id": "001xx000003DGb2AAG", "Phone": "(123) 456-7890"},
+                          "result": {"id": "001xx000003DGb2AAG", "success": true, "errors": []}
+                      }
+                  ]
         """
-        header_details = Util.get_standard_header(access_token)
+        flush_results = []
 
-        response = webservice.Tools.get_http_response(instance_url + Bulk2.base_bulk2_uri + '/' + job_id,
-                                                      header_details)
-        json_response = json.loads(response.text)
+        for object_name, changes in self.get_changes().items():
+            if use_bulk:
+                results = Bulk.update_sobject_rows(object_name, changes, batch_size, polling_wait, access_token,
+                                                   instance_url)
+            else:
+                collection_records = [dict(changed_fields, attributes={'type': object_name})
+                                      for changed_fields in changes]
+                results = Standard.perform_collection_operation('update', collection_records, access_token,
+                                                                instance_url, max_workers=max_workers)
 
-        return json_response
+            for changed_fields, result in zip(changes, results):
+                if result.get('success') and changed_fields['Id'] in self.snapshots:
+                    self.snapshots[changed_fields['Id']].update(copy.deepcopy(changed_fields))
 
-    @staticmethod
-    def get_job_status(job_id, polling_wait, verbose, access_token, instance_url):
-        """
-        This method is used for printing job status. If verbose is False it will
-        still wait but ignore the print statements.
+                flush_results.append({'object': object_name, 'changes': changed_fields, 'result': result})
+
+        return flush_results
+
+
+class WriteBehindBuffer:
+    """
+    This class buffers inserts, updates, upserts and deletes so event driven
+    code can write one record at a time without making an API call for each.
+    Writes to the same record Id (or upsert external Id) are merged, so two
+    updates are sent as one and a delete replaces any pending update, while
+    an update of a record with a pending delete raises a RuntimeError. The
+    buffer is flushed by a background thread when it has max_records records,
+    about max_bytes bytes of JSON, or when the oldest write is max_wait
+    seconds old. Each flush is sent through 200 record sObject Collections
+    calls, or through the Bulk API for a group larger than bulk_threshold,
+    and on_success or on_failure is called with each write and its result.
+    A group that can't be sent is passed to on_failure, and an error raised by
+    a callback is raised again from the next add, flush or close, so the
+    background thread keeps flushing either way.
+
+    Example:
+        with WriteBehindBuffer(access_token, instance_url, on_failure=log_failure) as buffer:
+            buffer.update('Contact', contact_id, {'Phone': '(123) 456-7890'})
+    """
 
+    def __init__(self, access_token, instance_url, max_records=COLLECTION_MAX_RECORDS, max_bytes=1000000,
+                 max_wait=1.0, bulk_threshold=2000, on_success=None, on_failure=None,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        """
         Args:
-            job_id (str): The job id returned when creating a batch job
-            polling_wait (int): This is the number of seconds
             access_token (str): This is the access_token value received from the
                                 login response
             instance_url (str): This is the instance_url value received from the
                                 login response
+            max_records (int): The number of pending writes that triggers a
+                               flush
+            max_bytes (int): The approximate JSON size of the pending writes
+                             that triggers a flush
+            max_wait (float): The number of seconds after the oldest pending
+                              write that triggers a flush
+            bulk_threshold (int): Groups of more records than this for one
+                                  object and operation are sent with the Bulk
+                                  API
+            on_success (function): Called as on_success(write, result) for each
+                                   write that succeeded
+            on_failure (function): Called as on_failure(write, result) for each
+                                   write that failed
+            max_workers (int): The maximum number of collection requests sent
+                               at once
+        """
+        self.access_token = access_token
+        self.instance_url = instance_url
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+        self.bulk_threshold = bulk_threshold
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.max_workers = max_workers
+        self.pending = {}
+        self.pending_bytes = 0
+        self.first_write_time = None
+        self.insert_count = 0
+        self.closed = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.send_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def insert(self, object_name, record):
+        """
+        Buffers an insert. Inserts are never merged.
 
-        Returns:
-            objects: Prints the status of the bulk job and polls for an update
-                     ever polling_wait seconds until the numberBatchesQueued = 0,
-                     then it will break out and just returns the final job status
-                     response.
+        Args:
+            object_name (str): The API name of the object
+            record (dict): The fields of the new record
         """
-        if verbose:
-            print("Status for job: {}".format(job_id))
+        self.add(None, object_name, 'insert', record)
 
-        processed_total = 0
-        finished_statuses = ['JobComplete', 'Aborted', 'Failed']
-        while True:
-            json_response = Bulk2.get_job_info(job_id, access_token, instance_url)
+    def update(self, object_name, record_id, record_json):
+        """
+        Buffers an update, merging it into any pending update of the record.
+        A RuntimeError is raised if the record has a pending delete.
 
-            if verbose:
-                print("Job state/failed/total: {}/{}/{}".format(json_response['state'],
-                                                                json_response['numberRecordsFailed'],
-                                                                json_response['numberRecordsProcessed']))
-
-            if json_response['state'] in finished_statuses:
-                #Bulk v2 will set status to Failed even while the job is processing if it encounters a record
-                #failure, checking to see if records processes has not moved since the last poll
-                if processed_total == json_response['numberRecordsProcessed']:
-                    break
+        Args:
+            object_name (str): The API name of the object
+            record_id (str): The Id of the record to update
+            record_json (dict): The fields to update
+        """
+        self.add(('id', object_name, record_id), object_name, 'update', dict(record_json, Id=record_id))
 
-            processed_total = json_response['numberRecordsProcessed']
-            time.sleep(polling_wait)
+    def upsert(self, object_name, external_id_field_name, record):
+        """
+        Buffers an upsert, merging it into any pending upsert with the same
+        external Id value.
 
-        return json_response
+        Args:
+            object_name (str): The API name of the object
+            external_id_field_name (str): The external Id field used to match
+                                          the record
+            record (dict): The fields of the record, including the external Id
+        """
+        key = ('upsert', object_name, external_id_field_name, record[external_id_field_name])
+        self.add(key, object_name, 'upsert', record, external_id_field_name)
 
-    @staticmethod
-    def get_success_results(job_id, access_token, instance_url):
+    def delete(self, object_name, record_id):
         """
-        Retrieves a list of successfully processed records for a completed job.
+        Buffers a delete, replacing any pending update of the record.
 
         Args:
-            job_id (str): The job id returned by Bulk2.create_job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response.
+            object_name (str): The API name of the object
+            record_id (str): The Id of the record to delete
+        """
+        self.add(('id', object_name, record_id), object_name, 'delete', {'Id': record_id})
 
-        Returns:
-            str: Returns a CSV with 2 columns at the start, then all the fields
-                 that were originally sent.
-                 sf__Created (bool): Indicates if the record was created.
-                 sf__Id (str): ID of the record that was successfully processed.
+    def add(self, key, object_name, operation, record, external_id_field_name=None):
         """
-        header_details = Util.get_standard_header(access_token)
+        Adds or merges a write into the pending writes. An insert has no key
+        and gets a new one, so it's never merged.
+        """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('The WriteBehindBuffer has been closed')
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/successfulResults/', header_details)
+            self.raise_error()
 
-        return response.text
+            if key is None:
+                self.insert_count += 1
+                key = ('insert', object_name, self.insert_count)
 
-    @staticmethod
-    def get_failed_results(job_id, access_token, instance_url):
+            write = self.pending.get(key)
+
+            if write != None and write['operation'] == 'delete' and operation != 'delete':
+                raise RuntimeError('{} {} has a pending delete and can\'t be updated'.format(object_name,
+                                                                                           record['Id']))
+
+            if write is None or operation == 'delete':
+                self.pending[key] = {'object_name': object_name, 'operation': operation, 'record': dict(record),
+                                     'external_id_field_name': external_id_field_name}
+            else:
+                write['record'].update(record)
+
+            self.pending_bytes += len(json.dumps(record))
+
+            if self.first_write_time is None:
+                # wake the background thread so it starts the max_wait timer
+                self.first_write_time = time.time()
+                self.condition.notify()
+            elif self.is_ready():
+                self.condition.notify()
+
+    def is_ready(self):
         """
-        Retrieves a list of failed records for a completed job.
+        Checks whether any of the flush limits have been reached.
+        """
+        if not self.pending:
+            return False
 
-        Args:
-            job_id (str): The job id returned by Bulk2.create_job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response.
+        return self.closed or len(self.pending) >= self.max_records or self.pending_bytes >= self.max_bytes or \
+            time.time() - self.first_write_time >= self.max_wait
 
-        Returns:
-            str: Returns a CSV with 2 columns at the start, then all the fields
-                 that were originally sent.
-                 sf__Error (str): Error code and message, if applicable.
-                 sf__Id (str): ID of the record that had an error during
-                               processing, if applicable.
+    def take_pending(self):
         """
-        header_details = Util.get_standard_header(access_token)
+        Removes and returns the pending writes.
+        """
+        with self.condition:
+            writes = list(self.pending.values())
+            self.pending = {}
+            self.pending_bytes = 0
+            self.first_write_time = None
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/failedResults/', header_details)
+        return writes
 
-        return response.text
+    def flush(self):
+        """
+        Sends every pending write now and waits for the results.
+        """
+        with self.send_lock:
+            self.send(self.take_pending())
 
-    @staticmethod
-    def get_unprocessed_results(job_id, access_token, instance_url):
+        self.raise_error()
+
+    def close(self):
         """
-        Retrieves a list of unprocessed records for a completed job.
+        Flushes the pending writes and stops the background thread.
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        self.thread.join()
+        self.raise_error()
+
+    def raise_error(self):
+        """
+        Raises the error of a failed callback or flush once, and raises an
+        error whenever the background thread has stopped while the buffer is
+        open, since nothing would be sent after that.
+        """
+        with self.condition:
+            error = self.error
+            self.error = None
+
+        if error != None:
+            raise RuntimeError('A flush of the WriteBehindBuffer failed: {}'.format(error)) from error
+
+        if not self.closed and not self.thread.is_alive():
+            raise RuntimeError('The flush thread of the WriteBehindBuffer has stopped')
+
+    def set_error(self, error):
+        """
+        Keeps the first error of a failed callback or flush until raise_error
+        raises it.
+        """
+        with self.condition:
+            if self.error is None:
+                self.error = error
+
+    def run(self):
+        """
+        This is the background thread that flushes the buffer when it's ready.
+        """
+        while True:
+            with self.condition:
+                while not self.is_ready() and not self.closed:
+                    timeout = None
+
+                    if self.first_write_time is not None:
+                        timeout = max(0, self.first_write_time + self.max_wait - time.time())
+
+                    self.condition.wait(timeout)
+
+                closing = self.closed
+
+            try:
+                with self.send_lock:
+                    self.send(self.take_pending())
+            except Exception as e:
+                self.set_error(e)
+
+            if closing:
+                break
+
+    def send(self, writes):
+        """
+        Sends the writes grouped by object, operation and external Id field and
+        calls on_success or on_failure for each one.
+        """
+        groups = {}
+
+        for write in writes:
+            group_key = (write['object_name'], write['operation'], write['external_id_field_name'])
+            groups.setdefault(group_key, []).append(write)
+
+        for (object_name, operation, external_id_field_name), group in groups.items():
+            try:
+                if len(group) > self.bulk_threshold:
+                    results = Bulk.perform_bulk_operation(object_name, [write['record'] for write in group],
+                                                          BULK_BATCH_MAX_RECORDS, operation, None,
+                                                          external_id_field_name, self.access_token,
+                                                          self.instance_url, verbose=False)
+                else:
+                    if operation == 'delete':
+                        records = [write['record']['Id'] for write in group]
+                    else:
+                        records = [dict(write['record'], attributes={'type': object_name}) for write in group]
+
+                    results = Standard.perform_collection_operation(operation, records, self.access_token,
+                                                                    self.instance_url, object_name,
+                                                                    external_id_field_name=external_id_field_name
+                                                                    or 'Id', max_workers=self.max_workers)
+            except requests.exceptions.RequestException as e:
+                error = {'statusCode': 'REQUEST_FAILED', 'message': str(e), 'fields': []}
+                results = [{'success': False, 'errors': [error]} for write in group]
+            except Exception as e:
+                # e.g. a failed Bulk API batch, which fails the writes of the group without stopping the flushes
+                error = {'statusCode': 'FLUSH_FAILED', 'message': str(e), 'fields': []}
+                results = [{'success': False, 'errors': [error]} for write in group]
+
+            for write, result in zip(group, results):
+                try:
+                    if result.get('success'):
+                        if self.on_success:
+                            self.on_success(write, result)
+                    elif self.on_failure:
+                        self.on_failure(write, result)
+                except Exception as e:
+                    self.set_error(e)
+
+
+class CsvFileSink:
+    """
+    This class is a sink for Bulk2.download_query_results that writes the
+    pages of a query job into one CSV file. Every page starts with the header
+    row, so it's only kept from the first page.
+
+    Example:
+        with open('contacts.csv', 'wb') as export_file:
+            Bulk2.query('SELECT Id, Email FROM Contact', CsvFileSink(export_file), access_token, instance_url)
+    """
 
+    def __init__(self, file_object):
+        """
         Args:
-            job_id (str): The job id returned by Bulk2.create_job
-            access_token (str): This is the access_token value received from the
-                                login response
-            instance_url (str): This is the instance_url value received from the
-                                login response.
+            file_object (file): The binary file to write the CSV to
+        """
+        self.file_object = file_object
+        self.has_header = False
 
-        Returns:
-            str: Returns a CSV with all the fields that were originally supplied.
+    def write_page(self, page_file):
         """
-        header_details = Util.get_standard_header(access_token)
+        Appends a page of results to the file.
 
-        response = webservice.Tools.get_http_response(
-            instance_url + Bulk2.base_bulk2_uri + '/' + job_id + '/unprocessedrecords/', header_details)
+        Args:
+            page_file (file): The binary file with the CSV of the page
+        """
+        if self.has_header:
+            page_file.readline()
 
-        return response.text
+        shutil.copyfileobj(page_file, self.file_object)
+        self.has_header = True
+
+
+class RowSink:
+    """
+    This class is a sink for Bulk2.download_query_results that parses each
+    page of a query job as it arrives and calls a function with every row, so
+    the rows can be processed without keeping them.
+
+    Example:
+        Bulk2.query('SELECT Id, Email FROM Contact', RowSink(lambda row: print(row['Email'])), access_token,
+                    instance_url)
+    """
+
+    def __init__(self, on_row):
+        """
+        Args:
+            on_row (function): Called with each row as a dict of the CSV
+                               columns. The values are strings.
+        """
+        self.on_row = on_row
+        self.row_count = 0
+
+    def write_page(self, page_file):
+        """
+        Parses a page of results and passes its rows to on_row.
+
+        Args:
+            page_file (file): The binary file with the CSV of the page
+        """
+        text_file = io.TextIOWrapper(page_file, encoding='utf-8', newline='')
+
+        for row in csv.DictReader(text_file):
+            self.on_row(row)
+            self.row_count += 1
+
+        text_file.detach()
 
 
 class Metadata:
@@ -1,3 +1,1692 @@
 #!/usr/bin/python3
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+import urllib.parse
+import zipfile
+from unittest import mock
 
+import requests
+
+import pysalesforceutils
+from pysalesforceutils import (BatchCoalescer, Bulk, Bulk2, BulkCheckpoint, BulkJob, ChangeTracker, CsvFileSink,
+                               JobPoller, OperationRouter, RowSink, Standard, Util, WriteBehindBuffer)
+
+webservice = pysalesforceutils.webservice
+
+INSTANCE_URL = 'https://example.my.salesforce.com'
+
+
+def get_response(body):
+    response = mock.Mock()
+    response.headers = {'Content-Type': 'application/json'}
+    response.text = json.dumps(body)
+    response.content = response.text.encode('utf-8')
+    response.json.return_value = body
+
+    return response
+
+
+class TestPacking(unittest.TestCase):
+
+    def test_chunk(self):
+        self.assertEqual(list(Util.chunk([1, 2, 3, 4, 5], 2)), [[1, 2], [3, 4], [5]])
+
+    def test_pack_by_size_max_records(self):
+        records = [{'Name': 'Acme'} for i in range(10)]
+
+        self.assertEqual([len(batch) for batch in Util.pack_by_size(records, 4)], [4, 4, 2])
+
+    def test_pack_by_size_max_bytes(self):
+        records = [{'Name': 'Acme {}'.format(i)} for i in range(10)]
+        max_bytes = 2 + Util.get_record_size(records[0]) * 3
+        batches = list(Util.pack_by_size(records, max_bytes=max_bytes))
+
+        self.assertEqual([record for batch in batches for record in batch], records)
+
+        for batch in batches:
+            self.assertLessEqual(len(json.dumps(batch, separators=(',', ':')).encode('utf-8')), max_bytes)
+
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 3, 1])
+
+    def test_pack_by_size_record_too_big(self):
+        with self.assertRaises(ValueError):
+            list(Util.pack_by_size([{'Name': 'x' * 100}], max_bytes=50))
+
+    def test_pack_csv_by_size(self):
+        records = [{'Id': str(i), 'Name': 'Acme, "Inc"' * (i % 3)} for i in range(40)]
+        records[25]['Description'] = 'a new column for the rest of the batch'
+        records[30]['Description'] = 'a line\nbreak'
+        max_bytes = 300
+        batches = list(Util.pack_csv_by_size(records, max_bytes=max_bytes))
+
+        self.assertEqual([record for batch in batches for record in batch], records)
+
+        for batch in batches:
+            self.assertLessEqual(len(Util.get_csv_body(batch).encode('utf-8')), max_bytes)
+
+        # each batch is as full as it can be
+        for batch, next_batch in zip(batches, batches[1:]):
+            self.assertGreater(len(Util.get_csv_body(batch + next_batch[:1]).encode('utf-8')), max_bytes)
+
+    def test_pack_csv_by_size_max_records(self):
+        records = [{'Id': str(i)} for i in range(5)]
+
+        self.assertEqual([len(batch) for batch in Util.pack_csv_by_size(records, 2)], [2, 2, 1])
+
+
+class TestBatchCoalescer(unittest.TestCase):
+
+    @staticmethod
+    def batch_request(batch_requests, halt_on_error, access_token, instance_url, run_assignment_rules):
+        return {'results': [{'statusCode': 200, 'result': {'Id': batch_request['url'].split('/')[-1]}}
+                            for batch_request in batch_requests]}
+
+    def test_close_sends_queued_calls(self):
+        with mock.patch.object(Standard, 'batch_request', side_effect=self.batch_request) as batch_request:
+            coalescer = BatchCoalescer('token', INSTANCE_URL, max_wait=60)
+            futures = [coalescer.get_sobject_row('Account', '001{}'.format(i), None) for i in range(3)]
+            coalescer.close()
+
+        self.assertEqual([future.result(0) for future in futures], [{'Id': '0010'}, {'Id': '0011'}, {'Id': '0012'}])
+        self.assertEqual(batch_request.call_count, 1)
+
+    def test_submit_after_close(self):
+        with mock.patch.object(Standard, 'batch_request', side_effect=self.batch_request):
+            coalescer = BatchCoalescer('token', INSTANCE_URL)
+            coalescer.close()
+
+            with self.assertRaises(RuntimeError):
+                coalescer.get_sobject_row('Account', '0010', None)
+
+            coalescer.close()
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+
+    def perform_collection_operation(self, operation, records, access_token, instance_url, object_name, **kwargs):
+        self.sent.append((operation, records))
+
+        return [{'success': True, 'errors': []} for record in records]
+
+    def test_merges_writes(self):
+        with mock.patch.object(Standard, 'perform_collection_operation', side_effect=self.perform_collection_operation):
+            with WriteBehindBuffer('token', INSTANCE_URL, max_wait=60) as buffer:
+                buffer.update('Contact', '003A', {'Phone': '1'})
+                buffer.update('Contact', '003A', {'Email': 'a@example.com'})
+                buffer.update('Contact', '003B', {'Phone': '2'})
+                buffer.delete('Contact', '003B')
+                buffer.insert('Contact', {'LastName': 'A'})
+                buffer.insert('Contact', {'LastName': 'A'})
+
+        sent = dict(self.sent)
+
+        self.assertEqual(len(self.sent), 3)
+        self.assertEqual(sent['update'], [{'Id': '003A', 'Phone': '1', 'Email': 'a@example.com',
+                                           'attributes': {'type': 'Contact'}}])
+        self.assertEqual(sent['delete'], ['003B'])
+        self.assertEqual(len(sent['insert']), 2)
+
+    def test_update_after_delete(self):
+        with mock.patch.object(Standard, 'perform_collection_operation', side_effect=self.perform_collection_operation):
+            with WriteBehindBuffer('token', INSTANCE_URL, max_wait=60) as buffer:
+                buffer.delete('Contact', '003A')
+
+                with self.assertRaises(RuntimeError):
+                    buffer.update('Contact', '003A', {'Phone': '1'})
+
+                # a delete after a delete is still one delete
+                buffer.delete('Contact', '003A')
+
+        self.assertEqual(self.sent, [('delete', ['003A'])])
+
+    def test_failed_flush_keeps_flushing(self):
+        failures = []
+
+        with mock.patch.object(Standard, 'perform_collection_operation', side_effect=Exception('Bulk batch failed')):
+            buffer = WriteBehindBuffer('token', INSTANCE_URL, max_wait=60,
+                                       on_failure=lambda write, result: failures.append(result))
+            buffer.update('Contact', '003A', {'Phone': '1'})
+            buffer.flush()
+
+        self.assertEqual(failures[0]['errors'][0]['statusCode'], 'FLUSH_FAILED')
+
+        with mock.patch.object(Standard, 'perform_collection_operation', side_effect=self.perform_collection_operation):
+            buffer.update('Contact', '003A', {'Phone': '2'})
+            buffer.close()
+
+        self.assertEqual(self.sent, [('update', [{'Id': '003A', 'Phone': '2', 'attributes': {'type': 'Contact'}}])])
+
+    def test_callback_error_is_raised(self):
+        def on_success(write, result):
+            raise ValueError('callback failed')
+
+        with mock.patch.object(Standard, 'perform_collection_operation', side_effect=self.perform_collection_operation):
+            buffer = WriteBehindBuffer('token', INSTANCE_URL, max_wait=60, on_success=on_success)
+            buffer.update('Contact', '003A', {'Phone': '1'})
+
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+
+            # the error is only raised once and the buffer keeps working
+            buffer.delete('Contact', '003A')
+
+            with self.assertRaises(RuntimeError):
+                buffer.close()
+
+        self.assertEqual([operation for operation, records in self.sent], ['update', 'delete'])
+
+
+class TestBulkCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'contact-update.checkpoint')
+        self.poller = JobPoller(min_wait=0.01, max_wait=0.05)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record_job(self):
+        checkpoint = BulkCheckpoint(self.path)
+        checkpoint.record('job', api='bulk', job_id='750A', object='Contact', operation='update')
+        checkpoint.record('batch', id='751A', offset=0, count=1)
+        checkpoint.record('batch', id='751B', offset=1, count=1)
+        checkpoint.record('upload_complete')
+        checkpoint.record('collected', batch_id='751A')
+
+    @staticmethod
+    def get_http_response(url, header_details):
+        if url.endswith('/batch/751A/result'):
+            return get_response([{'id': '003A', 'success': True, 'created': False, 'errors': []}])
+
+        if url.endswith('/batch/751B/result'):
+            return get_response([{'id': '003B', 'success': True, 'created': False, 'errors': []}])
+
+        if url.endswith('/batch'):
+            return get_response({'batchInfo': [{'id': '751A', 'state': 'Completed'},
+                                               {'id': '751B', 'state': 'Completed'}]})
+
+        if url.endswith('/750A'):
+            return get_response({'state': 'Closed', 'numberBatchesCompleted': 2, 'numberBatchesFailed': 0,
+                                 'numberBatchesTotal': 2})
+
+        raise AssertionError('Unexpected request to {}'.format(url))
+
+    @staticmethod
+    def get_downloads(get_http_response):
+        return [call[0][0].split('/')[-2] for call in get_http_response.call_args_list
+                if call[0][0].endswith('/result')]
+
+    def test_truncated_entry_is_dropped(self):
+        checkpoint = BulkCheckpoint(self.path)
+        checkpoint.record('job', api='bulk', job_id='750A')
+        checkpoint.record('batch', id='751A', offset=0, count=2)
+
+        with open(self.path, 'a') as checkpoint_file:
+            checkpoint_file.write('{"event": "bat')
+
+        checkpoint = BulkCheckpoint(self.path)
+
+        self.assertEqual(checkpoint.get_batch_ids(), ['751A'])
+
+        with open(self.path) as checkpoint_file:
+            self.assertEqual(len([json.loads(line) for line in checkpoint_file]), 2)
+
+        self.assertEqual(os.listdir(self.directory.name), ['contact-update.checkpoint'])
+
+    def test_uploaded_count_stops_at_gap(self):
+        checkpoint = BulkCheckpoint(self.path)
+        checkpoint.record('job', api='bulk', job_id='750A')
+        checkpoint.record('batch', id='751B', offset=2, count=2)
+        checkpoint.record('batch', id='751A', offset=0, count=2)
+        checkpoint.record('batch', id='751D', offset=6, count=2)
+
+        self.assertEqual(checkpoint.get_batch_ids(), ['751A', '751B', '751D'])
+        self.assertEqual(checkpoint.get_uploaded_count(), 4)
+
+    def test_resume_skips_collected_batches(self):
+        self.record_job()
+
+        with mock.patch.object(webservice.Tools, 'get_http_response',
+                               side_effect=self.get_http_response) as get_http_response:
+            bulk_job = BulkJob.resume(self.path, 'token', INSTANCE_URL, poller=self.poller)
+            batch_results = {batch_info['id']: results for batch_info, results in bulk_job.iter_batch_results()}
+
+        self.assertEqual(list(batch_results), ['751B'])
+        self.assertEqual(batch_results['751B'][0]['id'], '003B')
+        self.assertEqual(self.get_downloads(get_http_response), ['751B'])
+        self.assertEqual(BulkCheckpoint(self.path).collected_batch_ids, {'751A', '751B'})
+
+    def test_resume_downloads_the_results_again(self):
+        self.record_job()
+
+        with mock.patch.object(webservice.Tools, 'get_http_response',
+                               side_effect=self.get_http_response) as get_http_response:
+            bulk_job = BulkJob.resume(self.path, 'token', INSTANCE_URL, poller=self.poller)
+            results = bulk_job.get_results(timeout=10)
+
+        self.assertEqual([result['id'] for result in results], ['003A', '003B'])
+        self.assertEqual(sorted(self.get_downloads(get_http_response)), ['751A', '751B'])
+
+    def test_rerun_load_returns_every_result(self):
+        self.record_job()
+        records = [{'Id': '003A', 'Email': 'a@example.com'}, {'Id': '003B', 'Email': 'b@example.com'}]
+
+        with mock.patch.object(webservice.Tools, 'get_http_response', side_effect=self.get_http_response):
+            results = Bulk.perform_bulk_operation('Contact', records, 1, 'update', 0.01, None, 'token', INSTANCE_URL,
+                                                  verbose=False, checkpoint_path=self.path)
+
+        self.assertEqual([result['id'] for result in results], ['003A', '003B'])
+
+    def test_journal_only_keeps_batch_ids(self):
+        self.record_job()
+
+        with mock.patch.object(webservice.Tools, 'get_http_response', side_effect=self.get_http_response):
+            bulk_job = BulkJob.resume(self.path, 'token', INSTANCE_URL, poller=self.poller)
+            list(bulk_job.iter_batch_results())
+
+        with open(self.path) as checkpoint_file:
+            entries = [json.loads(line) for line in checkpoint_file]
+
+        self.assertEqual([entry for entry in entries if entry['event'] == 'collected'],
+                         [{'event': 'collected', 'batch_id': '751A'}, {'event': 'collected', 'batch_id': '751B'}])
+
+
+class TestJobPoller(unittest.TestCase):
+
+    def test_hung_status_check_times_out(self):
+        poller = JobPoller(min_wait=0.01, max_wait=0.05, check_timeout=0.2)
+        release = threading.Event()
+        hung_future = poller.submit(lambda: release.wait() and (True, {}, 1, 1))
+        future = poller.submit(lambda: (True, {'state': 'JobComplete'}, 1, 1))
+
+        try:
+            self.assertEqual(future.result(5), {'state': 'JobComplete'})
+
+            with self.assertRaises(TimeoutError):
+                hung_future.result(5)
+        finally:
+            release.set()
+
+    def test_max_seconds(self):
+        poller = JobPoller(min_wait=0.01, max_wait=0.05, max_seconds=0.1)
+
+        with self.assertRaises(TimeoutError):
+            poller.submit(lambda: (False, {}, 0, None)).result(5)
+
+
+class TestExplain(unittest.TestCase):
+
+    @staticmethod
+    def get_http_response(url, header_details):
+        plans = {
+            'CreatedDate': [{'leadingOperationType': 'Index', 'relativeCost': 0.2, 'cardinality': 4210,
+                             'sobjectCardinality': 1500000, 'fields': ['CreatedDate'], 'notes': []},
+                            {'leadingOperationType': 'TableScan', 'relativeCost': 1.6, 'cardinality': 4210,
+                             'sobjectCardinality': 1500000, 'fields': [], 'notes': []}],
+            'Name': [{'leadingOperationType': 'TableScan', 'relativeCost': 2.8, 'cardinality': 900000,
+                      'sobjectCardinality': 1500000, 'fields': [], 'notes': []}],
+            'OwnerId': []
+        }
+        query = urllib.parse.unquote(url.split('?explain=')[1])
+
+        return get_response({'plans': plans[query.split('WHERE ')[1].split(' ')[0]]})
+
+    def test_explain_report_ranks_candidates(self):
+        predicates = ["Name LIKE '%Acme%'", "OwnerId = '005A'", 'CreatedDate = LAST_N_DAYS:30']
+
+        with mock.patch.object(webservice.Tools, 'get_http_response', side_effect=self.get_http_response):
+            report = Standard.explain_report(predicates, 'token', INSTANCE_URL, 'SELECT Id FROM Account WHERE {}')
+
+        self.assertEqual([entry['predicate'] for entry in report], [predicates[2], predicates[0], predicates[1]])
+        self.assertEqual(report[0]['query'], 'SELECT Id FROM Account WHERE CreatedDate = LAST_N_DAYS:30')
+        self.assertEqual([entry['selective'] for entry in report], [True, False, False])
+        self.assertEqual(report[0]['leadingOperationType'], 'Index')
+        self.assertEqual(len(report[0]['plans']), 2)
+        self.assertIsNone(report[2]['relativeCost'])
+
+    def test_explain_encodes_query(self):
+        with mock.patch.object(webservice.Tools, 'get_http_response',
+                               return_value=get_response({'plans': []})) as get_http_response:
+            Standard.explain("SELECT Id FROM Account WHERE Name = 'A&B'", 'token', INSTANCE_URL)
+
+        url = get_http_response.call_args[0][0]
+
+        self.assertTrue(url.startswith(INSTANCE_URL + '/services/data/v'))
+        self.assertIn('/query/?explain=SELECT%20Id%20FROM%20Account%20WHERE%20Name%20%3D%20%27A%26B%27', url)
+
+
+class TestCollectionOperation(unittest.TestCase):
+
+    @staticmethod
+    def post_http_response(url, body, header_details):
+        records = json.loads(body)['records']
+
+        if records[0]['Name'] == 'Account 200':
+            raise requests.exceptions.HTTPError('500 Server Error')
+
+        return get_response([{'id': record['Name'], 'success': True, 'errors': []} for record in records])
+
+    def test_insert_is_chunked_and_ordered(self):
+        records = [{'attributes': {'type': 'Account'}, 'Name': 'Account {}'.format(i)} for i in range(450)]
+
+        with mock.patch.object(webservice.Tools, 'post_http_response',
+                               side_effect=self.post_http_response) as post_http_response:
+            results = Standard.perform_collection_operation('insert', records, 'token', INSTANCE_URL, max_workers=3)
+
+        self.assertEqual(sorted(len(json.loads(call[0][1])['records']) for call in post_http_response.call_args_list),
+                         [50, 200, 200])
+        self.assertEqual([result.get('id') for result in results[:200]], [record['Name'] for record in records[:200]])
+        self.assertEqual([result.get('id') for result in results[400:]], [record['Name'] for record in records[400:]])
+
+        # the failed chunk gets an error for each of its records
+        self.assertEqual({result['errors'][0]['statusCode'] for result in results[200:400]}, {'REQUEST_FAILED'})
+
+    def test_delete_urls_stay_short(self):
+        record_ids = ['001{:097d}'.format(i) for i in range(500)]
+
+        def delete_http_response(url, body, header_details):
+            return get_response([{'id': record_id, 'success': True, 'errors': []}
+                                 for record_id in url.split('ids=')[1].split('&')[0].split(',')])
+
+        with mock.patch.object(webservice.Tools, 'delete_http_response',
+                               side_effect=delete_http_response) as delete_http_response_mock:
+            results = Standard.perform_collection_operation('delete', record_ids, 'token', INSTANCE_URL)
+
+        self.assertGreater(delete_http_response_mock.call_count, 3)
+
+        for call in delete_http_response_mock.call_args_list:
+            self.assertLessEqual(len(call[0][0]), pysalesforceutils.MAX_URL_LENGTH)
+
+        self.assertEqual([result['id'] for result in results], record_ids)
+
+    def test_batch_size_limit(self):
+        with self.assertRaises(ValueError):
+            Standard.perform_collection_operation('insert', [], 'token', INSTANCE_URL, batch_size=201)
+
+
+class TestOperationRouter(unittest.TestCase):
+
+    def test_thresholds(self):
+        router = OperationRouter()
+
+        self.assertEqual(router.choose_path('update', 10), 'collections')
+        self.assertEqual(router.choose_path('update', 5000), 'bulk')
+        self.assertEqual(router.choose_path('update', 1000000), 'bulk2')
+
+        # collections can't hard delete
+        self.assertEqual(router.choose_path('hardDelete', 10), 'bulk')
+
+        with self.assertRaises(ValueError):
+            router.choose_path('merge', 10)
+
+    def test_low_budget_prefers_fewer_calls(self):
+        router = OperationRouter()
+
+        self.assertEqual(router.choose_path('update', 1500), 'collections')
+        self.assertEqual(router.choose_path('update', 1500, remaining_api_calls=50), 'bulk')
+
+        candidates = router.estimate('update', 1000, remaining_api_calls=6)
+
+        self.assertEqual([candidate['within_budget'] for candidate in candidates], [True, False, False])
+
+    def test_record_run_refits_model(self):
+        router = OperationRouter()
+        router.record_run('bulk', 100, 2.0)
+        router.record_run('bulk', 1000, 11.0)
+
+        self.assertAlmostEqual(router.models['bulk']['record_seconds'], 0.01)
+        self.assertAlmostEqual(router.models['bulk']['fixed_seconds'], 1.0)
+        self.assertEqual(router.models['collections'], OperationRouter.default_models['collections'])
+
+    def test_perform_operation_collections(self):
+        results = [{'id': '003A', 'success': True, 'errors': []}]
+
+        with mock.patch.object(Standard, 'perform_collection_operation',
+                               return_value=results) as perform_collection_operation:
+            result = OperationRouter().perform_operation('Contact', 'update', [{'Id': '003A', 'Phone': '1'}],
+                                                         'token', INSTANCE_URL)
+
+        self.assertEqual(result, {'path': 'collections', 'results': results})
+        self.assertEqual(perform_collection_operation.call_args[0][1],
+                         [{'Id': '003A', 'Phone': '1', 'attributes': {'type': 'Contact'}}])
+
+    def test_perform_operation_bulk(self):
+        with mock.patch.object(Bulk, 'perform_bulk_operation', return_value=[]) as perform_bulk_operation:
+            result = OperationRouter().perform_operation('Contact', 'delete', ['003A', '003B'], 'token', INSTANCE_URL,
+                                                         path='bulk')
+
+        self.assertEqual(result['path'], 'bulk')
+        self.assertEqual(perform_bulk_operation.call_args[0][1], [{'Id': '003A'}, {'Id': '003B'}])
+
+
+class TestRetrieve(unittest.TestCase):
+
+    @staticmethod
+    def post_http_response(url, body, header_details):
+        request_body = json.loads(body)
+
+        # the records ending in 7 don't exist
+        return get_response([None if record_id.endswith('7') else {'Id': record_id, 'Name': 'Acme'}
+                             for record_id in request_body['ids']])
+
+    def test_retrieve_many_chunks_and_orders(self):
+        ids = ['001{:015d}'.format(i) for i in range(4500)]
+        ids.append(ids[0])
+
+        with mock.patch.object(webservice.Tools, 'post_http_response',
+                               side_effect=self.post_http_response) as post_http_response:
+            records = Standard.retrieve_many('Account', ids, ['Name'], 'token', INSTANCE_URL, max_workers=3)
+
+        chunk_sizes = sorted(len(json.loads(call[0][1])['ids']) for call in post_http_response.call_args_list)
+
+        # the duplicate Id isn't sent twice
+        self.assertEqual(chunk_sizes, [500, 2000, 2000])
+        self.assertTrue(post_http_response.call_args[0][0].endswith('/composite/sobjects/Account'))
+        self.assertEqual(len(records), len(ids))
+        self.assertEqual(records[1]['Id'], ids[1])
+        self.assertIsNone(records[7])
+        self.assertEqual(records[-1], records[0])
+
+    def test_retrieve_many_by_id(self):
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=self.post_http_response):
+            records = Standard.retrieve_many('Account', ['001A', '0017'], ['Name'], 'token', INSTANCE_URL,
+                                             key_by_id=True)
+
+        self.assertEqual(records, {'001A': {'Id': '001A', 'Name': 'Acme'}, '0017': None})
+
+
+class TestCompositeGraphs(unittest.TestCase):
+
+    @staticmethod
+    def get_tree(name, contact_count):
+        return {'object': 'Account', 'record': {'Name': name},
+                'children': [{'object': 'Contact', 'parent_field': 'AccountId',
+                              'record': {'LastName': '{} {}'.format(name, i)}, 'children': []}
+                             for i in range(contact_count)]}
+
+    def test_build_packs_trees(self):
+        record_trees = [self.get_tree('A', 2), self.get_tree('B', 5), self.get_tree('C', 3), self.get_tree('D', 0)]
+        graphs, tree_graphs = Standard.build_composite_graphs(record_trees, max_nodes=7)
+
+        self.assertTrue(all(len(graph['compositeRequest']) <= 7 for graph in graphs))
+        self.assertEqual(sum(len(graph['compositeRequest']) for graph in graphs), 14)
+        self.assertEqual(len(graphs), 2)
+
+        # a tree is never split, and its children point at the parent's referenceId
+        for record_tree, tree_graph in zip(record_trees, tree_graphs):
+            graph = [graph for graph in graphs if graph['graphId'] == tree_graph['graphId']][0]
+            subrequests = {subrequest['referenceId']: subrequest for subrequest in graph['compositeRequest']}
+            parent_reference_id = tree_graph['nodes'][0]['referenceId']
+
+            self.assertEqual(tree_graph['nodes'][0]['record'], record_tree['record'])
+
+            for node in tree_graph['nodes'][1:]:
+                self.assertEqual(subrequests[node['referenceId']]['body']['AccountId'],
+                                 '@{' + parent_reference_id + '.id}')
+
+    def test_build_limits(self):
+        with self.assertRaises(ValueError):
+            Standard.build_composite_graphs([self.get_tree('A', 7)], max_nodes=7)
+
+        with self.assertRaises(ValueError):
+            Standard.build_composite_graphs([], max_nodes=501)
+
+        record_tree = {'object': 'Account', 'record': {}, 'children': []}
+
+        for i in range(15):
+            record_tree = {'object': 'Account', 'record': {}, 'children': [dict(record_tree, parent_field='ParentId')]}
+
+        with self.assertRaises(ValueError):
+            Standard.build_composite_graphs([record_tree])
+
+    def test_insert_keeps_committed_graphs(self):
+        def post_http_response(url, body, header_details):
+            graph = json.loads(body)['graphs'][0]
+
+            if graph['compositeRequest'][0]['body']['Name'] == 'B':
+                raise requests.exceptions.HTTPError('503 Server Error')
+
+            return get_response({'graphs': [{'graphId': graph['graphId'], 'isSuccessful': True, 'graphResponse': {
+                'compositeResponse': [{'referenceId': subrequest['referenceId'], 'httpStatusCode': 201,
+                                       'body': {'id': '001' + subrequest['referenceId'], 'success': True,
+                                                'errors': []}}
+                                      for subrequest in graph['compositeRequest']]}}]})
+
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=post_http_response):
+            results = Standard.insert_record_graphs([self.get_tree('A', 2), self.get_tree('B', 2)], 'token',
+                                                    INSTANCE_URL, max_nodes=3, max_graphs_per_request=1)
+
+        self.assertTrue(results[0]['isSuccessful'])
+        self.assertEqual([node['httpStatusCode'] for node in results[0]['nodes']], [201, 201, 201])
+        self.assertFalse(results[1]['isSuccessful'])
+        self.assertEqual({node['body'][0]['errorCode'] for node in results[1]['nodes']}, {'REQUEST_FAILED'})
+
+
+class TestSObjectTrees(unittest.TestCase):
+
+    relationships = {'Contact': {'field': 'AccountId', 'relationship': 'Contacts'}}
+
+    @staticmethod
+    def get_reference_ids(tree_records):
+        reference_ids = []
+
+        for tree_record in tree_records:
+            reference_ids.append(tree_record['attributes']['referenceId'])
+            reference_ids.extend(TestSObjectTrees.get_reference_ids(tree_record.get('Contacts', {}).get('records', [])))
+
+        return reference_ids
+
+    def post_http_response(self, url, body, header_details):
+        return get_response({'hasErrors': False, 'results': [
+            {'referenceId': reference_id, 'id': 'id-' + reference_id}
+            for reference_id in self.get_reference_ids(json.loads(body)['records'])]})
+
+    def test_nests_children_and_orders_results(self):
+        records = [{'attributes': {'type': 'Contact'}, 'AccountId': 'acme', 'LastName': 'Smith'},
+                   {'attributes': {'type': 'Account', 'referenceId': 'acme'}, 'Name': 'Acme'},
+                   {'attributes': {'type': 'Account'}, 'Name': 'Globex'}]
+
+        with mock.patch.object(webservice.Tools, 'post_http_response',
+                               side_effect=self.post_http_response) as post_http_response:
+            results = Standard.insert_sobject_trees('Account', records, self.relationships, 'token', INSTANCE_URL)
+
+        tree_records = json.loads(post_http_response.call_args[0][1])['records']
+        acme = [tree_record for tree_record in tree_records if tree_record['Name'] == 'Acme'][0]
+
+        self.assertEqual(acme['Contacts']['records'][0]['LastName'], 'Smith')
+        self.assertNotIn('AccountId', acme['Contacts']['records'][0])
+        self.assertEqual([result['referenceId'] for result in results], ['ref0', 'acme', 'ref1'])
+        self.assertEqual([result['id'] for result in results], ['id-ref0', 'id-acme', 'id-ref1'])
+        self.assertTrue(all(result['success'] for result in results))
+
+    def test_assigned_reference_ids_are_unique(self):
+        records = [{'attributes': {'type': 'Account'}, 'Name': 'Acme'},
+                   {'attributes': {'type': 'Account', 'referenceId': 'ref0'}, 'Name': 'Globex'}]
+
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=self.post_http_response):
+            results = Standard.insert_sobject_trees('Account', records, self.relationships, 'token', INSTANCE_URL)
+
+        self.assertEqual([result['referenceId'] for result in results], ['ref1', 'ref0'])
+        self.assertEqual([result['id'] for result in results], ['id-ref1', 'id-ref0'])
+
+    def test_duplicate_reference_ids(self):
+        records = [{'attributes': {'type': 'Account', 'referenceId': 'acme'}, 'Name': 'Acme'},
+                   {'attributes': {'type': 'Account', 'referenceId': 'acme'}, 'Name': 'Acme 2'}]
+
+        with self.assertRaises(ValueError):
+            Standard.insert_sobject_trees('Account', records, self.relationships, 'token', INSTANCE_URL)
+
+    def test_rolled_back_request_keeps_record_errors(self):
+        error = {'statusCode': 'INVALID_EMAIL_ADDRESS', 'message': 'Email: invalid email address', 'fields': ['Email']}
+        response = get_response({'hasErrors': True, 'results': [{'referenceId': 'ref1', 'errors': [error]}]})
+        records = [{'attributes': {'type': 'Account'}, 'Name': 'Acme'},
+                   {'attributes': {'type': 'Account'}, 'Name': 'Globex', 'Email__c': 'x'}]
+
+        with mock.patch.object(webservice.Tools, 'post_http_response',
+                               side_effect=requests.exceptions.HTTPError('400 Client Error', response=response)):
+            results = Standard.insert_sobject_trees('Account', records, self.relationships, 'token', INSTANCE_URL)
+
+        self.assertEqual([result['success'] for result in results], [False, False])
+        self.assertEqual(results[0]['errors'], [])
+        self.assertEqual(results[1]['errors'], [error])
+
+    def test_failed_request(self):
+        records = [{'attributes': {'type': 'Account'}, 'Name': 'Acme'}]
+
+        with mock.patch.object(webservice.Tools, 'post_http_response',
+                               side_effect=requests.exceptions.ConnectionError('Connection reset')):
+            results = Standard.insert_sobject_trees('Account', records, self.relationships, 'token', INSTANCE_URL)
+
+        self.assertEqual(results[0]['errors'][0]['statusCode'], 'REQUEST_FAILED')
+
+
+class TestChangeTracker(unittest.TestCase):
+
+    def test_tracks_retrieve_results_with_missing_records(self):
+        retrieved = [{'Id': '001A', 'Name': 'Acme'}, None, {'Id': '001B', 'Name': 'Globex'}]
+
+        with mock.patch.object(webservice.Tools, 'post_http_response', return_value=get_response(retrieved)):
+            tracker = ChangeTracker()
+            records = tracker.track(Standard.retrieve('Account', ['001A', '001C', '001B'], ['Name'], 'token',
+                                                      INSTANCE_URL), 'Account')
+
+        records[2]['Name'] = 'Globex Corporation'
+
+        self.assertEqual(tracker.get_changes(), {'Account': [{'Id': '001B', 'Name': 'Globex Corporation'}]})
+
+    def test_only_changed_fields_are_sent(self):
+        records = [{'attributes': {'type': 'Contact'}, 'Id': '003A', 'Phone': '1', 'Email': 'a@example.com',
+                    'Account': {'Name': 'Acme'}},
+                   {'attributes': {'type': 'Contact'}, 'Id': '003B', 'Phone': '2'},
+                   {'attributes': {'type': 'Contact'}, 'LastName': 'No Id'}]
+        tracker = ChangeTracker()
+        tracker.track(records)
+        records[0]['Phone'] = '3'
+        records[0]['Title'] = None
+        records[0]['Account']['Name'] = 'Globex'
+        del records[0]['Email']
+
+        results = [{'id': '003A', 'success': True, 'errors': []}]
+
+        with mock.patch.object(Standard, 'perform_collection_operation',
+                               return_value=results) as perform_collection_operation:
+            flush_results = tracker.flush('token', INSTANCE_URL)
+
+        self.assertEqual(perform_collection_operation.call_args[0][1],
+                         [{'Id': '003A', 'Phone': '3', 'Title': None, 'attributes': {'type': 'Contact'}}])
+        self.assertEqual(flush_results[0]['result'], results[0])
+
+        # a saved record is only sent again once it changes again
+        self.assertEqual(tracker.get_changes(), {})
+
+        records[1]['Phone'] = '4'
+        tracker.untrack(['003B'])
+
+        self.assertEqual(tracker.get_changes(), {})
+
+    def test_failed_update_is_sent_again(self):
+        tracker = ChangeTracker()
+        records = tracker.track([{'Id': '003A', 'Phone': '1'}], 'Contact')
+        records[0]['Phone'] = '2'
+        error = {'statusCode': 'UNABLE_TO_LOCK_ROW', 'message': 'unable to obtain exclusive access', 'fields': []}
+
+        with mock.patch.object(Standard, 'perform_collection_operation',
+                               return_value=[{'success': False, 'errors': [error]}]):
+            tracker.flush('token', INSTANCE_URL)
+
+        self.assertEqual(tracker.get_changes(), {'Contact': [{'Id': '003A', 'Phone': '2'}]})
+
+
+class TestLockKeyScheduling(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [{'Id': '003{}'.format(i), 'AccountId': '001{}'.format(i % 4 if i < 12 else 0)}
+                        for i in range(20)]
+        self.records.append({'Id': '003X'})
+
+    def test_group_by_lock_key(self):
+        groups = Util.group_by_lock_key(self.records, 'AccountId')
+
+        self.assertEqual(groups[0], [0, 4, 8] + list(range(12, 20)))
+        self.assertEqual(groups[1:4], [[1, 5, 9], [2, 6, 10], [3, 7, 11]])
+
+        # a record without a lock key is a group of its own
+        self.assertEqual(groups[4], [20])
+
+    def test_batches_keep_lock_keys_together(self):
+        batches = Util.get_lock_key_batches(self.records, 'AccountId', 6)
+
+        self.assertEqual(sorted(index for batch in batches for index in batch), list(range(21)))
+        self.assertTrue(all(len(batch) <= 6 for batch in batches))
+
+        for lock_key in ['0011', '0012', '0013']:
+            self.assertEqual(len([batch for batch in batches
+                                  if any(self.records[index].get('AccountId') == lock_key for index in batch)]), 1)
+
+        # the parent with too many records is split into batches that aren't next to each other
+        parent_batches = [batch_number for batch_number, batch in enumerate(batches)
+                          if any(self.records[index].get('AccountId') == '0010' for index in batch)]
+
+        self.assertEqual(len(parent_batches), 2)
+        self.assertGreater(parent_batches[1] - parent_batches[0], 1)
+
+    def test_lanes_keep_lock_keys_together(self):
+        lanes = Util.get_lock_key_lanes(self.records, 'AccountId', 3)
+
+        self.assertEqual(len(lanes), 3)
+        self.assertEqual(sorted(index for lane in lanes for index in lane), list(range(21)))
+
+        for group in Util.group_by_lock_key(self.records, 'AccountId'):
+            self.assertEqual(len([lane for lane in lanes if group[0] in lane]), 1)
+            self.assertTrue(any(set(group) <= set(lane) for lane in lanes))
+
+    def test_parallel_requests_never_share_a_parent(self):
+        lock = threading.Lock()
+        in_flight = []
+        overlaps = []
+        attempts = {}
+
+        def update_sobject_rows(records, all_or_none, run_assignment_rules, access_token, instance_url):
+            lock_keys = {record.get('AccountId') for record in records if record.get('AccountId')}
+
+            with lock:
+                if any(lock_keys & other for other in in_flight):
+                    overlaps.append(lock_keys)
+
+                in_flight.append(lock_keys)
+
+            time.sleep(0.01)
+
+            with lock:
+                in_flight.remove(lock_keys)
+
+            results = []
+
+            for record in records:
+                attempts[record['Id']] = attempts.get(record['Id'], 0) + 1
+
+                if record['Id'] == '0035' and attempts[record['Id']] == 1:
+                    error = {'statusCode': 'UNABLE_TO_LOCK_ROW', 'message': 'unable to obtain exclusive access',
+                             'fields': []}
+                    results.append({'success': False, 'errors': [error]})
+                else:
+                    results.append({'id': record['Id'], 'success': True, 'errors': []})
+
+            return results
+
+        with mock.patch.object(Standard, 'update_sobject_rows', side_effect=update_sobject_rows):
+            results = Standard.perform_lock_aware_operation('update', self.records, 'AccountId', 'token',
+                                                            INSTANCE_URL, max_workers=4, retry_wait=0)
+
+        self.assertEqual(overlaps, [])
+        self.assertEqual([result['id'] for result in results], [record['Id'] for record in self.records])
+        self.assertEqual(attempts['0035'], 2)
+
+
+class TestResubmitFailures(unittest.TestCase):
+
+    @staticmethod
+    def get_failure(*status_codes):
+        return {'success': False, 'errors': [{'statusCode': status_code, 'message': status_code, 'fields': []}
+                                             for status_code in status_codes]}
+
+    def test_is_transient_failure(self):
+        self.assertTrue(Util.is_transient_failure(self.get_failure('UNABLE_TO_LOCK_ROW')))
+        self.assertTrue(Util.is_transient_failure(self.get_failure('UNABLE_TO_LOCK_ROW',
+                                                                   'ALL_OR_NONE_OPERATION_ROLLED_BACK')))
+        self.assertFalse(Util.is_transient_failure(self.get_failure('UNABLE_TO_LOCK_ROW',
+                                                                    'REQUIRED_FIELD_MISSING')))
+        self.assertFalse(Util.is_transient_failure(self.get_failure()))
+        self.assertFalse(Util.is_transient_failure({'id': '001A', 'success': True, 'errors': []}))
+        self.assertFalse(Util.is_transient_failure(None))
+
+    def test_only_transient_failures_are_resent(self):
+        records = ['a', 'b', 'c', 'd']
+        results = [{'id': 'a', 'success': True, 'errors': []}, self.get_failure('UNABLE_TO_LOCK_ROW'),
+                   self.get_failure('REQUIRED_FIELD_MISSING'), self.get_failure('UNABLE_TO_LOCK_ROW')]
+        calls = []
+
+        def send_records(retry_records, batch_size):
+            calls.append((list(retry_records), batch_size))
+
+            if len(calls) == 1:
+                return [self.get_failure('UNABLE_TO_LOCK_ROW'), {'id': 'd', 'success': True, 'errors': []}]
+
+            return [{'id': record, 'success': True, 'errors': []} for record in retry_records]
+
+        with mock.patch.object(pysalesforceutils.time, 'sleep') as sleep:
+            final_results = Util.resubmit_failures(records, results, send_records, 200, retry_wait=1)
+
+        # each retry halves the batch size and doubles the wait
+        self.assertEqual(calls, [(['b', 'd'], 100), (['b'], 50)])
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+        self.assertEqual([result.get('id') for result in final_results], ['a', 'b', None, 'd'])
+        self.assertEqual(Util.get_error_codes(final_results[2]), {'REQUIRED_FIELD_MISSING'})
+
+    def test_retries_are_limited(self):
+        send_records = mock.Mock(side_effect=lambda retry_records, batch_size:
+                                 [self.get_failure('UNABLE_TO_LOCK_ROW') for record in retry_records])
+
+        results = Util.resubmit_failures(['a'], [self.get_failure('UNABLE_TO_LOCK_ROW')], send_records, 4,
+                                         max_retries=3, retry_wait=0, min_batch_size=2)
+
+        self.assertEqual([call.args[1] for call in send_records.call_args_list], [2, 2, 2])
+        self.assertTrue(Util.is_transient_failure(results[0]))
+
+    def test_collection_operation_resends_locked_records(self):
+        attempts = []
+
+        def post_http_response(url, data, headers):
+            records = json.loads(data)['records']
+            attempts.append([record['Name'] for record in records])
+            results = []
+
+            for record in records:
+                if record['Name'] == 'locked' and len(attempts) == 1:
+                    results.append(self.get_failure('UNABLE_TO_LOCK_ROW'))
+                else:
+                    results.append({'id': '001' + record['Name'], 'success': True, 'errors': []})
+
+            return get_response(results)
+
+        records = [{'attributes': {'type': 'Account'}, 'Name': name} for name in ['first', 'locked', 'last']]
+
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=post_http_response):
+            results = Standard.perform_collection_operation('insert', records, 'token', INSTANCE_URL, max_workers=1,
+                                                            max_retries=2, retry_wait=0)
+
+        self.assertEqual(attempts, [['first', 'locked', 'last'], ['locked']])
+        self.assertEqual([result['id'] for result in results], ['001first', '001locked', '001last'])
+
+
+class TestSubmitBulkOperation(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [{'Id': '001{}'.format(i), 'Name': 'Account {}'.format(i)} for i in range(10)]
+        self.lock = threading.Lock()
+        self.uploading = 0
+        self.max_uploading = 0
+        self.uploaded = []
+        self.job_states = []
+        self.failing_record = None
+
+    def post_http_response(self, url, data, headers):
+        if url.endswith('/job/'):
+            return get_response({'id': '750A', 'state': 'Open'})
+
+        if url.endswith('/750A'):
+            self.job_states.append(json.loads(data)['state'])
+            return get_response({'id': '750A', 'state': self.job_states[-1]})
+
+        batch_records = json.loads(data)
+
+        with self.lock:
+            self.uploading += 1
+            self.max_uploading = max(self.max_uploading, self.uploading)
+
+        time.sleep(0.02)
+
+        with self.lock:
+            self.uploading -= 1
+
+        if any(record['Id'] == self.failing_record for record in batch_records):
+            raise requests.exceptions.HTTPError('400 Client Error: InvalidBatch')
+
+        with self.lock:
+            self.uploaded.append(batch_records[0]['Id'])
+
+        return get_response({'id': '751' + batch_records[0]['Id'], 'state': 'Queued'})
+
+    def submit(self, **kwargs):
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=self.post_http_response):
+            return Bulk.submit_bulk_operation('Account', self.records, 2, 'update', None, 'token', INSTANCE_URL,
+                                              poller=mock.Mock(), **kwargs)
+
+    def test_batches_upload_concurrently(self):
+        bulk_job = self.submit(upload_workers=3)
+
+        self.assertGreater(self.max_uploading, 1)
+        self.assertEqual(bulk_job.batch_ids, ['751' + record['Id'] for record in self.records[::2]])
+        self.assertEqual(self.job_states, ['Closed'])
+
+    def test_failed_upload_aborts_the_job(self):
+        self.failing_record = '0012'
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.submit(upload_workers=1)
+
+        self.assertEqual(self.uploaded, ['0010'])
+        self.assertEqual(self.job_states, ['Aborted'])
+
+    def test_failed_upload_stops_concurrent_uploads(self):
+        self.failing_record = '0010'
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.submit(upload_workers=2)
+
+        # only the batch that was already uploading next to the failed one gets through
+        self.assertLessEqual(len(self.uploaded), 1)
+        self.assertEqual(self.job_states, ['Aborted'])
+
+    def test_failed_checkpointed_upload_leaves_the_job_open(self):
+        self.failing_record = '0014'
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_path = os.path.join(directory, 'job.journal')
+
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.submit(checkpoint_path=checkpoint_path)
+
+            checkpoint = BulkCheckpoint(checkpoint_path)
+
+        self.assertEqual(self.uploaded, ['0010', '0012'])
+        self.assertEqual(self.job_states, [])
+        self.assertEqual(checkpoint.get_uploaded_count(), 4)
+
+
+class TestBatchBodies(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [{'attributes': {'type': 'Contact'}, 'LastName': 'Smith, Jr.', 'HasOptedOutOfEmail': True,
+                         'Account': {'External_Id__c': 'A1'}},
+                        {'LastName': 'Jones', 'Email': None, 'HasOptedOutOfEmail': False}]
+
+    def test_csv_rows(self):
+        rows = list(Util.iter_csv_rows(self.records))
+
+        self.assertEqual(rows, ['LastName,HasOptedOutOfEmail,Account.External_Id__c,Email\n',
+                                '"Smith, Jr.",true,A1,\n',
+                                'Jones,false,,#N/A\n'])
+        self.assertEqual(Util.get_csv_body(self.records), ''.join(rows))
+
+    def test_csv_rows_with_fields_stream_the_records(self):
+        records = iter(self.records)
+        rows = Util.iter_csv_rows(records, ['LastName', 'Email'])
+
+        self.assertEqual(next(rows), 'LastName,Email\n')
+        self.assertEqual(next(rows), '"Smith, Jr.",\n')
+
+        # the second record hasn't been read yet
+        self.assertEqual(next(records)['LastName'], 'Jones')
+
+    def test_csv_values_round_trip(self):
+        records = [{'Description': 'line one\nline "two"', 'Name': 'Acme'}]
+        body = Util.get_bulk_batch_body(records, 'CSV')
+
+        self.assertEqual(list(csv.DictReader(io.StringIO(body))), records)
+
+    def test_json_body(self):
+        self.assertEqual(json.loads(Util.get_bulk_batch_body(self.records, 'JSON')), self.records)
+
+    def test_zip_bodies(self):
+        for content_type, file_name in [('ZIP_CSV', 'request.txt'), ('ZIP_JSON', 'request.json')]:
+            body = Util.get_bulk_batch_body(self.records, content_type)
+
+            with zipfile.ZipFile(io.BytesIO(body)) as zip_file:
+                self.assertEqual(zip_file.namelist(), [file_name])
+                request_text = zip_file.read(file_name).decode('utf-8')
+
+            self.assertEqual(request_text, Util.get_bulk_batch_body(self.records, content_type[4:]))
+
+    def test_unknown_content_type(self):
+        with self.assertRaises(ValueError):
+            Util.get_bulk_batch_body(self.records, 'XML')
+
+    def test_batches_are_sent_with_the_content_type(self):
+        batch_requests = []
+
+        def post_http_response(url, data, headers):
+            if url.endswith('/batch'):
+                batch_requests.append((headers['Content-Type'], data))
+                return get_response({'id': '751A', 'state': 'Queued'})
+
+            return get_response({'id': '750A', 'state': 'Open'})
+
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=post_http_response):
+            Bulk.submit_bulk_operation('Contact', self.records, 10, 'insert', None, 'token', INSTANCE_URL,
+                                       content_type='ZIP_CSV', poller=mock.Mock())
+
+        self.assertEqual(len(batch_requests), 1)
+        self.assertEqual(batch_requests[0][0], 'zip/csv')
+
+        with zipfile.ZipFile(io.BytesIO(batch_requests[0][1])) as zip_file:
+            self.assertEqual(zip_file.read('request.txt').decode('utf-8'), Util.get_csv_body(self.records))
+
+
+class TestPkChunkedQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.job_headers = None
+        self.batch_list_polls = 0
+        self.downloading = 0
+        self.max_downloading = 0
+        self.result_sets = {'751B': ['752a'], '751C': ['752b', '752c']}
+        self.rows = {'752a': [{'Id': '001A'}, {'Id': '001B'}], '752b': [{'Id': '001C'}], '752c': [{'Id': '001D'}]}
+
+    def post_http_response(self, url, data, headers):
+        if url.endswith('/job/'):
+            self.job_headers = dict(headers)
+            return get_response({'id': '750A', 'state': 'Open'})
+
+        if url.endswith('/batch'):
+            return get_response({'id': '751A', 'state': 'Queued'})
+
+        return get_response({'id': '750A', 'state': 'Closed'})
+
+    def get_http_response(self, url, headers):
+        if url.endswith('/750A/batch'):
+            self.batch_list_polls += 1
+            second_state = 'Completed' if self.batch_list_polls > 1 else 'InProgress'
+
+            return get_response({'batchInfo': [{'id': '751A', 'state': 'NotProcessed'},
+                                               {'id': '751B', 'state': 'Completed'},
+                                               {'id': '751C', 'state': second_state}]})
+
+        batch_id = url.split('/batch/')[1].split('/')[0]
+
+        return get_response(self.result_sets[batch_id])
+
+    def download_http_response(self, url, headers, file_object):
+        with self.lock:
+            self.downloading += 1
+            self.max_downloading = max(self.max_downloading, self.downloading)
+
+        time.sleep(0.02)
+        file_object.write(json.dumps(self.rows[url.rsplit('/', 1)[1]]).encode('utf-8'))
+
+        with self.lock:
+            self.downloading -= 1
+
+        return get_response(None)
+
+    def test_pk_chunking_header(self):
+        self.assertEqual(Util.get_pk_chunking_header(), 'true')
+        self.assertEqual(Util.get_pk_chunking_header(50000, 'Account', '001000000000001'),
+                         'chunkSize=50000; parent=Account; startRow=001000000000001')
+
+    def test_chunk_results_are_downloaded_in_parallel(self):
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=self.post_http_response), \
+                mock.patch.object(webservice.Tools, 'get_http_response', side_effect=self.get_http_response), \
+                mock.patch.object(webservice.Tools, 'download_http_response',
+                                  side_effect=self.download_http_response):
+            rows = list(Bulk.iter_query_rows('Account', 'SELECT Id FROM Account', False, 'token', INSTANCE_URL,
+                                             verbose=False, pk_chunking=True, chunk_size=2, polling_wait=0,
+                                             max_workers=3))
+
+        self.assertEqual(self.job_headers['Sforce-Enable-PKChunking'], 'chunkSize=2')
+        self.assertEqual(self.batch_list_polls, 2)
+
+        # the NotProcessed batch of the original query isn't downloaded
+        self.assertEqual(sorted(row['Id'] for row in rows), ['001A', '001B', '001C', '001D'])
+        self.assertGreater(self.max_downloading, 1)
+
+    def test_failed_chunk_raises(self):
+        def get_http_response(url, headers):
+            return get_response({'batchInfo': [{'id': '751B', 'state': 'Failed', 'stateMessage': 'timed out'}]})
+
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=self.post_http_response), \
+                mock.patch.object(webservice.Tools, 'get_http_response', side_effect=get_http_response):
+            with self.assertRaisesRegex(RuntimeError, 'timed out'):
+                list(Bulk.iter_query_rows('Account', 'SELECT Id FROM Account', False, 'token', INSTANCE_URL,
+                                          verbose=False, pk_chunking=True, polling_wait=0))
+
+
+class TestStreamingResults(unittest.TestCase):
+
+    def test_json_array_across_chunks(self):
+        values = [1234, -0.5, 1.5e-07, 'text with ], [ and , inside',
+                  {'Id': '001A', 'Tags': ['a', 'b'], 'Parent': None}, [], True, 'caf\u00e9 \\"quoted\\"']
+        text = ' [ ' + ' ,\n'.join(json.dumps(value) for value in values) + ' ]\n'
+
+        for chunk_size in range(1, 12):
+            self.assertEqual(list(Util.iter_json_array(io.StringIO(text), chunk_size)), values)
+
+    def test_empty_json_array(self):
+        self.assertEqual(list(Util.iter_json_array(io.StringIO('[]'))), [])
+        self.assertEqual(list(Util.iter_json_array(io.StringIO(' [\n] '), 1)), [])
+
+    def test_truncated_json_array(self):
+        with self.assertRaises(ValueError):
+            list(Util.iter_json_array(io.StringIO('[1, {"Id": "001'), 4))
+
+    def test_concurrent_results_come_back_as_they_finish(self):
+        waits = {'slow': 0.1, 'fast': 0}
+        results = list(Util.iter_concurrent(lambda item: time.sleep(waits[item]) or item.upper(), ['slow', 'fast'], 2))
+
+        self.assertEqual(results, [('fast', 'FAST'), ('slow', 'SLOW')])
+
+    def test_slow_items_dont_hold_back_results(self):
+        first_result_taken = threading.Event()
+
+        def items():
+            yield 'first'
+
+            if not first_result_taken.wait(5):
+                raise RuntimeError('the first result was held back')
+
+            yield 'second'
+
+        results = Util.iter_concurrent(lambda item: item, items(), 2)
+
+        self.assertEqual(next(results), ('first', 'first'))
+        first_result_taken.set()
+        self.assertEqual(list(results), [('second', 'second')])
+
+    def test_items_are_read_ahead_of_the_results_by_at_most_max_workers(self):
+        read_items = []
+
+        def items():
+            for item in range(20):
+                read_items.append(item)
+                yield item
+
+        results = Util.iter_concurrent(lambda item: item, items(), 2)
+        next(results)
+        time.sleep(0.05)
+
+        self.assertLessEqual(len(read_items), 4)
+        self.assertEqual(len(list(results)), 19)
+
+    def test_concurrent_errors_are_raised(self):
+        def check(item):
+            if item == 3:
+                raise ValueError('bad item')
+
+            return item
+
+        with self.assertRaisesRegex(ValueError, 'bad item'):
+            list(Util.iter_concurrent(check, range(6), 2))
+
+        def items():
+            yield 1
+            raise KeyError('unreadable')
+
+        with self.assertRaises(KeyError):
+            list(Util.iter_concurrent(lambda item: item, items(), 2))
+
+    def test_csv_query_results_are_streamed_from_files(self):
+        result_sets = {'752a': 'Id,Name\n001A,"Acme, Inc."\n', '752b': 'Id,Name\n001B,"Line\nBreak"\n'}
+
+        def download_http_response(url, headers, file_object):
+            file_object.write(result_sets[url.rsplit('/', 1)[1]].encode('utf-8'))
+            return mock.Mock(headers={'Content-Type': 'text/csv'})
+
+        with mock.patch.object(webservice.Tools, 'download_http_response', side_effect=download_http_response):
+            rows = list(Bulk.iter_query_results('750A', [('751A', '752a'), ('751A', '752b')], 'token',
+                                                INSTANCE_URL, 2))
+
+        self.assertEqual(sorted(rows, key=lambda row: row['Id']), [{'Id': '001A', 'Name': 'Acme, Inc.'},
+                                                                   {'Id': '001B', 'Name': 'Line\nBreak'}])
+
+
+class TestBatchPolling(unittest.TestCase):
+
+    def setUp(self):
+        self.poller = JobPoller(min_wait=0.01, max_wait=0.05)
+        self.polls = []
+
+    def get_batch_info_list(self, job_id, access_token, instance_url):
+        self.polls.append(job_id)
+        states = ['Completed', 'InProgress', 'Queued'] if len(self.polls) == 1 else ['Completed'] * 3
+
+        return [{'id': '751' + str(index), 'state': state} for index, state in enumerate(states)]
+
+    def test_completed_batches_are_polled_by_the_poller(self):
+        with mock.patch.object(Bulk, 'get_batch_info_list', side_effect=self.get_batch_info_list), \
+                mock.patch.object(pysalesforceutils.time, 'sleep') as sleep:
+            batch_ids = [batch_info['id'] for batch_info in Bulk.iter_completed_batches(
+                '750A', None, False, 'token', INSTANCE_URL, poller=self.poller)]
+
+        self.assertEqual(batch_ids, ['7510', '7511', '7512'])
+        self.assertEqual(len(self.polls), 2)
+        sleep.assert_not_called()
+
+    def test_poller_deadlines_apply(self):
+        poller = JobPoller(min_wait=0.01, max_wait=0.05, max_polls=2)
+
+        with mock.patch.object(Bulk, 'get_batch_info_list',
+                               return_value=[{'id': '7510', 'state': 'InProgress'}]):
+            with self.assertRaises(TimeoutError):
+                list(Bulk.iter_completed_batches('750A', None, False, 'token', INSTANCE_URL, poller=poller))
+
+    def test_failed_batch_raises(self):
+        batch_info_list = [{'id': '7510', 'state': 'Failed', 'stateMessage': 'InvalidBatch'}]
+
+        with mock.patch.object(Bulk, 'get_batch_info_list', return_value=batch_info_list):
+            with self.assertRaisesRegex(RuntimeError, 'InvalidBatch'):
+                list(Bulk.iter_completed_batches('750A', None, False, 'token', INSTANCE_URL, poller=self.poller))
+
+            batch_infos = list(Bulk.iter_completed_batches('750A', None, False, 'token', INSTANCE_URL,
+                                                           include_failed=True, poller=self.poller))
+
+        self.assertEqual(batch_infos, batch_info_list)
+
+    def test_closing_stops_the_polling(self):
+        batch_info_list = [{'id': '7510', 'state': 'Completed'}, {'id': '7511', 'state': 'InProgress'}]
+
+        def get_batch_info_list(job_id, access_token, instance_url):
+            self.polls.append(job_id)
+            return batch_info_list
+
+        with mock.patch.object(Bulk, 'get_batch_info_list', side_effect=get_batch_info_list):
+            batches = Bulk.iter_completed_batches('750A', 0.01, False, 'token', INSTANCE_URL, poller=self.poller)
+            self.assertEqual(next(batches)['id'], '7510')
+            batches.close()
+            time.sleep(0.05)
+            poll_count = len(self.polls)
+            time.sleep(0.1)
+
+        self.assertEqual(len(self.polls), poll_count)
+
+    def test_failed_bulk2_job_waits_for_stable_progress(self):
+        job_infos = [{'state': 'Failed', 'numberRecordsProcessed': processed} for processed in [10, 20, 20, 20]]
+        clock = [1000]
+
+        with mock.patch.object(Bulk2, 'get_job_info', side_effect=job_infos), \
+                mock.patch.object(pysalesforceutils.time, 'time', side_effect=lambda: clock[0]):
+            status_check = Bulk2.get_status_check('750A', 'token', INSTANCE_URL, min_stable_seconds=10)
+            is_done_list = []
+
+            # the unchanged polls only count once enough time has passed since the last change
+            for seconds in [0, 1, 2, 12]:
+                clock[0] += seconds
+                is_done_list.append(status_check()[0])
+
+        self.assertEqual(is_done_list, [False, False, False, True])
+
+    def test_failed_bulk2_job_with_every_record_processed_is_done(self):
+        job_info = {'state': 'Failed', 'numberRecordsProcessed': 50}
+
+        with mock.patch.object(Bulk2, 'get_job_info', return_value=job_info):
+            status_check = Bulk2.get_status_check('750A', 'token', INSTANCE_URL, record_count=50)
+
+            self.assertEqual(status_check(), (True, job_info, 50, 50))
+
+
+class TestAttachmentBatches(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.attachments = []
+
+        for i, content in enumerate([b'first file', b'\x00\x01binary', b'third']):
+            file_path = os.path.join(self.directory.name, str(i), 'notes.txt')
+            os.makedirs(os.path.dirname(file_path))
+
+            with open(file_path, 'wb') as attachment_file:
+                attachment_file.write(content)
+
+            self.attachments.append(({'Name': 'notes.txt', 'ParentId': '001' + str(i)}, file_path))
+
+        self.batches = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def post_http_response(self, url, data, headers):
+        if url.endswith('/batch'):
+            self.batches.append((headers['Content-Type'], data))
+            return get_response({'id': '751' + str(len(self.batches)), 'state': 'Queued'})
+
+        return get_response({'id': '750A', 'state': 'Open'})
+
+    def get_http_response(self, url, headers):
+        batch_count = len(self.batches)
+
+        if url.endswith('/750A'):
+            return get_response({'id': '750A', 'state': 'Closed', 'numberBatchesCompleted': batch_count,
+                                 'numberBatchesFailed': 0, 'numberBatchesTotal': batch_count})
+
+        if url.endswith('/batch'):
+            return get_response({'batchInfo': [{'id': '751' + str(i + 1), 'state': 'Completed'}
+                                               for i in range(batch_count)]})
+
+        batch_number = int(url.split('/batch/751')[1].split('/')[0])
+
+        with zipfile.ZipFile(io.BytesIO(self.batches[batch_number - 1][1])) as zip_file:
+            batch_records = json.loads(zip_file.read('request.json'))
+
+        return get_response([{'id': '00P' + record['ParentId'], 'success': True, 'created': True, 'errors': []}
+                             for record in batch_records])
+
+    def test_zip_json_body(self):
+        body = Util.get_bulk_zip_body(self.attachments[:2])
+
+        with zipfile.ZipFile(io.BytesIO(body)) as zip_file:
+            batch_records = json.loads(zip_file.read('request.json'))
+
+            # the files have the same name, so the index keeps them apart
+            self.assertEqual([record['Body'] for record in batch_records], ['#0_notes.txt', '#1_notes.txt'])
+            self.assertEqual(zip_file.read('0_notes.txt'), b'first file')
+            self.assertEqual(zip_file.read('1_notes.txt'), b'\x00\x01binary')
+
+        # the records that were passed in are left as they were
+        self.assertNotIn('Body', self.attachments[0][0])
+
+    def test_zip_csv_body(self):
+        body = Util.get_bulk_zip_body(self.attachments[:1], 'ZIP_CSV', 'VersionData')
+
+        with zipfile.ZipFile(io.BytesIO(body)) as zip_file:
+            self.assertEqual(zip_file.read('request.txt').decode('utf-8'),
+                             'Name,ParentId,VersionData\nnotes.txt,0010,#0_notes.txt\n')
+
+        with self.assertRaises(ValueError):
+            Util.get_bulk_zip_body(self.attachments, 'JSON')
+
+    def test_attachment_size_covers_the_zip_entry(self):
+        record, file_path = self.attachments[0]
+
+        self.assertGreater(Util.get_attachment_size(self.attachments[0]),
+                           os.path.getsize(file_path) + Util.get_record_size(record))
+
+    def test_files_are_packed_into_zip_batches(self):
+        with mock.patch.object(webservice.Tools, 'post_http_response', side_effect=self.post_http_response), \
+                mock.patch.object(webservice.Tools, 'get_http_response', side_effect=self.get_http_response):
+            results = Bulk.perform_attachment_operation('Attachment', self.attachments, 'insert', 0.01, 'token',
+                                                        INSTANCE_URL, max_files=2, verbose=False)
+
+        self.assertEqual([content_type for content_type, body in self.batches], ['zip/json', 'zip/json'])
+
+        file_counts = []
+
+        for content_type, body in self.batches:
+            with zipfile.ZipFile(io.BytesIO(body)) as zip_file:
+                file_counts.append(len(zip_file.namelist()) - 1)
+
+        self.assertEqual(file_counts, [2, 1])
+        self.assertEqual(results, [(file_path, {'id': '00P' + record['ParentId'], 'success': True,
+                                                'created': True, 'errors': []})
+                                   for record, file_path in self.attachments])
+
+    def test_blob_field_is_required_for_unknown_objects(self):
+        with self.assertRaises(ValueError):
+            Bulk.perform_attachment_operation('Custom_File__c', self.attachments, 'insert', 0.01, 'token',
+                                              INSTANCE_URL)
+
+
+class TestSubmitIngestJob(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [{'LastName': 'Smith', 'Email': 'smith@example.com'},
+                        {'LastName': 'Jones', 'Email': None}]
+        self.uploads = []
+
+    def put_http_response(self, url, data_body, header_details):
+        # the body is read while it's sent, like requests does
+        self.uploads.append((url, header_details['Content-Type'], hasattr(data_body, 'read'), data_body.read()))
+        return mock.Mock(status_code=201)
+
+    def submit(self, records, **kwargs):
+        with mock.patch.object(Bulk2, 'create_job', return_value={'id': '750A'}) as create_job, \
+                mock.patch.object(Bulk2, 'change_job_state') as change_job_state, \
+                mock.patch.object(webservice.Tools, 'put_http_response', side_effect=self.put_http_response):
+            try:
+                return Bulk2.submit_ingest_job('Contact', 'insert', records, None, 'token', INSTANCE_URL,
+                                               poller=mock.Mock(), **kwargs)
+            finally:
+                self.create_job = create_job
+                self.change_job_state = change_job_state
+
+    def test_csv_is_streamed_from_a_file(self):
+        bulk_job = self.submit(self.records)
+
+        self.assertEqual(self.uploads, [(INSTANCE_URL + '/services/data/v' + pysalesforceutils.API_VERSION +
+                                         '/jobs/ingest/750A/batches', 'text/csv', True,
+                                         b'LastName,Email\nSmith,smith@example.com\nJones,#N/A\n')])
+        self.assertEqual(bulk_job.record_count, 2)
+        self.change_job_state.assert_called_once_with('UploadComplete', '750A', 'token', INSTANCE_URL)
+
+    def test_records_generator_with_fields(self):
+        bulk_job = self.submit((record for record in self.records), fields=['Email'])
+
+        self.assertEqual(self.uploads[0][3], b'Email\nsmith@example.com\n#N/A\n')
+        self.assertEqual(bulk_job.record_count, 2)
+
+    def test_too_many_bytes(self):
+        with self.assertRaisesRegex(ValueError, '40 bytes'):
+            self.submit(self.records, max_job_bytes=40)
+
+        # nothing is created or uploaded for a load that doesn't fit in a job
+        self.create_job.assert_not_called()
+        self.assertEqual(self.uploads, [])
+
+    def test_too_many_records(self):
+        with self.assertRaisesRegex(ValueError, '1 records'):
+            self.submit(self.records, max_job_records=1)
+
+        self.create_job.assert_not_called()
+
+    def test_records_at_the_limits_fit(self):
+        body_size = len(b'LastName,Email\nSmith,smith@example.com\nJones,#N/A\n')
+        bulk_job = self.submit(self.records, max_job_bytes=body_size, max_job_records=2)
+
+        self.assertEqual(bulk_job.record_count, 2)
+
+
+class TestBulk2Query(unittest.TestCase):
+
+    def setUp(self):
+        self.pages = {None: ('Id,Name\n001A,Acme\n001B,"Line\nBreak"\n', 'page2'),
+                      'page2': ('Id,Name\n001C,Globex\n', 'null')}
+        self.urls = []
+
+    def download_http_response(self, url, header_details, file_object):
+        self.urls.append(url)
+        query_params = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        body, next_locator = self.pages[query_params.get('locator', [None])[0]]
+        file_object.write(body.encode('utf-8'))
+
+        return mock.Mock(headers={'Sforce-Locator': next_locator, 'Sforce-NumberOfRecords': str(body.count('\n0'))})
+
+    def query(self, sink, **kwargs):
+        with mock.patch.object(Bulk2, 'create_query_job', return_value={'id': '750Q'}), \
+                mock.patch.object(Bulk2, 'wait_for_query_job', return_value={'id': '750Q', 'state': 'JobComplete'}), \
+                mock.patch.object(webservice.Tools, 'download_http_response',
+                                  side_effect=self.download_http_response):
+            return Bulk2.query('SELECT Id, Name FROM Account', sink, 'token', INSTANCE_URL, **kwargs)
+
+    def test_pages_are_followed_into_a_csv_file(self):
+        export_file = io.BytesIO()
+        job_info = self.query(CsvFileSink(export_file), max_records=2)
+
+        self.assertEqual(export_file.getvalue(), b'Id,Name\n001A,Acme\n001B,"Line\nBreak"\n001C,Globex\n')
+        self.assertEqual(job_info['numberRecordsDownloaded'], 3)
+        self.assertEqual([urllib.parse.urlparse(url).query for url in self.urls],
+                         ['maxRecords=2', 'locator=page2&maxRecords=2'])
+
+    def test_rows_are_parsed_page_by_page(self):
+        rows = []
+        sink = RowSink(rows.append)
+        self.query(sink)
+
+        self.assertEqual([row['Name'] for row in rows], ['Acme', 'Line\nBreak', 'Globex'])
+        self.assertEqual(sink.row_count, 3)
+
+    def test_failed_download_deletes_the_job(self):
+        with mock.patch.object(Bulk2, 'get_query_job_info', return_value={'state': 'JobComplete'}), \
+                mock.patch.object(Bulk2, 'delete_query_job') as delete_query_job, \
+                mock.patch.object(Bulk2, 'download_query_results', side_effect=OSError('disk full')):
+            with self.assertRaisesRegex(OSError, 'disk full'):
+                self.query(RowSink(lambda row: None))
+
+        delete_query_job.assert_called_once_with('750Q', 'token', INSTANCE_URL)
+
+    def test_running_job_is_aborted(self):
+        with mock.patch.object(Bulk2, 'create_query_job', return_value={'id': '750Q'}), \
+                mock.patch.object(Bulk2, 'get_query_job_info', return_value={'state': 'InProgress'}), \
+                mock.patch.object(Bulk2, 'abort_query_job') as abort_query_job, \
+                mock.patch.object(Bulk2, 'wait_for_query_job', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                Bulk2.query('SELECT Id FROM Account', RowSink(lambda row: None), 'token', INSTANCE_URL)
+
+        abort_query_job.assert_called_once_with('750Q', 'token', INSTANCE_URL)
+
+    def test_failed_cleanup_keeps_the_original_error(self):
+        with mock.patch.object(Bulk2, 'create_query_job', return_value={'id': '750Q'}), \
+                mock.patch.object(Bulk2, 'wait_for_query_job', side_effect=TimeoutError('still running')), \
+                mock.patch.object(Bulk2, 'get_query_job_info',
+                                  side_effect=requests.exceptions.ConnectionError('offline')):
+            with self.assertRaisesRegex(TimeoutError, 'still running'):
+                Bulk2.query('SELECT Id FROM Account', RowSink(lambda row: None), 'token', INSTANCE_URL)
+
+
+class TestShardedIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.job_count = 0
+        self.uploads = {}
+        self.uploading = 0
+        self.max_uploading = 0
+        self.records = [{'LastName': 'Contact {}'.format(i), 'AccountId': '001{}'.format(i % 6)}
+                        for i in range(30)]
+        self.records[0]['Email'] = 'first@example.com'
+
+    def create_job(self, object_name, operation, external_id_field_name, column_delimiter, content_type,
+                   line_ending, access_token, instance_url):
+        with self.lock:
+            self.job_count += 1
+            return {'id': '750' + str(self.job_count)}
+
+    def put_http_response(self, url, data_body, header_details):
+        with self.lock:
+            self.uploading += 1
+            self.max_uploading = max(self.max_uploading, self.uploading)
+
+        body = b''.join(data_body).decode('utf-8')
+        time.sleep(0.02)
+
+        with self.lock:
+            self.uploading -= 1
+            self.uploads[url.split('/')[-2]] = list(csv.DictReader(io.StringIO(body)))
+
+        return mock.Mock(status_code=201)
+
+    def get_job_info(self, job_id, access_token, instance_url):
+        with self.lock:
+            processed = len(self.uploads[job_id])
+
+        return {'id': job_id, 'state': 'JobComplete', 'numberRecordsProcessed': processed,
+                'numberRecordsFailed': 0}
+
+    def ingest_sharded(self, shard_count, **kwargs):
+        with mock.patch.object(Bulk2, 'create_job', side_effect=self.create_job), \
+                mock.patch.object(Bulk2, 'change_job_state'), \
+                mock.patch.object(Bulk2, 'get_job_info', side_effect=self.get_job_info), \
+                mock.patch.object(webservice.Tools, 'put_http_response', side_effect=self.put_http_response):
+            return Bulk2.ingest_sharded('Contact', 'insert', iter(self.records), 'AccountId', shard_count, 'token',
+                                        INSTANCE_URL, poller=JobPoller(min_wait=0.01, max_wait=0.05), **kwargs)
+
+    def test_parents_stay_in_one_shard(self):
+        summary = self.ingest_sharded(4, max_concurrent_jobs=2)
+
+        self.assertEqual(summary['numberRecordsProcessed'], 30)
+        self.assertEqual(len(summary['jobs']), len(self.uploads))
+        self.assertLessEqual(len(summary['shards']), 4)
+
+        job_rows = list(self.uploads.values())
+        self.assertEqual(sorted(row['LastName'] for rows in job_rows for row in rows),
+                         sorted(record['LastName'] for record in self.records))
+
+        for account_id in set(record['AccountId'] for record in self.records):
+            self.assertEqual(len([rows for rows in job_rows if any(row['AccountId'] == account_id
+                                                                   for row in rows)]), 1)
+
+    def test_every_shard_has_the_same_columns(self):
+        self.ingest_sharded(3)
+
+        for rows in self.uploads.values():
+            self.assertEqual(list(rows[0]), ['LastName', 'AccountId', 'Email'])
+
+    def test_concurrent_jobs_are_limited(self):
+        self.ingest_sharded(6, max_concurrent_jobs=2)
+
+        self.assertGreater(len(self.uploads), 2)
+        self.assertLessEqual(self.max_uploading, 2)
+
+    def test_empty_shards_are_left_out(self):
+        self.records = [record for record in self.records if record['AccountId'] == '0010']
+        summary = self.ingest_sharded(8)
+
+        self.assertEqual(len(summary['shards']), 1)
+        self.assertEqual(summary['numberRecordsProcessed'], 5)
+
+    def test_shard_count_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            Bulk2.ingest_sharded('Contact', 'insert', self.records, 'AccountId', 0, 'token', INSTANCE_URL)
+
+
+class TestBulk2Results(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [{'External_Id__c': 'C1', 'LastName': 'Smith', 'Email': None},
+                        {'External_Id__c': 'C2', 'LastName': 'Jones', 'Email': 'jones@example.com'},
+                        {'External_Id__c': 'C3', 'LastName': 'Smith', 'Email': None}]
+        self.result_files = {
+            'successfulResults': 'sf__Id,sf__Created,External_Id__c,LastName,Email\n'
+                                 '003B,true,C2,Jones,jones@example.com\n'
+                                 '003A,false,C1,Smith,#N/A\n',
+            'failedResults': 'sf__Id,sf__Error,External_Id__c,LastName,Email\n'
+                             ',"REQUIRED_FIELD_MISSING:Required fields are missing: [Account]:AccountId --",C3,'
+                             'Smith,#N/A\n',
+            'unprocessedrecords': 'External_Id__c,LastName,Email\n'
+        }
+
+    def iter_results(self, result_type):
+        return Util.iter_bulk2_results(io.BytesIO(self.result_files[result_type].encode('utf-8')), result_type)
+
+    def test_successful_result(self):
+        result = Util.get_bulk2_result({'sf__Id': '003A', 'sf__Created': 'true', 'LastName': 'Smith'},
+                                       'successfulResults')
+
+        self.assertEqual(result, {'id': '003A', 'success': True, 'created': True, 'processed': True, 'errors': [],
+                                  'record': {'LastName': 'Smith'}})
+
+    def test_failed_result(self):
+        result = list(self.iter_results('failedResults'))[0]
+
+        self.assertEqual(result['id'], None)
+        self.assertFalse(result['success'])
+        self.assertTrue(result['processed'])
+        self.assertEqual(result['errors'], [{'statusCode': 'REQUIRED_FIELD_MISSING',
+                                             'message': 'Required fields are missing: [Account]',
+                                             'fields': ['AccountId']}])
+        self.assertEqual(result['record'], {'External_Id__c': 'C3', 'LastName': 'Smith', 'Email': '#N/A'})
+
+    def test_unprocessed_result(self):
+        result = Util.get_bulk2_result({'LastName': 'Smith'}, 'unprocessedrecords')
+
+        self.assertFalse(result['success'])
+        self.assertFalse(result['processed'])
+        self.assertEqual(result['errors'], [])
+
+    def test_error_without_fields(self):
+        self.assertEqual(Util.parse_bulk_error('UNABLE_TO_LOCK_ROW:unable to obtain exclusive access --'),
+                         {'statusCode': 'UNABLE_TO_LOCK_ROW', 'message': 'unable to obtain exclusive access',
+                          'fields': []})
+        self.assertEqual(Util.parse_bulk_error('Something went wrong'),
+                         {'statusCode': None, 'message': 'Something went wrong', 'fields': []})
+
+    def test_results_file_is_left_open(self):
+        result_file = io.BytesIO(self.result_files['successfulResults'].encode('utf-8'))
+        results = list(Util.iter_bulk2_results(result_file, 'successfulResults'))
+
+        self.assertEqual([result['id'] for result in results], ['003B', '003A'])
+        self.assertFalse(result_file.closed)
+
+    def test_join_on_key_field(self):
+        results = [result for result_type in self.result_files for result in self.iter_results(result_type)]
+        joined_results = Util.join_bulk2_results(self.records, results, 'External_Id__c')
+
+        self.assertEqual([result['id'] for result in joined_results[:2]], ['003A', '003B'])
+        self.assertFalse(joined_results[2]['success'])
+
+    def test_join_on_every_column(self):
+        records = self.records + [{'External_Id__c': 'C4', 'LastName': 'Brown', 'Email': None}]
+        results = [result for result_type in self.result_files for result in self.iter_results(result_type)]
+        joined_results = Util.join_bulk2_results(records, results)
+
+        self.assertEqual([result and result['success'] for result in joined_results], [True, True, False, None])
+
+    def test_identical_records_get_results_in_order(self):
+        records = [{'LastName': 'Smith'}, {'LastName': 'Smith'}]
+        results = [Util.get_bulk2_result({'sf__Id': '003' + letter, 'LastName': 'Smith'}, 'successfulResults')
+                   for letter in 'AB']
+
+        self.assertEqual([result['id'] for result in Util.join_bulk2_results(records, results)], ['003A', '003B'])
+
+    def test_join_on_unknown_key_field(self):
+        with self.assertRaises(ValueError):
+            Util.join_bulk2_results(self.records, [], 'Id')
+
+    def test_results_are_streamed_for_each_job(self):
+        urls = []
+
+        def download_http_response(url, header_details, file_object):
+            urls.append(url)
+            file_object.write(self.result_files['successfulResults'].encode('utf-8'))
+            return mock.Mock(headers={'Content-Type': 'text/csv'})
+
+        with mock.patch.object(webservice.Tools, 'download_http_response', side_effect=download_http_response):
+            results = Bulk2.iter_results(['750A', '750B'], 'successfulResults', 'token', INSTANCE_URL)
+
+            # nothing is downloaded until the first result is read
+            self.assertEqual(urls, [])
+            self.assertEqual([result['id'] for result in results], ['003B', '003A', '003B', '003A'])
+
+        self.assertEqual([url.split('/')[-3] for url in urls], ['750A', '750B'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ from urllib3.poolmanager import PoolManager
 
 class Tools:
     default_timeout = None
+    download_chunk_size = 1048576
 
     @staticmethod
     def http_request(**kwargs):
@@ -19,6 +20,9 @@ class Tools:
             header_details (dict): Object containing the headers for the request. 
                                   Defaults to None
             data_body (dict): The body to send for the POST. Defaults to None
+            file_object (file): If provided, the response body is streamed into
+                                this binary file instead of being read into
+                                the response. Defaults to None
 
         Returns:
             dict: Returns the response for the HTTP Request.
@@ -30,6 +34,7 @@ class Tools:
         files = None
         if 'files' in kwargs:
             files = kwargs.get('files', None)
+        file_object = kwargs.get('file_object', None)
 
         response = ""
 
@@ -38,13 +43,17 @@ class Tools:
             prepReq = req.prepare()
             with requests.Session() as session:
                 session.mount('https://', SslHttpAdapter())
-                response = session.send(prepReq, timeout=Tools.default_timeout)
+                response = session.send(prepReq, timeout=Tools.default_timeout, stream=file_object is not None)
                 response.raise_for_status()
+
+                if file_object is not None:
+                    for chunk in response.iter_content(chunk_size=Tools.download_chunk_size):
+                        file_object.write(chunk)
         except requests.exceptions.HTTPError as e:
             # e.response.json won't be visible if exception is just raised
             if e.response is not None:
                 new_error_str = '{} response: {}' .format(str(e), str(e.response.json()))
-                raise type(e)(new_error_str).with_traceback(sys.exc_info()[2])
+                raise type(e)(new_error_str, response=e.response).with_traceback(sys.exc_info()[2])
             raise
         return response
 
@@ -64,6 +73,26 @@ class Tools:
 
         return response
 
+    @staticmethod
+    def download_http_response(URL, header_details, file_object):
+        """
+        This streams the body of an HTTP GET request into a file, so a large
+        response is never held in memory
+
+        Args:
+            URL (str): The full URL to call
+            header_details (dict): Object containing the headers for the request
+            file_object (file): The binary file to write the response body to
+
+        Returns:
+            dict: Returns the result of the HTTP GET request. The body has
+                  already been written to file_object.
+        """
+        response = Tools.http_request(requestType='GET', URL=URL, header_details=header_details,
+                                      file_object=file_object)
+
+        return response
+
     @staticmethod
     def put_http_response(URL, data_body, header_details):
         """